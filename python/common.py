@@ -0,0 +1,162 @@
+"""
+Helpers shared by the GridIn scripts.
+
+This module is imported at start-up by every script: keep it lightweight. Heavy dependencies (ROOT, SAMADhi, the CRAB
+client, ...) are imported inside the functions using them, so that a script only pays for what it actually does.
+"""
+
+import contextlib
+import os
+import re
+import sys
+import threading
+import time
+
+# Directory of the caches of the scripts (dataset catalogue, file index, ...)
+CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'gridin')
+
+# Default ingrid storm package, needed by SAMADhi
+STORM_EGGS = [
+        '/nfs/soft/python/python-2.7.5-sl6_amd64_gcc44/lib/python2.7/site-packages/storm-0.20-py2.7-linux-x86_64.egg',
+        '/nfs/soft/python/python-2.7.5-sl6_amd64_gcc44/lib/python2.7/site-packages/MySQL_python-1.2.3-py2.7-linux-x86_64.egg',
+        ]
+
+
+def add_samadhi_path():
+    """
+    Make SAMADhi, installed with the CMSSW binaries, and its dependencies importable. Nothing is imported
+    """
+    for path in [os.path.join(os.environ['CMSSW_BASE'], 'bin', os.environ['SCRAM_ARCH'])] + STORM_EGGS:
+        if path not in sys.path:
+            sys.path.append(path)
+
+
+def load_file(filename):
+    """
+    Import a python file, like a crab configuration, from its path
+    """
+    directory, module_name = os.path.split(filename)
+    module_name = os.path.splitext(module_name)[0]
+    path = list(sys.path)
+    sys.path.insert(0, directory)
+    try:
+        module = __import__(module_name)
+    finally:
+        sys.path[:] = path # restore
+    return module
+
+
+def split_url(url):
+    """
+    Split an xrootd URL into ``(server, path)``
+    """
+    match = re.match(r'(root://[^/]+)/(/.*)', url)
+    if match is None:
+        raise ValueError('Not an xrootd URL: %r' % url)
+    return match.groups()
+
+
+def script_args_to_options(argv, flags, options):
+    """
+    Convert the ``key=value`` arguments given by crab to a job script (``JobType.scriptArgs``, crab does not accept
+    anything else) to command line options: ``stage_dir=/tmp`` becomes ``--stage-dir /tmp``, and ``stage=1`` the flag
+    ``--stage`` (``stage=0`` is dropped). Other arguments are kept, in order
+    :param argv: the arguments of the script
+    :param flags: names of the options without value
+    :param options: names of the options with a value
+    :return: the converted arguments
+    """
+    converted = []
+    for arg in argv:
+        key, _, value = arg.partition('=')
+        if key in flags:
+            if value not in ('', '0'):
+                converted.append('--' + key.replace('_', '-'))
+        elif key in options:
+            converted += ['--' + key.replace('_', '-'), value]
+        else:
+            converted.append(arg)
+    return converted
+
+
+def mark_started(started, index):
+    """
+    Record in ``started`` that the job ``index`` starts now, for ``wait_with_deadlines``. ``started`` may be None
+    """
+    if started is not None:
+        started[index] = (time.time(), os.getpid())
+
+
+def wait_with_deadlines(async_results, started, timeout, poll_interval=0.5):
+    """
+    Wait for the results of jobs submitted to a pool. Each job has ``timeout`` seconds from the moment it actually
+    starts, as recorded by the job itself with ``mark_started(started, index)``: jobs still queued never time out
+    :param async_results: the ``AsyncResult`` of each job
+    :param started: a dict, shared with the jobs, filled by ``mark_started``
+    :param timeout: time in seconds allowed to each job, or None to wait forever
+    :return: a tuple ``(results, timed_out)``, where ``timed_out`` maps the index of each job timed out to its
+             ``(start time, pid)``. The result of a job timed out is None
+    """
+    results = [None] * len(async_results)
+    timed_out = {}
+    pending = set(range(len(async_results)))
+    while pending:
+        async_results[min(pending)].wait(poll_interval)
+        now = time.time()
+        # One copy, instead of one call per job when ``started`` is a manager proxy
+        start_times = started.copy()
+        for index in sorted(pending):
+            if async_results[index].ready():
+                results[index] = async_results[index].get()
+                pending.discard(index)
+            elif timeout is not None and index in start_times and now - start_times[index][0] > timeout:
+                timed_out[index] = start_times[index]
+                pending.discard(index)
+    return results, timed_out
+
+
+class _MutableStream(object):
+    """
+    Wrapper of ``sys.stdout`` or ``sys.stderr``, discarding what is written by the threads inside ``mute_output``
+    """
+
+    def __init__(self, stream):
+        self.stream = stream
+
+    def write(self, data):
+        if not getattr(_muted, 'depth', 0):
+            self.stream.write(data)
+
+    def writelines(self, lines):
+        for line in lines:
+            self.write(line)
+
+    def __getattr__(self, name):
+        return getattr(self.stream, name)
+
+_muted = threading.local()
+_streams_lock = threading.Lock()
+
+
+@contextlib.contextmanager
+def mute_output(enabled=True):
+    """
+    Hide what the current thread prints on stdout and stderr, like the output of the CRAB API, while the other threads
+    keep printing normally
+    :param enabled: if False, nothing is hidden
+    """
+    if not enabled:
+        yield
+        return
+
+    with _streams_lock:
+        if not isinstance(sys.stdout, _MutableStream):
+            sys.stdout = _MutableStream(sys.stdout)
+        if not isinstance(sys.stderr, _MutableStream):
+            sys.stderr = _MutableStream(sys.stderr)
+
+    _muted.depth = getattr(_muted, 'depth', 0) + 1
+    try:
+        yield
+    finally:
+        _muted.depth -= 1
@@ -0,0 +1,175 @@
+"""
+Concurrent submission of crab tasks through the CRAB API, with retries and rate limiting.
+"""
+
+import os
+import shutil
+import threading
+import time
+import traceback
+
+SUBMITTED = 'submitted'
+FAILED = 'failed'
+SKIPPED = 'skipped'
+# The submission failed, and the server could not tell whether it has the task: it must be checked before a new
+# submission, which could create a duplicate
+UNKNOWN = 'unknown'
+
+# Written by crab inside the task directory once the server has accepted the task
+REQUEST_CACHE = '.requestcache'
+
+
+class CrabClient(object):
+    """
+    Serialized access to the CRAB client, which is not thread-safe: it relies on global state (logging, current
+    directory, proxy and cache inside ``~/.crab3``). Only one command runs at a time, and at least ``interval`` seconds
+    separate two commands
+    """
+
+    def __init__(self, crab_command, interval):
+        self.crab_command = crab_command
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.next_call = 0.
+
+    def __call__(self, *args, **kwargs):
+        with self.lock:
+            now = time.time()
+            if now < self.next_call:
+                time.sleep(self.next_call - now)
+            try:
+                return self.crab_command(*args, **kwargs)
+            finally:
+                self.next_call = time.time() + self.interval
+
+
+def load_crab_config(filename):
+    """
+    Load a crab configuration file, as written by ``runOnGrid.py``
+    """
+    from WMCore.Configuration import loadConfigurationFile
+    return loadConfigurationFile(os.path.abspath(filename))
+
+
+def task_directory(config):
+    return os.path.join(config.General.workArea, 'crab_' + config.General.requestName)
+
+
+def get_server_status(taskdir, crab):
+    """
+    Return the status of a task on the CRAB server, or None if the server surely does not know it: crab has not
+    recorded any request for it in the task directory
+    :raise: any error of ``crab status``, or an unexpected answer, since the server may still know the task
+    """
+    if not os.path.exists(os.path.join(taskdir, REQUEST_CACHE)):
+        return None
+
+    try:
+        result = crab('status', dir=taskdir)
+    except Exception as e:
+        # Raised by crab when the request cache is incomplete, ie the submission did not reach the server
+        if type(e).__name__ == 'CachefileNotFoundException':
+            return None
+        raise
+
+    if not isinstance(result, dict) or not result.get('status'):
+        raise ValueError('unexpected answer of crab status: %r' % (result,))
+    return result['status']
+
+
+def submit_task(config, crab, retries, backoff):
+    """
+    Submit one task, retrying with exponential backoff on failure. Before a retry, the server is asked whether it
+    accepted the task anyway, so that a task is never submitted twice. If the server cannot tell, the task is not
+    retried but reported as ``UNKNOWN``
+    :param crab: a ``CrabClient``
+    :return: a tuple ``(status, attempts, message)``
+    """
+    taskdir = task_directory(config)
+    if os.path.exists(taskdir):
+        return (SKIPPED, 0, 'task directory %s already exists' % taskdir)
+
+    error = None
+    for attempt in range(1, retries + 2):
+        if attempt > 1:
+            delay = backoff * 2 ** (attempt - 2)
+            print("Submission of %r failed (%s), retrying in %g s" % (config.General.requestName, error, delay))
+            time.sleep(delay)
+
+        try:
+            result = crab('submit', config=config)
+            return (SUBMITTED, attempt, result.get('uniquerequestname', '') if isinstance(result, dict) else '')
+        except Exception as e:
+            error = '%s: %s' % (type(e).__name__, e)
+
+        try:
+            server_status = get_server_status(taskdir, crab)
+        except Exception as e:
+            message = 'crab status failed (%s: %s) after error %s, check the task before submitting it again' % (
+                    type(e).__name__, e, error)
+            return (UNKNOWN, attempt, message)
+
+        if server_status is not None:
+            message = 'server status %s after error %s' % (server_status, error)
+            return (FAILED if server_status == 'SUBMITFAILED' else SUBMITTED, attempt, message)
+
+        # Unknown to the server: otherwise the next attempt is refused by crab
+        if os.path.exists(taskdir):
+            shutil.rmtree(taskdir)
+
+    return (FAILED, retries + 1, error)
+
+
+def submit_tasks(configs, crab_command=None, threads=4, retries=3, backoff=10, interval=2):
+    """
+    Submit crab tasks concurrently. The crab commands themselves are serialized, threads only overlap the waits
+    between retries. Tasks whose directory already exists are skipped.
+    :param configs: list of crab configuration objects
+    :param crab_command: the function used to talk to the CRAB server, ``CRABAPI.RawCommand.crabCommand`` by default
+    :param threads: number of tasks submitted concurrently
+    :param retries: number of additional attempts for each task
+    :param backoff: delay in seconds before the first retry, doubled for each new attempt
+    :param interval: minimal time in seconds between two requests to the CRAB server
+    :return: a list of ``(request name, status, attempts, message)``, in the same order as ``configs``
+    """
+    from multiprocessing.pool import ThreadPool
+
+    if crab_command is None:
+        from CRABAPI.RawCommand import crabCommand
+        crab_command = crabCommand
+
+    crab = CrabClient(crab_command, interval)
+
+    def submit(config):
+        try:
+            status, attempts, message = submit_task(config, crab, retries, backoff)
+        except Exception as e:
+            traceback.print_exc()
+            status, attempts, message = (FAILED, 0, '%s: %s' % (type(e).__name__, e))
+        return (config.General.requestName, status, attempts, message)
+
+    if len(configs) == 0:
+        return []
+
+    pool = ThreadPool(processes=min(threads, len(configs)))
+    try:
+        results = pool.map(submit, configs)
+    finally:
+        pool.close()
+        pool.join()
+
+    return results
+
+
+def print_summary(results):
+    """
+    Print the result of ``submit_tasks`` as a table
+    """
+    width = max([len(name) for name, _, _, _ in results] + [4])
+    print("%-*s  %-9s  %8s  %s" % (width, 'Task', 'Status', 'Attempts', 'Details'))
+    for name, status, attempts, message in results:
+        print("%-*s  %-9s  %8d  %s" % (width, name, status, attempts, message))
+
+    print("")
+    statuses = [SUBMITTED, FAILED, SKIPPED] + [UNKNOWN] * (UNKNOWN in [r[1] for r in results])
+    print(", ".join(["%d %s" % (len([r for r in results if r[1] == status]), status) for status in statuses]))
@@ -0,0 +1,296 @@
+"""
+Indexed catalogue of the datasets described by the JSON files of the ``Datasets`` repository.
+
+The JSON files are validated and compiled into an index, pickled inside ``~/.cache/gridin``. The index is compiled
+again only when one of the JSON files, or one of the directories containing them, is modified.
+
+Invalid descriptions are kept aside: they are errors only if they would be part of a selection, or if their JSON file
+was given explicitly. Otherwise a warning is printed, and the other datasets are usable.
+"""
+
+import cPickle as pickle
+import fnmatch
+import hashlib
+import json
+import os
+import re
+
+from cp3_llbb.GridIn.common import CACHE_DIR
+
+# Increase when the content of the index changes, to invalidate existing caches
+INDEX_VERSION = 2
+
+VALID_ERAS = ('25ns', '50ns')
+
+
+def is_data(dataset):
+    """
+    Data datasets are recognized by their data tier
+    """
+    return not dataset.rstrip('/').split('/')[-1].endswith('SIM')
+
+
+def find_json_files(paths):
+    """
+    Return the JSON files of ``paths``, which can be files or directories, and the modification time of each file and
+    of each directory visited
+    :return: a tuple ``(files, mtimes)``
+    """
+    files = []
+    mtimes = {}
+    for path in paths:
+        path = os.path.abspath(path)
+        if os.path.isfile(path):
+            files.append(path)
+            mtimes[path] = os.stat(path).st_mtime
+            continue
+
+        if not os.path.isdir(path):
+            raise IOError('No such file or directory: %r' % path)
+
+        for root, dirs, filenames in os.walk(path):
+            dirs[:] = sorted([d for d in dirs if not d.startswith('.')])
+            mtimes[root] = os.stat(root).st_mtime
+            for filename in sorted(filenames):
+                if filename.endswith('.json'):
+                    filename = os.path.join(root, filename)
+                    files.append(filename)
+                    mtimes[filename] = os.stat(filename).st_mtime
+
+    return (files, mtimes)
+
+
+def validate(dataset, opt):
+    """
+    Check the content of the description of a dataset
+    :return: the list of problems
+    """
+    errors = []
+
+    if not isinstance(opt, dict):
+        return ['the description must be a dictionary']
+
+    if not isinstance(opt.get('name'), basestring) or not re.match(r'[\w.-]+\Z', opt['name']):
+        errors.append('invalid or missing name %r' % opt.get('name'))
+
+    units_per_job = opt.get('units_per_job')
+    if isinstance(units_per_job, bool) or not isinstance(units_per_job, int) or units_per_job <= 0:
+        errors.append('units_per_job must be a positive integer, not %r' % units_per_job)
+
+    if opt.get('era') not in VALID_ERAS:
+        errors.append('era must be one of %s, not %r' % (', '.join(VALID_ERAS), opt.get('era')))
+
+    if is_data(dataset):
+        run_range = opt.get('run_range')
+        if not isinstance(run_range, list) or len(run_range) != 2 or not all([isinstance(r, int) for r in run_range]) \
+                or run_range[0] > run_range[1]:
+            errors.append('run_range must be a [first, last] list of runs, not %r' % run_range)
+    elif 'run_range' in opt:
+        errors.append('run_range is only valid for data')
+
+    tags = opt.get('tags', [])
+    if not isinstance(tags, list) or not all([isinstance(t, basestring) for t in tags]):
+        errors.append('tags must be a list of strings, not %r' % tags)
+
+    return errors
+
+
+def may_be_selected(dataset, opt, stem, names, eras, data, tags):
+    """
+    Check if an invalid description matches the selection criteria of ``DatasetCatalog.select``. A criterion whose
+    value is missing or invalid in the description is considered as matching
+    :param stem: the name of the JSON file of the description, without extension
+    """
+    if not isinstance(opt, dict):
+        opt = {}
+
+    name = opt.get('name')
+    if names is not None and isinstance(name, basestring) and not any([fnmatch.fnmatchcase(name, p) for p in names]):
+        return False
+
+    if eras is not None and opt.get('era') in VALID_ERAS and opt['era'] not in eras:
+        return False
+
+    if data is not None and is_data(dataset) != data:
+        return False
+
+    dataset_tags = opt.get('tags', [])
+    if tags is not None and isinstance(dataset_tags, list) and \
+            not (set([t for t in dataset_tags if isinstance(t, basestring)]) | set([stem])) & set(tags):
+        return False
+
+    return True
+
+
+class DatasetCatalog(object):
+    """
+    The datasets of a set of JSON files, indexed by name, era, type and tag
+    """
+
+    def __init__(self, datasets, sources, invalid=None):
+        """
+        :param datasets: a dict ``dataset path -> description``, as in the JSON files
+        :param sources: a dict ``dataset path -> JSON file``
+        :param invalid: a list of ``(JSON file, dataset path, description, problem)`` for the invalid descriptions. The
+                        dataset path and the description are None when the whole file is invalid
+        """
+        self.datasets = datasets
+        self.sources = sources
+        self.invalid = invalid or []
+        # JSON files given explicitly, whose problems are always errors. Set by ``load``
+        self.explicit_files = set()
+
+        self.by_name = {}
+        self.by_era = {}
+        self.by_type = {True: set(), False: set()}
+        self.by_tag = {}
+        for dataset, opt in datasets.items():
+            self.by_name[opt['name']] = dataset
+            self.by_era.setdefault(opt['era'], set()).add(dataset)
+            self.by_type[is_data(dataset)].add(dataset)
+            for tag in self.tags(dataset):
+                self.by_tag.setdefault(tag, set()).add(dataset)
+
+    def tags(self, dataset):
+        """
+        The tags of a dataset: the ``tags`` of its description, and the name of its JSON file without extension
+        """
+        stem = os.path.splitext(os.path.basename(self.sources[dataset]))[0]
+        return set(self.datasets[dataset].get('tags', [])) | set([stem])
+
+    @classmethod
+    def compile(cls, files):
+        """
+        Read and validate the JSON files. Invalid descriptions are not indexed, but kept in ``invalid``
+        """
+        datasets = {}
+        sources = {}
+        names = {}
+        invalid = []
+
+        for filename in files:
+            try:
+                with open(filename) as f:
+                    content = json.load(f)
+            except ValueError as e:
+                invalid.append((filename, None, None, 'invalid JSON: %s' % e))
+                continue
+
+            if not isinstance(content, dict):
+                invalid.append((filename, None, None, 'the root node must be a dictionary'))
+                continue
+
+            for dataset, opt in content.items():
+                problems = validate(dataset, opt)
+                if len(problems) > 0:
+                    invalid += [(filename, dataset, opt, p) for p in problems]
+                    continue
+
+                if dataset in datasets:
+                    invalid.append((filename, dataset, opt, 'already defined in %s' % sources[dataset]))
+                    continue
+
+                if opt['name'] in names:
+                    invalid.append((filename, dataset, opt, 'name %r already used by %s in %s' % (opt['name'],
+                                   names[opt['name']], sources[names[opt['name']]])))
+                    continue
+
+                datasets[dataset] = opt
+                sources[dataset] = filename
+                names[opt['name']] = dataset
+
+        return cls(datasets, sources, invalid)
+
+    @classmethod
+    def load(cls, paths, cache_dir=CACHE_DIR):
+        """
+        Return the catalogue of the JSON files found in ``paths`` (files or directories), using the cached index if
+        none of them has been modified since it was compiled
+        """
+        files, mtimes = find_json_files(paths)
+        explicit_files = set([os.path.abspath(p) for p in paths if os.path.isfile(p)])
+
+        key = hashlib.sha1('\n'.join(sorted([os.path.abspath(p) for p in paths]))).hexdigest()
+        cache_file = os.path.join(cache_dir, 'datasets_%s.pkl' % key)
+
+        try:
+            with open(cache_file, 'rb') as f:
+                version, cached_mtimes, catalog = pickle.load(f)
+            if version == INDEX_VERSION and cached_mtimes == mtimes:
+                catalog.explicit_files = explicit_files
+                return catalog
+        except Exception:
+            # Missing or unreadable cache
+            pass
+
+        catalog = cls.compile(files)
+
+        try:
+            if not os.path.isdir(cache_dir):
+                os.makedirs(cache_dir)
+            tmp = cache_file + '.%d' % os.getpid()
+            with open(tmp, 'wb') as f:
+                pickle.dump((INDEX_VERSION, mtimes, catalog), f, pickle.HIGHEST_PROTOCOL)
+            os.rename(tmp, cache_file)
+        except (IOError, OSError) as e:
+            print('Warning: failed to save the dataset catalogue index: %s' % e)
+
+        catalog.explicit_files = explicit_files
+        return catalog
+
+    def select(self, names=None, eras=None, data=None, tags=None):
+        """
+        Select datasets. Each criterion is ignored if None, otherwise all of them must be fulfilled
+        :param names: list of shell-style patterns, matched against the dataset names
+        :param eras: list of eras
+        :param data: True to select data, False to select MC. The datasets of the JSON files given explicitly are kept
+                     whatever their type: the user chose them
+        :param tags: list of tags, a dataset must have at least one of them
+        :return: a dict ``dataset path -> description``, like the JSON files
+        :raise ValueError: if some of the invalid descriptions may be selected. The others are only reported
+        """
+        self._check_invalid(names, eras, data, tags)
+
+        selected = set(self.datasets)
+
+        if names is not None:
+            selected &= set([self.by_name[n] for n in self.by_name if any([fnmatch.fnmatchcase(n, p) for p in names])])
+
+        if eras is not None:
+            selected &= set().union(*[self.by_era.get(era, set()) for era in eras])
+
+        if data is not None:
+            selected &= self.by_type[data] | set([d for d in self.datasets if self.sources[d] in self.explicit_files])
+
+        if tags is not None:
+            selected &= set().union(*[self.by_tag.get(tag, set()) for tag in tags])
+
+        return dict((dataset, self.datasets[dataset]) for dataset in selected)
+
+    def _check_invalid(self, names, eras, data, tags):
+        """
+        Raise a ``ValueError`` with all the problems of the invalid descriptions that may be selected, and warn about
+        the others. A whole invalid JSON file may be selected unless the names, eras or tags exclude it
+        """
+        errors = []
+        warnings = []
+        for filename, dataset, opt, problem in self.invalid:
+            stem = os.path.splitext(os.path.basename(filename))[0]
+            if filename in self.explicit_files:
+                selected = True
+            elif dataset is None:
+                selected = (names is None and eras is None and tags is None) or (tags is not None and stem in tags)
+            else:
+                selected = may_be_selected(dataset, opt, stem, names, eras, data, tags)
+
+            if dataset is None:
+                message = '%s: %s' % (filename, problem)
+            else:
+                message = '%s: %s: %s' % (filename, dataset, problem)
+            (errors if selected else warnings).append(message)
+
+        if len(errors) > 0:
+            raise ValueError('Invalid dataset description(s):\n  ' + '\n  '.join(errors))
+
+        if len(warnings) > 0:
+            print('Warning: invalid dataset description(s), not selected:\n  ' + '\n  '.join(warnings))
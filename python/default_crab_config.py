@@ -1,5 +1,13 @@
 __author__ = 'sbrochet'
 
+WORK_AREA = 'tasks'
+
+def get_splitting(is_mc):
+    """
+    Splitting mode of the tasks: files for MC, luminosity sections for data
+    """
+    return 'FileBased' if is_mc else 'LumiBased'
+
 def create_config(is_mc):
     """
     Create a default CRAB configuration suitable to run the framework
@@ -9,7 +17,7 @@ def create_config(is_mc):
     from CRABClient.UserUtilities import config, getUsernameFromSiteDB
     config = config()
 
-    config.General.workArea = 'tasks'
+    config.General.workArea = WORK_AREA
     config.General.transferOutputs = True
     config.General.transferLogs = True
 
@@ -20,10 +28,7 @@ def create_config(is_mc):
 
     config.Data.inputDBS = 'global'
 
-    if is_mc:
-        config.Data.splitting = 'FileBased'
-    else:
-        config.Data.splitting = 'LumiBased'
+    config.Data.splitting = get_splitting(is_mc)
 
     config.Data.outLFNDirBase = '/store/user/%s/' % (getUsernameFromSiteDB())
     config.Data.publication = False
@@ -0,0 +1,51 @@
+"""
+Local cache of the information extracted from the framework output files, used by ``runPostCrab.py``
+"""
+
+import json
+import sqlite3
+
+
+class FileDataCache(object):
+    """
+    SQLite cache of ``(sumw, extras_sumw, entries)`` for each output file, keyed by LFN.
+
+    An entry is only valid if the size and modification time of the file are still the same as when it was read.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.db = sqlite3.connect(path)
+        self.db.execute('CREATE TABLE IF NOT EXISTS files ('
+                        'lfn TEXT PRIMARY KEY, size INTEGER, mtime INTEGER, '
+                        'sumw REAL, extras_sumw TEXT, entries INTEGER)')
+        self.db.commit()
+
+    def get(self, lfns):
+        """
+        Retrieve cached entries
+        :param lfns: list of LFNs to look for
+        :return: a dict ``lfn -> ((size, mtime), (sumw, extras_sumw, entries))``. Unknown LFNs are not included
+        """
+        result = {}
+        lfns = list(lfns)
+        # Stay below the maximum number of host parameters of sqlite
+        for i in range(0, len(lfns), 500):
+            chunk = lfns[i:i + 500]
+            query = 'SELECT lfn, size, mtime, sumw, extras_sumw, entries FROM files WHERE lfn IN (%s)' % ','.join('?' * len(chunk))
+            for lfn, size, mtime, sumw, extras_sumw, entries in self.db.execute(query, chunk):
+                result[lfn] = ((size, mtime), (sumw, json.loads(extras_sumw), entries))
+
+        return result
+
+    def update(self, entries):
+        """
+        Add or replace entries in the cache
+        :param entries: list of ``(lfn, (size, mtime), (sumw, extras_sumw, entries))``
+        """
+        rows = [(lfn, stat[0], stat[1], data[0], json.dumps(data[1], separators=(',', ':')), data[2]) for lfn, stat, data in entries]
+        self.db.executemany('INSERT OR REPLACE INTO files (lfn, size, mtime, sumw, extras_sumw, entries) VALUES (?, ?, ?, ?, ?, ?)', rows)
+        self.db.commit()
+
+    def close(self):
+        self.db.close()
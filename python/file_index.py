@@ -0,0 +1,112 @@
+"""
+Persistent index of the file names of a source tree, to find files by name without walking the whole tree.
+
+The listing of each directory is cached inside ``~/.cache/gridin``, with the modification time of the directory. When
+refreshing the index, only the directories whose modification time changed are listed again: the others only cost a
+``stat``. Hidden directories (like ``.git``) and symbolic links to directories are ignored.
+"""
+
+import cPickle as pickle
+import hashlib
+import os
+
+from cp3_llbb.GridIn.common import CACHE_DIR
+
+# Increase when the content of the index changes, to invalidate existing caches
+INDEX_VERSION = 2
+
+
+class FileIndex(object):
+    """
+    The files of the tree below ``root``, indexed by name
+    """
+
+    def __init__(self, root, cache_dir=CACHE_DIR):
+        self.root = os.path.abspath(root)
+        self.cache_file = os.path.join(cache_dir, 'files_%s.pkl' % hashlib.sha1(self.root).hexdigest())
+        # directory -> (mtime, files, subdirectories)
+        self.listings = {}
+        self.listed = 0
+
+    def _load(self):
+        try:
+            with open(self.cache_file, 'rb') as f:
+                version, listings = pickle.load(f)
+            self.listings = listings if version == INDEX_VERSION else {}
+        except Exception:
+            # Missing or unreadable cache
+            self.listings = {}
+
+    def _save(self):
+        try:
+            if not os.path.isdir(os.path.dirname(self.cache_file)):
+                os.makedirs(os.path.dirname(self.cache_file))
+            tmp = self.cache_file + '.%d' % os.getpid()
+            with open(tmp, 'wb') as f:
+                pickle.dump((INDEX_VERSION, self.listings), f, pickle.HIGHEST_PROTOCOL)
+            os.rename(tmp, self.cache_file)
+        except (IOError, OSError) as e:
+            print('Warning: failed to save the file index: %s' % e)
+
+    def refresh(self):
+        """
+        Update the index, listing again only the modified directories
+        """
+        self._load()
+        self.listed = 0
+
+        listings = {}
+        modified = False
+        stack = [self.root]
+        while len(stack) > 0:
+            directory = stack.pop()
+            try:
+                mtime = os.stat(directory).st_mtime
+            except OSError:
+                # Removed in the meantime
+                modified = True
+                continue
+
+            listing = self.listings.get(directory)
+            if listing is None or listing[0] != mtime:
+                files = []
+                subdirs = []
+                for name in os.listdir(directory):
+                    path = os.path.join(directory, name)
+                    if os.path.isdir(path):
+                        # Links are not followed: they can make cycles, or show the same files twice
+                        if not name.startswith('.') and not os.path.islink(path):
+                            subdirs.append(name)
+                    else:
+                        files.append(name)
+                listing = (mtime, files, subdirs)
+                self.listed += 1
+                modified = True
+
+            listings[directory] = listing
+            stack.extend([os.path.join(directory, d) for d in listing[2]])
+
+        modified = modified or len(listings) != len(self.listings)
+        self.listings = listings
+        if modified:
+            self._save()
+
+    def find(self, filename):
+        """
+        Return the sorted list of the paths of the files named ``filename``
+        """
+        return sorted([os.path.join(directory, filename) for directory, (_, files, _) in self.listings.items()
+                       if filename in files])
+
+    def find_one(self, filename):
+        """
+        Return the path of the only file named ``filename``. Raise an ``IOError`` if there is no such file, or more
+        than one
+        """
+        self.refresh()
+        matches = self.find(filename)
+        if len(matches) == 0:
+            raise IOError('File %r not found inside %s' % (filename, self.root))
+        if len(matches) > 1:
+            raise IOError('File %r is ambiguous inside %s, it could be any of:\n  %s' % (filename, self.root, '\n  '.join(matches)))
+        return matches[0]
@@ -0,0 +1,103 @@
+"""
+Read the metadata of the framework output files needed by the book-keeping: the sum of event weights, the extra sums
+of event weights, and the number of entries of the tree.
+
+Two readers are available: ``root``, with PyROOT, and ``light``, reading only these objects without loading ROOT (see
+``root_file``). The ``light`` reader falls back to PyROOT for the files it can not handle.
+"""
+
+from cp3_llbb.GridIn import root_file
+
+READERS = ('root', 'light')
+
+SUMW_NAME = 'event_weight_sum'
+EXTRA_SUMW_PREFIX = 'event_weight_sum_'
+TREE_NAME = 't'
+
+
+def get_file_data_root(pfn):
+    """
+    Return the sum of event weights and the entries of the framework output, read with PyROOT
+    """
+    import ROOT
+
+    f = ROOT.TFile.Open(pfn)
+    if not f:
+        return (None, None, None)
+
+    nominal_sumw = f.Get(SUMW_NAME)
+    if nominal_sumw:
+        nominal_sumw = nominal_sumw.GetVal()
+    else:
+        nominal_sumw = None
+
+    # Grab extras sum of event weight
+    extras_sumw = {}
+    for key in f.GetListOfKeys():
+        if key.GetName().startswith(EXTRA_SUMW_PREFIX):
+            suffix = key.GetName().replace(EXTRA_SUMW_PREFIX, '')
+            obj = key.ReadObj()
+            if obj:
+                extras_sumw[suffix] = obj.GetVal()
+
+    entries = None
+    tree = f.Get(TREE_NAME)
+    if tree:
+        entries = tree.GetEntriesFast()
+
+    return (nominal_sumw, extras_sumw, entries)
+
+
+def get_file_data_light(pfn):
+    """
+    Return the sum of event weights and the entries of the framework output, read without ROOT
+    """
+    try:
+        f = root_file.RootFile(pfn)
+    except IOError:
+        return (None, None, None)
+
+    with f:
+        extras_sumw = {}
+        for name in f.keys:
+            if name.startswith(EXTRA_SUMW_PREFIX):
+                extras_sumw[name.replace(EXTRA_SUMW_PREFIX, '')] = f.parameter(name)
+
+        return (f.parameter(SUMW_NAME), extras_sumw, f.tree_entries(TREE_NAME))
+
+
+def get_file_stat_root(pfn):
+    """
+    Return ``(size, modification time)`` of a file, or None if it's not available. Remote files are handled by ROOT
+    """
+    import ROOT
+
+    stat = ROOT.FileStat_t()
+    if ROOT.gSystem.GetPathInfo(pfn, stat) != 0:
+        return None
+    return (stat.fSize, stat.fMtime)
+
+
+def get_file_data(pfn, reader='root'):
+    """
+    Return ``(sumw, extras_sumw, entries)`` for the framework output ``pfn``, with the reader ``reader``
+    """
+    if reader == 'light':
+        try:
+            return get_file_data_light(pfn)
+        except root_file.UnsupportedFile:
+            pass
+    return get_file_data_root(pfn)
+
+
+def get_file_stat(pfn, reader='root'):
+    """
+    Return ``(size, modification time)`` of a file, or None if it's not available. With the ``light`` reader, ROOT
+    is only used for remote files when the XRootD Python bindings are missing
+    """
+    if reader == 'light':
+        try:
+            return root_file.stat(pfn)
+        except root_file.UnsupportedFile:
+            pass
+    return get_file_stat_root(pfn)
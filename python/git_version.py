@@ -0,0 +1,172 @@
+"""
+Figure out the version of the code used to produce a sample, as a ``(hash, repository, url)`` tuple.
+
+Everything is resolved locally (no ``git remote show``, which contacts the remotes). The description of HEAD and the
+remotes are cached inside ``~/.cache/gridin``, keyed on the commit of HEAD, the tags, the remote references and the
+configuration of the repository. Only the state of the working tree is checked at each call, since it can change at any
+time.
+"""
+
+import json
+import os
+import subprocess
+
+from cp3_llbb.GridIn.common import CACHE_DIR
+
+CACHE_FILE = 'git_versions.json'
+
+_memory_cache = {}
+
+
+def _git(path, *args):
+    proc = subprocess.Popen(['git'] + list(args), cwd=path, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    out, _ = proc.communicate()
+    return out
+
+
+def find_git_dir(path):
+    """
+    Find the git directory of the repository containing ``path``
+    :return: a tuple ``(git_dir, common_dir)``. They differ only for additional working trees
+    """
+    path = os.path.abspath(path)
+    while True:
+        dotgit = os.path.join(path, '.git')
+        if os.path.isdir(dotgit):
+            return (dotgit, dotgit)
+        if os.path.isfile(dotgit):
+            # Submodule or additional working tree
+            with open(dotgit) as f:
+                git_dir = f.read().strip().split('gitdir:', 1)[1].strip()
+            git_dir = os.path.normpath(os.path.join(path, git_dir))
+            common_dir = git_dir
+            if os.path.isfile(os.path.join(git_dir, 'commondir')):
+                with open(os.path.join(git_dir, 'commondir')) as f:
+                    common_dir = os.path.normpath(os.path.join(git_dir, f.read().strip()))
+            return (git_dir, common_dir)
+
+        parent = os.path.dirname(path)
+        if parent == path:
+            raise IOError('%r is not inside a git repository' % path)
+        path = parent
+
+
+def _refs_state(git_dir, common_dir):
+    """
+    Fingerprint of HEAD, of the tags, of the remote branches and of the remotes configuration, read directly from the
+    git directory
+    """
+    state = []
+    with open(os.path.join(git_dir, 'HEAD')) as f:
+        head = f.read().strip()
+    state.append(head)
+    # The commit of the current branch, unless it is only in packed-refs
+    if head.startswith('ref:'):
+        filename = os.path.join(common_dir, head[len('ref:'):].strip())
+        if os.path.isfile(filename):
+            with open(filename) as f:
+                state.append(f.read().strip())
+
+    for name in ('config', 'packed-refs'):
+        filename = os.path.join(common_dir, name)
+        if os.path.isfile(filename):
+            st = os.stat(filename)
+            state.append('%s:%f:%d' % (name, st.st_mtime, st.st_size))
+
+    for refs in ('tags', 'remotes'):
+        for root, dirs, files in os.walk(os.path.join(common_dir, 'refs', refs)):
+            dirs.sort()
+            for name in sorted(files):
+                filename = os.path.join(root, name)
+                with open(filename) as f:
+                    state.append('%s:%s' % (os.path.relpath(filename, common_dir), f.read().strip()))
+
+    return '\n'.join(state)
+
+
+def _is_dirty(gitCallPath):
+    """
+    Check if tracked files of the working tree are modified, like ``git describe --dirty`` but without describing HEAD
+    """
+    return _git(gitCallPath, 'status', '--porcelain', '--untracked-files=no').strip() != ''
+
+
+def _get_remote(gitCallPath, remote):
+    """
+    Return the ``(user, repository)`` of a remote, from its locally configured URL
+    """
+    url = _git(gitCallPath, 'ls-remote', '--get-url', remote).strip()
+    # When the remote does not exist, its name is returned as the URL
+    if url == remote or url == '':
+        raise AssertionError("No remote named %r in %s" % (remote, gitCallPath))
+    user, repo = url.split(':')[-1].split('/')[-2:]
+    return (user, repo.strip('.git'))
+
+
+def _load_cache(cache_dir):
+    try:
+        with open(os.path.join(cache_dir, CACHE_FILE)) as f:
+            return json.load(f)
+    except (IOError, ValueError):
+        return {}
+
+
+def _save_cache(cache_dir, cache):
+    try:
+        if not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+        with open(os.path.join(cache_dir, CACHE_FILE), 'w') as f:
+            json.dump(cache, f)
+    except (IOError, OSError):
+        # Read-only home directory, only the in-memory cache is used
+        pass
+
+
+def getGitTagRepoUrl(gitCallPath, cache_dir=CACHE_DIR):
+    """
+    Return the ``(hash, repository, url)`` describing the version of the repository containing ``gitCallPath``.
+    The hash is the tag if one exists. Raise an ``AssertionError`` if the working tree is dirty, or if the commit
+    was not pushed to any remote.
+    :param cache_dir: directory of the cache of the descriptions
+    """
+    git_dir, common_dir = find_git_dir(gitCallPath)
+    key = '%s\n%s' % (git_dir, _refs_state(git_dir, common_dir))
+
+    cached = _memory_cache.get(key)
+    if cached is None:
+        disk_cache = _load_cache(cache_dir)
+        cached = disk_cache.get(key)
+        if cached is None:
+            # get the hash of the commit
+            # Well, note that actually it should be the tag if a tag exist, the hash is the fallback solution
+            gitHash = _git(gitCallPath, 'describe', '--tags', '--always').strip('\n')
+            # get the stuff needed to write a valid url: name on github, name of repo, for both origin and upstream
+            remoteOrigin, repoOrigin = _get_remote(gitCallPath, 'origin')
+            remoteUpstream, repoUpstream = _get_remote(gitCallPath, 'upstream')
+            # get the list of branches in which you can find the hash
+            branch = _git(gitCallPath, 'branch', '-r', '--contains', gitHash)
+            cached = [gitHash, remoteOrigin, repoOrigin, remoteUpstream, repoUpstream, branch]
+            # Only keep the entries of the current state of each working tree
+            disk_cache = dict((k, v) for k, v in disk_cache.items() if not k.startswith(git_dir + '\n'))
+            disk_cache[key] = cached
+            _save_cache(cache_dir, disk_cache)
+        _memory_cache[key] = cached
+
+    gitHash, remoteOrigin, repoOrigin, remoteUpstream, repoUpstream, branch = cached
+
+    # Never cached, since the working tree can be modified at any time
+    if _is_dirty(gitCallPath):
+        raise AssertionError("Aborting: your working tree for repository", repoOrigin, "is dirty, please clean the changes not staged/committed before inserting this in the database")
+    if( 'upstream' in branch ):
+        url = "https://github.com/" + remoteUpstream + "/" + repoUpstream + "/tree/" + gitHash
+        repo = repoUpstream
+    elif( 'origin' in branch ):
+        url = "https://github.com/" + remoteOrigin + "/" + repoOrigin + "/tree/" + gitHash
+        repo = repoOrigin
+    elif( '/' in branch ):
+        url = "https://github.com/" + branch.strip(" ").split("/")[0] + "/" + repoOrigin + "/tree/" + branch.strip(" ").split("/")[1]
+        repo = repoOrigin
+    else:
+        print("PLEASE PUSH YOUR CODE!!! this result CANNOT be reproduced / bookkept outside of your ingrid session, so there is no point into putting it in the database, ABORTING now")
+        raise AssertionError("Code from repository " + repoUpstream + " has not been pushed")
+    return gitHash, repo, url
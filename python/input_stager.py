@@ -0,0 +1,264 @@
+"""
+Background staging of remote input files to local scratch space, while the framework is running.
+
+The framework receives a ``StagedFiles`` list instead of the plain list of input files. Each remote file is looked up
+only when the framework asks for it: if its local copy is complete at that moment, the framework reads the copy,
+otherwise it streams the file directly, exactly as without staging. A file the framework has already asked for is
+never staged. Files are staged in the order of the input list, within a disk budget, and are removed once the
+framework has moved to the next files. If the framework asks for all its files at once, nothing is staged.
+"""
+
+import os
+import re
+import subprocess
+import time
+
+from cp3_llbb.GridIn.common import split_url
+
+# Time in seconds between two checks of the files asked for and opened by the framework
+POLL_INTERVAL = 2
+# Time in seconds between two checks of a running copy
+COPY_POLL_INTERVAL = 0.5
+
+
+def remote_size(url, timeout=60):
+    """
+    Return the size in bytes of a remote file, or None if it cannot be retrieved
+    """
+    server, path = split_url(url)
+    proc = subprocess.Popen(['timeout', str(timeout), 'xrdfs', server, 'stat', path], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    out, _ = proc.communicate()
+    match = re.search(r'Size:\s+(\d+)', out)
+    if proc.returncode != 0 or match is None:
+        return None
+    return int(match.group(1))
+
+
+def open_files(pid):
+    """
+    Return the set of files currently opened by process ``pid``
+    """
+    fd_dir = '/proc/%d/fd' % pid
+    files = set()
+    try:
+        fds = os.listdir(fd_dir)
+    except OSError:
+        return files
+
+    for fd in fds:
+        try:
+            files.add(os.readlink(os.path.join(fd_dir, fd)))
+        except OSError:
+            # Closed in the meantime
+            pass
+
+    return files
+
+
+def stage_files(entries, requested, budget, pid):
+    """
+    Stage files in order, while process ``pid`` is alive. Executed in a separate process.
+    :param entries: list of ``(index, url, local path, size)``, in the order they are read by the framework
+    :param requested: shared flags, set for each index of the input list once the framework has asked for it
+    :param budget: maximum number of bytes staged at the same time
+    :param pid: process reading the files
+    """
+    def evict():
+        # Files before the last one asked for are not needed anymore, unless they are still open
+        last = max([i for i in range(len(requested)) if requested[i]] + [-1])
+        opened = None
+        for index, _, path, _ in entries:
+            if index < last and os.path.exists(path):
+                if opened is None:
+                    opened = open_files(pid)
+                if path not in opened:
+                    os.remove(path)
+
+    def staged_bytes():
+        return sum([size for _, _, path, size in entries if os.path.exists(path)])
+
+    next_entry = 0
+    while os.path.exists('/proc/%d' % pid):
+        evict()
+
+        # Skip the files the framework already asked for: they are streamed
+        while next_entry < len(entries) and requested[entries[next_entry][0]]:
+            next_entry += 1
+
+        if next_entry >= len(entries):
+            time.sleep(POLL_INTERVAL)
+            continue
+
+        index, url, path, size = entries[next_entry]
+        if staged_bytes() + size > budget:
+            time.sleep(POLL_INTERVAL)
+            continue
+
+        # Copy to a temporary name, so that the framework never sees a partial file. If the framework asks for the
+        # file in the meantime, it streams it: the copy is abandoned
+        tmp = path + '.staging'
+        start = time.time()
+        proc = subprocess.Popen(['xrdcp', '--nopbar', '--force', url, tmp])
+        while proc.poll() is None and not requested[index]:
+            time.sleep(COPY_POLL_INTERVAL)
+
+        if requested[index]:
+            if proc.returncode is None:
+                proc.terminate()
+                proc.wait()
+            print('Staging of %r abandoned: the file is already read directly' % url)
+        elif proc.returncode == 0:
+            os.rename(tmp, path)
+            print('Staged %r in %.1f s' % (url, time.time() - start))
+        else:
+            print('Failed to stage %r, it will be read directly' % url)
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        next_entry += 1
+
+
+class StagedFiles(list):
+    """
+    The input files of the framework. A remote file is returned as its local copy if the copy is complete when the
+    framework asks for it, and as its URL otherwise
+    """
+
+    def __init__(self, files, local_paths, requested):
+        """
+        :param files: the input files
+        :param local_paths: a dict ``index -> local path`` of the staged copy of each remote file
+        :param requested: shared flags, set for each index once the framework has asked for it
+        """
+        list.__init__(self, files)
+        self.local_paths = local_paths
+        self.requested = requested
+        # Indices of the files read from their staged copy
+        self.staged = set()
+        # Time at which the framework first asked for each file
+        self.request_times = {}
+
+    def _get(self, index):
+        self.request_times.setdefault(index, time.time())
+        path = self.local_paths.get(index)
+        if path is None:
+            return list.__getitem__(self, index)
+
+        # Flag first: the copy is either complete now, or never used
+        self.requested[index] = 1
+        if os.path.exists(path):
+            self.staged.add(index)
+            return 'file:' + path
+        return list.__getitem__(self, index)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self._get(i) for i in range(*index.indices(len(self)))]
+        return self._get(index if index >= 0 else index + len(self))
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self._get(i)
+
+    def is_staged(self, index):
+        return index in self.staged
+
+    def staged_copies(self):
+        """
+        :return: a dict ``index -> URL of the staged copy`` of the files the framework read from their staged copy
+        """
+        return dict((index, 'file:' + self.local_paths[index]) for index in self.staged)
+
+    def request_delays(self, start):
+        """
+        Measure whether the framework asked for its files lazily, when it actually opened them: staging only helps then
+        :param start: the time at which the framework started
+        :return: the delay in seconds, since ``start``, of the first request of each file, None if never asked for
+        """
+        return [self.request_times[i] - start if i in self.request_times else None for i in range(len(self))]
+
+
+class InputStager(object):
+    """
+    Stage remote input files in the background, within a disk space budget.
+    Staging is only enabled if the scratch space can hold at least two of the remote files at the same time,
+    otherwise files are streamed directly.
+    """
+
+    def __init__(self, scratch, budget):
+        """
+        :param scratch: directory used to store the staged files
+        :param budget: maximum disk space, in bytes, used by the staged files
+        """
+        self.scratch = os.path.abspath(scratch)
+        self.budget = budget
+        self.process = None
+        # The input files to give to the framework
+        self.files = None
+
+    def start(self, files, processes=8):
+        """
+        Start staging the remote files of ``files``. The framework must read ``self.files`` instead of ``files``
+        :param files: the input files of the framework, in the order they are read
+        :param processes: number of remote files whose size is retrieved concurrently
+        :return: True if staging is enabled, False if remote files are streamed directly
+        """
+        from multiprocessing import Array, Process
+        from multiprocessing.pool import ThreadPool
+
+        self.files = files
+
+        # The first file is opened as soon as the framework starts: it is never staged
+        remote = [(i, f) for i, f in enumerate(files) if i > 0 and f.startswith('root://')]
+        if len(remote) == 0:
+            return False
+
+        if not os.path.isdir(self.scratch):
+            os.makedirs(self.scratch)
+
+        stat = os.statvfs(self.scratch)
+        budget = min(self.budget, stat.f_bavail * stat.f_frsize)
+
+        pool = ThreadPool(processes=min(processes, len(remote)))
+        sizes = pool.map(remote_size, [f for _, f in remote])
+        pool.close()
+
+        if None in sizes:
+            print('Staging disabled: failed to retrieve the size of some remote files')
+            return False
+
+        # One file is read while the next one is staged
+        if 2 * max(sizes) > budget:
+            print('Staging disabled: not enough scratch space (%d MB available, %d MB needed)' % (budget / 1e6, 2 * max(sizes) / 1e6))
+            return False
+
+        entries = []
+        for (index, url), size in zip(remote, sizes):
+            path = os.path.normpath(self.scratch + '/' + split_url(url)[1])
+            if not os.path.isdir(os.path.dirname(path)):
+                os.makedirs(os.path.dirname(path))
+            entries.append((index, url, path, size))
+
+        # Shared with the staging process, which must not stage the files already asked for
+        requested = Array('b', len(files), lock=False)
+        self.files = StagedFiles(files, dict((index, path) for index, _, path, _ in entries), requested)
+
+        self.process = Process(target=stage_files, args=(entries, requested, budget, os.getpid()))
+        self.process.daemon = True
+        self.process.start()
+
+        print('Staging %d remote files in %s, using at most %d MB' % (len(entries), self.scratch, budget / 1e6))
+
+        return True
+
+    def stop(self):
+        """
+        Stop staging and remove the staged files
+        """
+        import shutil
+
+        if self.process is not None:
+            self.process.terminate()
+            self.process.join()
+            self.process = None
+
+        shutil.rmtree(self.scratch, ignore_errors=True)
@@ -0,0 +1,157 @@
+"""
+Estimate, before submitting, how many luminosity sections and jobs each data task will have.
+
+The luminosity sections of a dataset are read from a local dump: a compact list JSON file named after the dataset,
+inside a dump directory. Missing dumps are created with ``dasgoclient`` when it is available.
+"""
+
+import hashlib
+import json
+import os
+import re
+import subprocess
+
+from cp3_llbb.GridIn.common import CACHE_DIR
+from cp3_llbb.GridIn.lumi_intervals import LumiIntervals
+
+# Maximum number of jobs of a crab task
+MAX_JOBS = 10000
+
+# Below this number of luminosity sections per job, jobs are dominated by their overhead
+MIN_UNITS_PER_JOB = 5
+
+
+def load_lumi_json(path, cache_dir=CACHE_DIR):
+    """
+    Load a compact list JSON file, from a local path or from a URL. Downloaded files are cached
+    """
+    if not re.match(r'\w+://', path):
+        with open(path) as f:
+            return LumiIntervals.from_compact_list(json.load(f))
+
+    cache_file = os.path.join(cache_dir, 'lumis_%s.json' % hashlib.sha1(path).hexdigest())
+    if not os.path.isfile(cache_file):
+        import urllib2
+        content = urllib2.urlopen(path).read()
+        if not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+        with open(cache_file, 'w') as f:
+            f.write(content)
+
+    with open(cache_file) as f:
+        return LumiIntervals.from_compact_list(json.load(f))
+
+
+def dump_filename(dump_dir, dataset):
+    return os.path.join(dump_dir, dataset.strip('/').replace('/', '__') + '.json')
+
+
+def query_das_lumis(dataset):
+    """
+    Retrieve the luminosity sections of a dataset with ``dasgoclient``, as a compact list
+    """
+    out = subprocess.check_output(['dasgoclient', '-query', 'run,lumi dataset=%s' % dataset])
+
+    runs = []
+    lumis = []
+    for line in out.splitlines():
+        # <run> [<lumi>,<lumi>,...]
+        fields = line.split(None, 1)
+        if len(fields) != 2:
+            continue
+        for lumi in json.loads(fields[1]):
+            runs.append(int(fields[0]))
+            lumis.append(lumi)
+
+    return LumiIntervals.from_intervals(runs, lumis, lumis).to_compact_list()
+
+
+def get_dataset_lumis(dataset, dump_dir):
+    """
+    Return the luminosity sections of ``dataset``, from its dump inside ``dump_dir``, creating it if needed
+    :return: the luminosity sections, or None if they are not available
+    """
+    filename = dump_filename(dump_dir, dataset)
+    if not os.path.isfile(filename):
+        try:
+            compact_list = query_das_lumis(dataset)
+        except (OSError, subprocess.CalledProcessError, ValueError) as e:
+            print('Warning: no luminosity sections dump for %s, and DAS query failed: %s' % (dataset, e))
+            return None
+
+        if not os.path.isdir(dump_dir):
+            os.makedirs(dump_dir)
+        with open(filename, 'w') as f:
+            json.dump(compact_list, f)
+
+    with open(filename) as f:
+        return LumiIntervals.from_compact_list(json.load(f))
+
+
+def plan_dataset(name, dataset_lumis, certified, run_range, units_per_job):
+    """
+    Estimate the luminosity sections and jobs of a data task
+    :param dataset_lumis: the luminosity sections of the dataset, None if unknown
+    :param certified: the certified luminosity sections
+    :param run_range: the ``[first, last]`` runs to process
+    :param units_per_job: the number of luminosity sections per job
+    :return: a dict with the numbers of luminosity sections at each step, the estimated number of jobs and the list of
+             warnings
+    """
+    if dataset_lumis is None:
+        return {'name': name, 'dataset_lumis': None, 'in_range_lumis': None, 'lumis': None,
+                'units_per_job': units_per_job, 'jobs': None, 'warnings': ['luminosity sections of the dataset unknown']}
+
+    in_range = dataset_lumis & LumiIntervals.run_range(run_range[0], run_range[1])
+    selected = in_range & certified
+    lumis = len(selected)
+    jobs = (lumis + units_per_job - 1) // units_per_job
+
+    warnings = []
+    if lumis == 0:
+        if len(in_range) == 0:
+            warnings.append('the run range %d-%d does not overlap with the runs of the dataset' % tuple(run_range))
+        else:
+            warnings.append('no certified luminosity section inside the run range')
+    elif jobs > MAX_JOBS:
+        warnings.append('%d jobs, above the crab limit of %d: increase units_per_job to at least %d' % (
+            jobs, MAX_JOBS, (lumis + MAX_JOBS - 1) // MAX_JOBS))
+    elif jobs == 1 and lumis > 10 * MIN_UNITS_PER_JOB:
+        warnings.append('a single job processes everything')
+    if units_per_job < MIN_UNITS_PER_JOB:
+        warnings.append('only %d luminosity sections per job' % units_per_job)
+
+    certified_outside = len((dataset_lumis & certified) - in_range)
+    if certified_outside > 0:
+        warnings.append('%d certified luminosity sections of the dataset are outside of the run range' % certified_outside)
+
+    return {
+            'name': name,
+            'dataset_lumis': len(dataset_lumis),
+            'in_range_lumis': len(in_range),
+            'lumis': lumis,
+            'units_per_job': units_per_job,
+            'jobs': jobs,
+            'warnings': warnings
+            }
+
+
+def print_plan(plans):
+    """
+    Print the result of ``plan_dataset`` for several tasks as a table, followed by the warnings
+    """
+    width = max([len(p['name']) for p in plans] + [4])
+    print("%-*s  %10s  %10s  %10s  %8s  %6s" % (width, 'Task', 'Dataset', 'Run range', 'Certified', 'Per job', 'Jobs'))
+    for p in plans:
+        print("%-*s  %10s  %10s  %10s  %8d  %6s" % (width, p['name'],
+              '-' if p['dataset_lumis'] is None else p['dataset_lumis'],
+              '-' if p['in_range_lumis'] is None else p['in_range_lumis'],
+              '-' if p['lumis'] is None else p['lumis'], p['units_per_job'],
+              '-' if p['jobs'] is None else p['jobs']))
+
+    print("")
+    print("%d jobs in total" % sum([p['jobs'] or 0 for p in plans]))
+
+    for p in plans:
+        for warning in p['warnings']:
+            print("Warning: %s: %s" % (p['name'], warning))
@@ -0,0 +1,155 @@
+"""
+Choose the number of units (files or luminosity sections) per job of a task, so that jobs last a given wall time.
+
+The estimate relies on the reports of previous tasks (see ``task_report``):
+ - the throughput (events/s) of the analyzer comes from previous tasks running the same configuration file: same
+   content if known, same path otherwise (see ``describe_pset``),
+ - the number of events per unit comes from a previous task on the same dataset or, if there is none, from all the
+   previous tasks using the same splitting.
+"""
+
+import glob
+import hashlib
+import json
+import os
+
+from cp3_llbb.GridIn.task_report import REPORT_FILE, percentile
+
+
+def describe_pset(pset):
+    """
+    Identify a configuration file, for the task reports
+    :return: a dict with the real path of ``pset`` (``pset``) and the SHA-1 of its content (``pset_hash``, None if
+             the file cannot be read)
+    """
+    try:
+        with open(pset, 'rb') as f:
+            content_hash = hashlib.sha1(f.read()).hexdigest()
+    except IOError:
+        content_hash = None
+
+    return {'pset': os.path.realpath(pset), 'pset_hash': content_hash}
+
+
+def same_pset(task, pset):
+    """
+    Check if the task of a report ran the configuration ``pset``, as returned by ``describe_pset``. Both contents are
+    compared if they are known, the paths otherwise. Reports only holding the name of the file never match, since
+    different analyzers use the same names
+    """
+    if task.get('pset_hash') and pset['pset_hash']:
+        return task['pset_hash'] == pset['pset_hash']
+    return task.get('pset') == pset['pset']
+
+
+def events_per_unit(report):
+    """
+    Return the median number of events per unit of the jobs of a task, or None if unknown
+    """
+    task = report.get('task', {})
+    values = []
+    for job in report.get('jobs_detail', []):
+        if not job.get('events'):
+            continue
+        if task.get('splitting') == 'FileBased':
+            units = job.get('files')
+        else:
+            units = task.get('units_per_job')
+        if units:
+            values.append(float(job['events']) / units)
+
+    return percentile(values, 50)
+
+
+class JobSizer(object):
+    """
+    Estimate ``units_per_job`` from the reports of previous tasks
+    """
+
+    def __init__(self, reports):
+        """
+        :param reports: list of task reports, as written by ``task_report.write_report``. Reports without task
+                        description are ignored
+        """
+        self.reports = [r for r in reports if 'task' in r]
+
+    @classmethod
+    def from_work_area(cls, work_area):
+        """
+        Load the reports of all the tasks inside ``work_area``
+        """
+        reports = []
+        for filename in sorted(glob.glob(os.path.join(work_area, '*', REPORT_FILE))):
+            try:
+                with open(filename) as f:
+                    reports.append(json.load(f))
+            except (IOError, ValueError) as e:
+                print('Warning: failed to read task report %r: %s' % (filename, e))
+
+        return cls(reports)
+
+    def throughput(self, pset):
+        """
+        Return ``(events/s, overhead, number of jobs, number of tasks)`` of the previous jobs running the configuration
+        ``pset``, using the median of the jobs. The overhead is the time spent outside of the framework.
+        Return None if there is no such job
+        """
+        pset = describe_pset(pset)
+        jobs = []
+        tasks = 0
+        for report in self.reports:
+            if not same_pset(report['task'], pset):
+                continue
+            jobs += [j for j in report.get('jobs_detail', []) if j.get('events_per_s')]
+            tasks += 1
+
+        if len(jobs) == 0:
+            return None
+
+        overhead = percentile([j['overhead'] for j in jobs if j.get('overhead') is not None], 50) or 0.
+        return (percentile([j['events_per_s'] for j in jobs], 50), overhead, len(jobs), tasks)
+
+    def events_per_unit(self, dataset, splitting):
+        """
+        Return ``(events per unit, source)`` for ``dataset``, or None if unknown
+        """
+        same_dataset = [r for r in self.reports if r['task'].get('dataset') == dataset and r['task'].get('splitting') == splitting]
+        for report in reversed(same_dataset):
+            value = events_per_unit(report)
+            if value:
+                return (value, 'task %s' % report['task'].get('name'))
+
+        values = [events_per_unit(r) for r in self.reports if r['task'].get('splitting') == splitting]
+        values = [v for v in values if v]
+        if len(values) == 0:
+            return None
+
+        return (percentile(values, 50), 'median of %d %s tasks' % (len(values), splitting))
+
+    def units_per_job(self, pset, dataset, splitting, target, default):
+        """
+        Estimate the number of units per job needed for jobs lasting ``target`` seconds
+        :param pset: the configuration file of the analyzer
+        :param dataset: the input dataset
+        :param splitting: the crab splitting mode, ``FileBased`` or ``LumiBased``
+        :param target: the target wall time of the jobs, in seconds
+        :param default: the value to use if there is not enough history
+        :return: a tuple ``(units per job, justification)``
+        """
+        throughput = self.throughput(pset)
+        if throughput is None:
+            return (default, 'no previous job with %s, keeping %d' % (os.path.basename(pset), default))
+
+        per_unit = self.events_per_unit(dataset, splitting)
+        if per_unit is None:
+            return (default, 'no previous %s task with events per unit, keeping %d' % (splitting, default))
+
+        events_per_s, overhead, n_jobs, n_tasks = throughput
+        events, source = per_unit
+
+        units = max(1, int(round(max(target - overhead, 0) * events_per_s / events)))
+
+        justification = '%.1f events/s and %.0f s overhead (median of %d jobs in %d tasks), %.0f events/unit (%s)' % (
+                events_per_s, overhead, n_jobs, n_tasks, events, source)
+
+        return (units, justification)
@@ -0,0 +1,211 @@
+"""
+Performance telemetry of a grid job, written as a JSON sidecar next to the output file and transferred with it.
+
+The sidecar holds the wall and CPU time of each phase of the job, the input files with their access method and
+size on storage, the number of bytes read and of events processed, the peak memory usage and where the job ran. The
+bytes read are only known for the whole job: neither ROOT nor the framework job report count them per input file.
+"""
+
+import json
+import os
+import resource
+import socket
+import time
+import xml.etree.ElementTree as ET
+from contextlib import contextmanager
+
+TELEMETRY_FILE = 'gridin_telemetry.json'
+
+# Version of the sidecar content, increased on incompatible changes. 3: ``size`` of the input files renamed to
+# ``file_size``, since it is not the number of bytes read from the file
+TELEMETRY_VERSION = 3
+
+
+def get_site_name():
+    """
+    Return the name of the site the job runs on, or None if it is unknown
+    """
+    from cp3_llbb.GridIn.trivial_file_catalog import get_site_local_config
+
+    site_local_config = get_site_local_config()
+    if site_local_config is not None:
+        try:
+            site = ET.parse(site_local_config).getroot().find('site')
+            if site is not None and site.get('name'):
+                return site.get('name')
+        except (IOError, ET.ParseError):
+            pass
+
+    return os.environ.get('GLIDEIN_CMSSite')
+
+
+def get_io_counters():
+    """
+    Return the I/O counters of the current process from ``/proc/self/io``, as a dict
+    """
+    counters = {}
+    try:
+        with open('/proc/self/io') as f:
+            for line in f:
+                key, value = line.split(':')
+                counters[key.strip()] = int(value)
+    except IOError:
+        pass
+
+    return counters
+
+
+def get_events_read(fjr):
+    """
+    Return the number of events read from each input file, according to the framework job report
+    :return: a dict ``file -> events``, files being indexed by both PFN and LFN. Empty if the report is not usable
+    """
+    events = {}
+    try:
+        for input_file in ET.parse(fjr).getroot().iter('InputFile'):
+            n = input_file.findtext('EventsRead')
+            if n is None:
+                continue
+            for tag in ('PFN', 'LFN'):
+                name = input_file.findtext(tag)
+                if name:
+                    events[name.strip()] = int(n)
+    except (IOError, ET.ParseError, ValueError):
+        pass
+
+    return events
+
+
+class JobTelemetry(object):
+    """
+    Collect the performance data of a job. Phases are timed with ``phase``, and everything is written by ``write``.
+    """
+
+    def __init__(self, job_number):
+        self.start = time.time()
+        self.phases = []
+        self.files = []
+        self.data = {
+                'version': TELEMETRY_VERSION,
+                'job_number': job_number,
+                'hostname': socket.getfqdn(),
+                'site': get_site_name(),
+                'start': self.start,
+                }
+
+    @contextmanager
+    def phase(self, name):
+        """
+        Measure the wall time and the CPU time (including worker processes) spent inside the block
+        """
+        start_wall = time.time()
+        start_cpu = sum(os.times()[:4])
+        try:
+            yield
+        finally:
+            self.phases.append({
+                'name': name,
+                'wall': time.time() - start_wall,
+                'cpu': sum(os.times()[:4]) - start_cpu
+                })
+
+    def set_files(self, files, accesses, redirector=None):
+        """
+        Record the input files of the job, and how each one was resolved
+        :param files: the resolved input files
+        :param accesses: the access method of each file: ``'tfc'`` for a PFN given by the trivial file catalog of the
+                         site, ``'redirector'`` for a file read through ``redirector``, or ``'input'`` for a file used
+                         as given in the job configuration
+        :param redirector: the xrootd redirector used for remote files, if any
+        """
+        self.files = [{'file': f, 'access': access} for f, access in zip(files, accesses)]
+        self.data['redirector'] = redirector
+
+    def set_staged(self, index, copy):
+        """
+        Record that the framework read the input file ``index`` from its staged copy ``copy``
+        """
+        self.files[index]['access'] = 'staged'
+        self.files[index]['staged_copy'] = copy
+
+    def _fill_file_sizes(self, timeout):
+        from multiprocessing.pool import ThreadPool
+        from cp3_llbb.GridIn.input_stager import remote_size
+
+        def size(f):
+            try:
+                if f.startswith('root://'):
+                    return remote_size(f, timeout)
+                path = f[len('file:'):] if f.startswith('file:') else f
+                return os.path.getsize(path) if os.path.isfile(path) else None
+            except (ValueError, OSError) as e:
+                print('Failed to retrieve the size of %r: %s' % (f, e))
+                return None
+
+        if len(self.files) == 0:
+            return
+
+        pool = ThreadPool(processes=min(8, len(self.files)))
+        try:
+            sizes = pool.map(size, [f['file'] for f in self.files])
+        finally:
+            pool.close()
+
+        for f, s in zip(self.files, sizes):
+            f['file_size'] = s
+
+    def finalize(self, status, fjr=None, stat_timeout=30):
+        """
+        Collect the job-level measurements, once everything has been executed
+        :param status: ``'success'`` or a description of the failure
+        :param fjr: path to the framework job report, used to retrieve the number of events read
+        :param stat_timeout: time in seconds allowed to retrieve the size on storage of a remote file
+        """
+        self.data['status'] = status
+        self.data['wall'] = time.time() - self.start
+
+        self._fill_file_sizes(stat_timeout)
+
+        events = get_events_read(fjr) if fjr is not None else {}
+        for f in self.files:
+            f['events'] = events.get(f.get('staged_copy'), events.get(f['file']))
+        self.data['events'] = None
+        if len(events) > 0:
+            # Not the sum of ``events``: files are indexed by both PFN and LFN
+            self.data['events'] = sum([f['events'] for f in self.files if f['events'] is not None])
+
+        try:
+            import ROOT
+            root_bytes = ROOT.TFile.GetFileBytesRead()
+        except Exception:
+            root_bytes = None
+        io = get_io_counters()
+        self.data['bytes_read'] = {
+                'root': root_bytes,
+                'storage': io.get('read_bytes'),
+                'total': io.get('rchar')
+                }
+
+        # ``ru_maxrss`` is in kB on Linux
+        self.data['peak_rss_mb'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.
+        self.data['peak_rss_children_mb'] = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024.
+
+    def write(self, filename=TELEMETRY_FILE):
+        """
+        Write the sidecar. It is an output file of the job, so a sidecar is always written: if the measurements cannot
+        be serialized, it only holds the job number, the status and the error
+        """
+        self.data['phases'] = self.phases
+        self.data['files'] = self.files
+        try:
+            content = json.dumps(self.data, indent=2, sort_keys=True)
+        except (TypeError, ValueError) as e:
+            content = json.dumps({
+                'version': TELEMETRY_VERSION,
+                'job_number': self.data['job_number'],
+                'status': self.data.get('status'),
+                'error': 'Failed to serialize the telemetry: %s' % e
+                }, indent=2, sort_keys=True)
+
+        with open(filename, 'w') as f:
+            f.write(content)
@@ -0,0 +1,159 @@
+"""
+Compact representation of sets of luminosity sections, as sorted arrays of intervals.
+
+Each luminosity section ``(run, lumi)`` is encoded as a single 64 bits integer, so that a whole set is two sorted NumPy
+arrays holding the first and last luminosity section of each interval. Set operations are sweeps over the sorted
+interval bounds, in O(n log n), without ever expanding the intervals into individual luminosity sections.
+"""
+
+import numpy as np
+
+LUMI_BITS = 32
+
+
+def _encode(run, lumi):
+    return (np.asarray(run, dtype=np.int64) << LUMI_BITS) | np.asarray(lumi, dtype=np.int64)
+
+
+def _normalize(starts, ends):
+    """
+    Sort the intervals, and merge the overlapping or adjacent ones
+    """
+    if len(starts) == 0:
+        return (np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64))
+
+    order = np.argsort(starts, kind='mergesort')
+    starts = starts[order]
+    ends = np.maximum.accumulate(ends[order])
+
+    # A new interval begins where the start is after the end of everything before, plus one
+    new = np.ones(len(starts), dtype=bool)
+    new[1:] = starts[1:] > ends[:-1] + 1
+    first = np.flatnonzero(new)
+    last = np.r_[first[1:] - 1, len(starts) - 1]
+
+    return (starts[first], ends[last])
+
+
+def _combine(a, b, predicate):
+    """
+    Sweep over the bounds of the intervals of ``a`` and ``b``, keeping the ranges where ``predicate(in_a, in_b)`` is True
+    """
+    n_a, n_b = len(a.starts), len(b.starts)
+    positions = np.concatenate((a.starts, a.ends + 1, b.starts, b.ends + 1))
+    delta_a = np.concatenate((np.ones(n_a, dtype=np.int8), -np.ones(n_a, dtype=np.int8), np.zeros(2 * n_b, dtype=np.int8)))
+    delta_b = np.concatenate((np.zeros(2 * n_a, dtype=np.int8), np.ones(n_b, dtype=np.int8), -np.ones(n_b, dtype=np.int8)))
+
+    if len(positions) == 0:
+        return LumiIntervals()
+
+    order = np.argsort(positions, kind='mergesort')
+    positions = positions[order]
+    in_a = np.cumsum(delta_a[order]) > 0
+    in_b = np.cumsum(delta_b[order]) > 0
+
+    # Only the state after the last bound at a given position matters
+    last = np.r_[positions[1:] != positions[:-1], True]
+    positions, in_a, in_b = positions[last], in_a[last], in_b[last]
+
+    # The state at index i holds between positions[i] and positions[i + 1] - 1
+    selected = predicate(in_a, in_b)[:-1]
+
+    return LumiIntervals(*_normalize(positions[:-1][selected], positions[1:][selected] - 1))
+
+
+class LumiIntervals(object):
+    """
+    An immutable set of luminosity sections
+    """
+
+    def __init__(self, starts=None, ends=None):
+        """
+        :param starts: encoded first luminosity section of each interval, sorted. The intervals must be disjoint and not
+                       adjacent: use the ``from_*`` methods to build a set from arbitrary intervals
+        :param ends: encoded last luminosity section of each interval
+        """
+        self.starts = np.zeros(0, dtype=np.int64) if starts is None else starts
+        self.ends = np.zeros(0, dtype=np.int64) if ends is None else ends
+
+    @classmethod
+    def from_intervals(cls, runs, firsts, lasts):
+        """
+        Build a set from arbitrary intervals, in any order: ``[firsts[i], lasts[i]]`` inside run ``runs[i]``
+        """
+        return cls(*_normalize(_encode(runs, firsts), _encode(runs, lasts)))
+
+    @classmethod
+    def run_range(cls, first, last):
+        """
+        All the luminosity sections of the runs ``first`` to ``last``, included
+        """
+        return cls(_encode([first], [0]), _encode([last], [(1 << LUMI_BITS) - 1]))
+
+    @classmethod
+    def from_compact_list(cls, compact_list):
+        """
+        Build a set from the CMS compact list format, ``{"run": [[first, last], ...], ...}``
+        """
+        runs = []
+        bounds = []
+        for run, intervals in compact_list.items():
+            runs += [int(run)] * len(intervals)
+            bounds += intervals
+
+        bounds = np.array(bounds, dtype=np.int64).reshape(-1, 2)
+        return cls.from_intervals(np.array(runs, dtype=np.int64), bounds[:, 0], bounds[:, 1])
+
+    @classmethod
+    def union_all(cls, sets):
+        """
+        Union of many sets at once, faster than successive unions
+        """
+        sets = list(sets)
+        if len(sets) == 0:
+            return cls()
+        return cls(*_normalize(np.concatenate([s.starts for s in sets]), np.concatenate([s.ends for s in sets])))
+
+    def to_compact_list(self):
+        """
+        Convert to the CMS compact list format. Runs are strings, like in the JSON files
+        """
+        runs = self.starts >> LUMI_BITS
+        mask = (1 << LUMI_BITS) - 1
+        firsts = (self.starts & mask).tolist()
+        lasts = (self.ends & mask).tolist()
+
+        compact_list = {}
+        for run, first, last in zip(runs.tolist(), firsts, lasts):
+            compact_list.setdefault(str(run), []).append([first, last])
+
+        return compact_list
+
+    def runs(self):
+        return np.unique(self.starts >> LUMI_BITS).tolist()
+
+    def __len__(self):
+        """
+        The number of luminosity sections
+        """
+        return int(np.sum(self.ends - self.starts + 1))
+
+    def __contains__(self, run_lumi):
+        key = _encode(*run_lumi)
+        i = np.searchsorted(self.starts, key, side='right') - 1
+        return bool(i >= 0 and self.ends[i] >= key)
+
+    def __eq__(self, other):
+        return np.array_equal(self.starts, other.starts) and np.array_equal(self.ends, other.ends)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __or__(self, other):
+        return LumiIntervals.union_all([self, other])
+
+    def __and__(self, other):
+        return _combine(self, other, lambda in_a, in_b: in_a & in_b)
+
+    def __sub__(self, other):
+        return _combine(self, other, lambda in_a, in_b: in_a & ~in_b)
@@ -0,0 +1,313 @@
+"""
+Minimal pure Python reader of ROOT files, able to list the keys of the top directory, and to read the value of
+``TParameter`` objects and the number of entries of ``TTree`` objects, without loading ROOT.
+
+Only the needed parts of the file are read: the header, the key list of the top directory, and the beginning of the
+requested objects. Remote files are read with the XRootD Python bindings. Anything this reader does not handle (a
+compression algorithm whose Python module is missing, an unexpected class, ...) raises ``UnsupportedFile``: the caller
+is expected to use ROOT instead.
+"""
+
+import collections
+import os
+import struct
+import zlib
+
+from cp3_llbb.GridIn.common import split_url
+
+# Flag of the byte count preceding a streamed object
+BYTE_COUNT_MASK = 0x40000000
+# Flag of an old-style TObject version, followed by 4 extra bytes
+VERSION_BYTE_COUNT_MASK = 0x4000
+# TObject bit set when the object is referenced, in which case its process id is streamed too
+IS_REFERENCED = 1 << 4
+
+# Size of the header of a compressed block: algorithm (2), method (1), compressed size (3), uncompressed size (3)
+BLOCK_HEADER_SIZE = 9
+
+PARAMETER_FORMATS = {
+        'TParameter<double>': '>d',
+        'TParameter<float>': '>f',
+        'TParameter<int>': '>i',
+        'TParameter<long>': '>q',
+        'TParameter<Long64_t>': '>q',
+        'TParameter<long long>': '>q',
+        'TParameter<bool>': '>?',
+        }
+
+Key = collections.namedtuple('Key', ['name', 'cycle', 'class_name', 'nbytes', 'objlen', 'keylen', 'seek'])
+
+
+class UnsupportedFile(Exception):
+    """
+    The file, or one of its objects, can not be read without ROOT
+    """
+    pass
+
+
+def is_remote(path):
+    return path.startswith('root://')
+
+
+def stat(path):
+    """
+    Return ``(size, modification time)`` of a file, like ``TSystem::GetPathInfo``, or None if it's not available
+    """
+    if not is_remote(path):
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        return (st.st_size, int(st.st_mtime))
+
+    try:
+        from XRootD import client
+    except ImportError:
+        raise UnsupportedFile('the XRootD Python bindings are needed for remote files')
+
+    server, path = split_url(path)
+    status, info = client.FileSystem(server).stat(path)
+    if not status.ok:
+        return None
+    return (info.size, info.modtime)
+
+
+class LocalSource(object):
+    def __init__(self, path):
+        self.file = open(path, 'rb')
+
+    def read(self, offset, size):
+        self.file.seek(offset)
+        return self.file.read(size)
+
+    def close(self):
+        self.file.close()
+
+
+class XRootDSource(object):
+    def __init__(self, url):
+        try:
+            from XRootD import client
+        except ImportError:
+            raise UnsupportedFile('the XRootD Python bindings are needed for remote files')
+
+        self.url = url
+        self.file = client.File()
+        status, _ = self.file.open(url)
+        if not status.ok:
+            raise IOError('Failed to open %r: %s' % (url, status.message))
+
+    def read(self, offset, size):
+        status, data = self.file.read(offset, size)
+        if not status.ok:
+            raise IOError('Failed to read %r: %s' % (self.url, status.message))
+        return data
+
+    def close(self):
+        self.file.close()
+
+
+class Cursor(object):
+    """
+    Sequential reading of big-endian fields from a buffer
+    """
+
+    def __init__(self, data, pos=0):
+        self.data = data
+        self.pos = pos
+
+    def fields(self, fmt):
+        values = struct.unpack_from(fmt, self.data, self.pos)
+        self.pos += struct.calcsize(fmt)
+        return values
+
+    def field(self, fmt):
+        return self.fields(fmt)[0]
+
+    def string(self):
+        length = self.field('>B')
+        if length == 255:
+            length = self.field('>i')
+        if self.pos + length > len(self.data):
+            raise struct.error('string out of the buffer')
+        value = self.data[self.pos:self.pos + length]
+        self.pos += length
+        return value
+
+    def version(self):
+        """
+        Read the header of a streamed object
+        :return: a tuple ``(version, end)``, ``end`` being the position after the object, or None if the object has no
+                 byte count
+        """
+        start = self.pos
+        count = self.field('>I')
+        if not count & BYTE_COUNT_MASK:
+            self.pos = start
+            return (self.field('>h'), None)
+        return (self.field('>h'), start + 4 + (count & ~BYTE_COUNT_MASK))
+
+    def skip_tobject(self):
+        version = self.field('>h')
+        if version & VERSION_BYTE_COUNT_MASK:
+            self.pos += 4
+        unique_id, bits = self.fields('>II')
+        if bits & IS_REFERENCED:
+            self.pos += 2
+
+
+def read_key(cursor):
+    nbytes, version, objlen, datime, keylen, cycle = cursor.fields('>ihiIhh')
+    # Large files use 64 bits pointers
+    seek, seek_dir = cursor.fields('>qq' if version > 1000 else '>ii')
+    class_name = cursor.string()
+    name = cursor.string()
+    cursor.string()  # title
+    return Key(name, cycle, class_name, nbytes, objlen, keylen, seek)
+
+
+def decompress_block(algorithm, data, size):
+    """
+    Decompress a block of ``size`` bytes, compressed with ``algorithm``
+    """
+    if algorithm == 'ZL':
+        return zlib.decompress(data)
+
+    try:
+        if algorithm == 'XZ':
+            try:
+                import lzma
+            except ImportError:
+                from backports import lzma
+            return lzma.decompress(data)
+        if algorithm == 'L4':
+            import lz4.block
+            # The compressed data follow an 8 bytes checksum
+            return lz4.block.decompress(data[8:], uncompressed_size=size)
+        if algorithm == 'ZS':
+            import zstandard
+            return zstandard.ZstdDecompressor().decompress(data, max_output_size=size)
+    except ImportError as e:
+        raise UnsupportedFile('no Python module to decompress %r blocks: %s' % (algorithm, e))
+
+    raise UnsupportedFile('unknown compression algorithm %r' % algorithm)
+
+
+class RootFile(object):
+    """
+    The objects of the top directory of a ROOT file. Like ``TFile::Get``, only the highest cycle of each name is used
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.source = XRootDSource(path) if is_remote(path) else LocalSource(path)
+        try:
+            self.keys = self._read_keys()
+        except:
+            self.close()
+            raise
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        self.source.close()
+
+    def _read_keys(self):
+        header = self.source.read(0, 64)
+        if header[:4] != 'root':
+            raise IOError('%r is not a ROOT file' % self.path)
+
+        cursor = Cursor(header, 4)
+        version, begin = cursor.fields('>ii')
+        cursor.fields('>qq' if version >= 1000000 else '>ii')  # end, seek_free
+        nbytes_free, nfree, nbytes_name = cursor.fields('>iii')
+
+        # The top directory follows the key, name and title of the file
+        cursor = Cursor(self.source.read(begin + nbytes_name, 64))
+        version, ctime, mtime, nbytes_keys, nbytes_name = cursor.fields('>hIIii')
+        seek_dir, seek_parent, seek_keys = cursor.fields('>qqq' if version > 1000 else '>iii')
+
+        # The key list is a key, followed by the number of keys and the keys
+        cursor = Cursor(self.source.read(seek_keys, nbytes_keys))
+        cursor.pos = read_key(cursor).keylen
+        keys = {}
+        for i in range(cursor.field('>i')):
+            key = read_key(cursor)
+            if key.name not in keys or key.cycle > keys[key.name].cycle:
+                keys[key.name] = key
+
+        return keys
+
+    def read_object(self, key, size=None):
+        """
+        Return the first ``size`` bytes of the streamed object of ``key``, uncompressed, or the whole object if None
+        """
+        if size is None or size > key.objlen:
+            size = key.objlen
+
+        pos = key.seek + key.keylen
+        end = key.seek + key.nbytes
+        if key.nbytes - key.keylen == key.objlen:
+            return self.source.read(pos, size)
+
+        # Only the blocks needed are read
+        blocks = []
+        length = 0
+        while length < size and pos < end:
+            header = map(ord, self.source.read(pos, BLOCK_HEADER_SIZE))
+            compressed_size = header[3] | header[4] << 8 | header[5] << 16
+            uncompressed_size = header[6] | header[7] << 8 | header[8] << 16
+            block = decompress_block(chr(header[0]) + chr(header[1]),
+                                     self.source.read(pos + BLOCK_HEADER_SIZE, compressed_size), uncompressed_size)
+            blocks.append(block)
+            length += len(block)
+            pos += BLOCK_HEADER_SIZE + compressed_size
+
+        return ''.join(blocks)[:size]
+
+    def parameter(self, name):
+        """
+        Return the value of the ``TParameter`` named ``name``, or None if there is no such object
+        """
+        key = self.keys.get(name)
+        if key is None:
+            return None
+        if key.class_name not in PARAMETER_FORMATS:
+            raise UnsupportedFile('%s is a %s, not a known TParameter' % (name, key.class_name))
+
+        cursor = Cursor(self.read_object(key))
+        cursor.version()
+        cursor.skip_tobject()
+        cursor.string()  # name
+        return cursor.field(PARAMETER_FORMATS[key.class_name])
+
+    def tree_entries(self, name, size=1024):
+        """
+        Return the number of entries of the ``TTree`` named ``name``, or None if there is no such object
+        """
+        key = self.keys.get(name)
+        if key is None:
+            return None
+        if key.class_name != 'TTree':
+            raise UnsupportedFile('%s is a %s, not a TTree' % (name, key.class_name))
+
+        # The number of entries follows the TNamed, TAttLine, TAttFill and TAttMarker base classes. Only the beginning
+        # of the tree is read, unless its title is very long
+        while True:
+            cursor = Cursor(self.read_object(key, size))
+            try:
+                cursor.version()
+                for base in range(4):
+                    _, end = cursor.version()
+                    if end is None:
+                        raise UnsupportedFile('%s: base class streamed without byte count' % name)
+                    cursor.pos = end
+                return cursor.field('>q')
+            except struct.error:
+                if size >= key.objlen:
+                    raise IOError('%s: truncated TTree' % name)
+                size = key.objlen
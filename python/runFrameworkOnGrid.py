@@ -9,10 +9,16 @@ It extracts the list of files to run over, as well as the number of events, and
 
 def decode_lfn(lfn):
     """
-    Convert LFN to PFN. To do that, call ``edmFileUtil``
+    Convert LFN to PFN, using the trivial file catalog of the site. Fall back to ``edmFileUtil`` if the catalog
+    cannot handle the LFN
     :param lfn:
     :return:
     """
+    from cp3_llbb.GridIn.trivial_file_catalog import lfn_to_pfn
+    pfn = lfn_to_pfn(lfn)
+    if pfn is not None:
+        return pfn
+
     import subprocess
     arg = ['edmFileUtil', '-d', lfn]
     return subprocess.check_output(arg).strip().replace('\n', '')
@@ -34,12 +40,215 @@ def test_root_open(f):
 
     return ret
 
+# Entry of the list of redirectors standing for the xrootd server of the site, given by the site catalog
+SITE_REDIRECTOR = 'site'
+
+# Used for the files no other redirector can serve
+GLOBAL_REDIRECTOR = 'root://cms-xrd-global.cern.ch/'
+
+# Redirectors probed when an input file is not locally accessible: site, global, then regionals
+DEFAULT_REDIRECTORS = [SITE_REDIRECTOR, GLOBAL_REDIRECTOR, 'root://xrootd-cms.infn.it/', 'root://cmsxrootd.fnal.gov/']
+
+# Redirector chosen for the whole job, see ``select_redirector``
+selected_redirector = None
+
+def timed_root_open(f, started=None, index=None):
+    """
+    Open file ``f`` with ROOT
+    :param f:
+    :param started: shared dict where the start of the job ``index`` is recorded, for its timeout
+    :return: the time in seconds needed to open the file, or None if it cannot be opened
+    """
+    import ROOT
+    import time
+    from cp3_llbb.GridIn.common import mark_started
+
+    mark_started(started, index)
+
+    ROOT.gErrorIgnoreLevel = ROOT.kFatal
+    start = time.time()
+    tfile = ROOT.TFile.Open(f)
+    if not tfile:
+        return None
+    elapsed = time.time() - start
+    tfile.Close()
+
+    return elapsed
+
+def redirector_url(redirector, lfn):
+    """
+    Return the URL to read ``lfn`` through ``redirector``
+    :param redirector: an xrootd redirector, or ``SITE_REDIRECTOR`` for the server given by the ``xrootd`` rules of the
+                       site catalog
+    :return: the URL, or None if the site catalog has no ``xrootd`` rule for ``lfn``
+    """
+    if redirector != SITE_REDIRECTOR:
+        return redirector + lfn
+
+    from cp3_llbb.GridIn.trivial_file_catalog import lfn_to_pfn
+    pfn = lfn_to_pfn(lfn, 'xrootd')
+    return pfn if pfn is not None and pfn.startswith('root://') else None
+
+def select_redirector(lfn, redirectors, timeout):
+    """
+    Choose the xrootd redirector used to read remote files, by opening ``lfn`` through each of ``redirectors``
+    concurrently, and keeping the fastest one. The choice is done only once per job.
+    :param lfn: a file not available locally
+    :param redirectors: list of redirectors to probe, in order of preference, see ``redirector_url``
+    :param timeout: time in seconds allowed to each redirector to open the file
+    :return:
+    """
+    global selected_redirector
+    if selected_redirector is not None:
+        return selected_redirector
+
+    from multiprocessing import Manager, Pool
+    from cp3_llbb.GridIn.common import wait_with_deadlines
+
+    redirectors = [r for r in redirectors if redirector_url(r, lfn) is not None]
+    if len(redirectors) == 0:
+        selected_redirector = GLOBAL_REDIRECTOR
+        print('No redirector can be used, using %s' % selected_redirector)
+        return selected_redirector
+
+    # Each redirector has ``timeout`` seconds from the moment its worker actually starts
+    manager = Manager()
+    pool = Pool(processes=len(redirectors))
+    try:
+        started = manager.dict()
+        async_results = [pool.apply_async(timed_root_open, (redirector_url(redirector, lfn), started, i))
+                         for i, redirector in enumerate(redirectors)]
+        results, timed_out = wait_with_deadlines(async_results, started, timeout)
+    finally:
+        pool.terminate()
+        pool.join()
+        manager.shutdown()
+
+    latencies = []
+    for i, (redirector, latency) in enumerate(zip(redirectors, results)):
+        if latency is not None:
+            latencies.append((latency, redirector))
+            status = '%.2f s' % latency
+        else:
+            status = 'timeout' if i in timed_out else 'failed'
+        print('Opening %r through %s: %s' % (lfn, redirector, status))
+
+    if len(latencies) > 0:
+        selected_redirector = min(latencies)[1]
+    else:
+        print('No redirector answered, using the first one')
+        selected_redirector = redirectors[0]
+
+    print('Using redirector %s for remote files' % selected_redirector)
+
+    return selected_redirector
+
+def resolve_file(lfn, started=None, index=None):
+    """
+    Find the local PFN of ``lfn``
+    :param lfn:
+    :param started: shared dict where the start of the job ``index`` is recorded, for its timeout
+    :return: the PFN if ROOT can open it, None otherwise
+    """
+    from cp3_llbb.GridIn.common import mark_started
+
+    mark_started(started, index)
+    try:
+        pfn = decode_lfn(lfn)
+        if test_root_open(pfn):
+            return pfn
+    except Exception as e:
+        print('Failed to check if %r is locally accessible: %s' % (lfn, e))
+
+    return None
+
+def resolve_files(files, processes, timeout, redirectors, redirector_timeout, telemetry):
+    """
+    Resolve concurrently all the LFNs of ``files``, keeping the same order. Other files are left untouched.
+    ROOT is not thread-friendly, hence processes and not threads.
+    LFNs not locally accessible are read through the fastest of ``redirectors``.
+    :param files:
+    :param processes: number of files resolved concurrently
+    :param timeout: time in seconds allowed to resolve one file, before falling back to xrootd
+    :param redirectors: xrootd redirectors, see ``select_redirector``
+    :param redirector_timeout: time in seconds allowed to each redirector to open a file
+    :param telemetry: the ``JobTelemetry`` of the job, used to time resolution and redirector probing
+    :return: a tuple ``(files, accesses)``: the resolved files, and how each one was resolved, see
+             ``JobTelemetry.set_files``
+    """
+    from multiprocessing import Manager, Pool
+    from cp3_llbb.GridIn.common import wait_with_deadlines
+    from cp3_llbb.GridIn.trivial_file_catalog import get_site_catalog
+
+    lfns = [f for f in files if f.startswith('/store')]
+    if len(lfns) == 0:
+        return list(files), ['input'] * len(files)
+
+    resolved = {}
+    accesses = {}
+    with telemetry.phase('resolution'):
+        # Parse the catalog only once, before creating the workers
+        get_site_catalog()
+
+        # Each file has ``timeout`` seconds from the moment a worker actually starts checking it: the files still
+        # queued behind slow ones do not time out
+        manager = Manager()
+        pool = Pool(processes=min(processes, len(lfns)))
+        try:
+            started = manager.dict()
+            async_results = [pool.apply_async(resolve_file, (lfn, started, i)) for i, lfn in enumerate(lfns)]
+            results, timed_out = wait_with_deadlines(async_results, started, timeout)
+        finally:
+            pool.terminate()
+            pool.join()
+            manager.shutdown()
+
+        for i, lfn in enumerate(lfns):
+            if i in timed_out:
+                print('Timeout while checking if %r is locally accessible' % lfn)
+            resolved[lfn] = results[i]
+
+    with telemetry.phase('probing'):
+        for lfn in lfns:
+            if resolved[lfn] is None:
+                resolved[lfn] = redirector_url(select_redirector(lfn, redirectors, redirector_timeout), lfn)
+                if resolved[lfn] is None:
+                    # The server of the site was chosen, but the site catalog has no xrootd rule for this file
+                    resolved[lfn] = redirector_url(GLOBAL_REDIRECTOR, lfn)
+                accesses[lfn] = 'redirector'
+            else:
+                accesses[lfn] = 'tfc'
+
+    return [resolved.get(f, f) for f in files], [accesses.get(f, 'input') for f in files]
+
 import argparse
 parser = argparse.ArgumentParser(description='Execute the framework on a remote cluster')
 parser.add_argument('job_number', metavar='N', type=int, help='The current job number')
 parser.add_argument('configuration', type=str, help='Analysis configuration file')
+parser.add_argument('--resolve-processes', type=int, default=8, metavar='N',
+                    help='Number of input files resolved and checked concurrently')
+parser.add_argument('--resolve-timeout', type=int, default=120, metavar='SECONDS',
+                    help='Time allowed to check if an input file is locally accessible')
+parser.add_argument('--redirectors', type=str, default=','.join(DEFAULT_REDIRECTORS), metavar='URLS',
+                    help='Comma-separated list of xrootd redirectors to choose from for files not locally accessible. '
+                         '%r stands for the xrootd server of the site, from the site catalog' % SITE_REDIRECTOR)
+parser.add_argument('--redirector-timeout', type=int, default=30, metavar='SECONDS',
+                    help='Time allowed to each redirector to open a file')
+parser.add_argument('--stage', action='store_true',
+                    help='Copy remote input files to local scratch space in the background, while earlier files are processed')
+parser.add_argument('--stage-dir', type=str, default='gridin_staging', metavar='DIR',
+                    help='Scratch directory used to stage remote input files')
+parser.add_argument('--stage-budget', type=int, default=10000, metavar='MB',
+                    help='Maximum disk space used by staged files. Staging is disabled if it cannot hold two files')
 
-args = parser.parse_args()
+# Options crab can give as ``key=value`` script arguments, see ``runOnGrid.py``
+SCRIPT_ARG_FLAGS = ['stage']
+SCRIPT_ARG_OPTIONS = ['stage_dir', 'stage_budget', 'resolve_processes', 'resolve_timeout', 'redirectors',
+                      'redirector_timeout']
+
+import sys
+from cp3_llbb.GridIn.common import script_args_to_options
+args = parser.parse_args(script_args_to_options(sys.argv[1:], SCRIPT_ARG_FLAGS, SCRIPT_ARG_OPTIONS))
 
 import PSet
 
@@ -48,20 +257,19 @@ files = list(PSet.process.source.fileNames)
 lumi_mask = PSet.process.source.lumisToProcess if hasattr(PSet.process.source, 'lumisToProcess') else None
 n_events = PSet.process.maxEvents.input
 
-absolute_files = []
-for file in files:
-    if file.startswith('/store'):
+from cp3_llbb.GridIn.job_telemetry import JobTelemetry
+telemetry = JobTelemetry(args.job_number)
 
-        # Check if the file is locally accessible
-        pfn = decode_lfn(file)
-        if test_root_open(pfn):
-            absolute_files.append(pfn)
-        else:
-            absolute_files.append('root://xrootd-cms.infn.it/%s' % file)
+import time
+start = time.time()
 
-    else:
-        absolute_files.append(file)
+# Check if the files are locally accessible
+absolute_files, accesses = resolve_files(files, args.resolve_processes, args.resolve_timeout,
+                                         args.redirectors.split(','), args.redirector_timeout, telemetry)
+telemetry.set_files(absolute_files, accesses, selected_redirector)
 
+print('')
+print('Input files resolved in %.1f s' % (time.time() - start))
 print('')
 
 # Dump variable to stdout for debugging purpose:
@@ -69,11 +277,27 @@ import pprint
 print('Input files:')
 pprint.pprint(absolute_files)
 
+if selected_redirector is not None:
+    print('xrootd redirector: %s' % selected_redirector)
+
 print('Number of events: %s' % str(n_events))
 
 if lumi_mask is not None:
     print('Lumi mask: %s' % str(lumi_mask))
 
+stager = None
+framework_files = absolute_files
+if args.stage:
+    from cp3_llbb.GridIn.input_stager import InputStager
+    with telemetry.phase('staging'):
+        stager = InputStager(args.stage_dir, args.stage_budget * 1000000)
+        telemetry.data['staging'] = stager.start(absolute_files, args.resolve_processes)
+    if telemetry.data['staging']:
+        # Remote files are replaced by their staged copy, if it is complete when the framework asks for them
+        framework_files = stager.files
+    else:
+        print('Remote input files are read directly')
+
 print('')
 print('Running framework.')
 print('')
@@ -82,5 +306,41 @@ print('')
 import Framework
 
 # Let's go!
-Framework.run(configuration_file, absolute_files, 'output.root', n_events, 'FrameworkJobReport.xml',
-              lumi_mask=lumi_mask)
+status = 'failed'
+framework_start = time.time()
+try:
+    with telemetry.phase('framework'):
+        Framework.run(configuration_file, framework_files, 'output.root', n_events, 'FrameworkJobReport.xml',
+                      lumi_mask=lumi_mask)
+    status = 'success'
+finally:
+    if stager is not None:
+        stager.stop()
+
+    # A failure of the telemetry must neither hide an error of the framework, nor fail a successful job
+    try:
+        if stager is not None and telemetry.data['staging']:
+            for index, copy in stager.files.staged_copies().items():
+                telemetry.set_staged(index, copy)
+
+            # Staging only helps if the framework asks for each file when it opens it
+            from cp3_llbb.GridIn.input_stager import POLL_INTERVAL
+            delays = stager.files.request_delays(framework_start)
+            telemetry.data['input_requests'] = delays
+            print('Input files asked for by the framework after (s): %s' %
+                  ', '.join(['%.1f' % d if d is not None else 'never' for d in delays]))
+            asked = [d for d in delays if d is not None]
+            if len(asked) > 1 and max(asked) - min(asked) < POLL_INTERVAL:
+                print('Warning: the framework asked for all its input files at once, nothing could be staged')
+
+        telemetry.finalize(status, 'FrameworkJobReport.xml')
+    except Exception as e:
+        print('Warning: failed to collect the job telemetry: %s' % e)
+        telemetry.data['status'] = status
+        telemetry.data['error'] = 'Failed to collect the job telemetry: %s' % e
+
+    # Always written, since it is an output file of the job
+    try:
+        telemetry.write()
+    except (IOError, OSError) as e:
+        print('Warning: failed to write the job telemetry: %s' % e)
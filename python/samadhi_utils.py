@@ -0,0 +1,206 @@
+"""
+Helpers to efficiently read and write SAMADhi tables, working directly on a Storm store.
+"""
+
+import json
+import time
+
+FILE_TABLE = 'file'
+FILE_COLUMNS = ('lfn', 'pfn', 'event_weight_sum', 'extras_event_weight_sum', 'nevents')
+
+# Number of rows inserted per statement. Keeps the number of parameters below the SQLite limit (999)
+INSERT_BATCH_SIZE = 150
+
+
+def sample_name(request_name, fw_hash, ana_repo, ana_hash):
+    """
+    Name of the sample produced by a crab task, given the versions of the framework and of the analyzer
+    """
+    return request_name + '_' + fw_hash + '_' + ana_repo + '_' + ana_hash
+
+
+def insert_files(dbstore, sample_id, files, batch_size=INSERT_BATCH_SIZE):
+    """
+    Insert files in the ``file`` table using multi-row inserts.
+    The changes are not committed.
+    :param dbstore: a Storm store
+    :param sample_id: the id of the sample the files belong to
+    :param files: list of ``(lfn, pfn, event_weight_sum, extras_event_weight_sum, nevents)``
+    :param batch_size: number of rows inserted by each statement
+    """
+    columns = ('sample_id',) + FILE_COLUMNS
+    row_marks = '(%s)' % ', '.join(['?'] * len(columns))
+
+    for i in range(0, len(files), batch_size):
+        batch = files[i:i + batch_size]
+        statement = 'INSERT INTO %s (%s) VALUES %s' % (FILE_TABLE, ', '.join(columns), ', '.join([row_marks] * len(batch)))
+        params = []
+        for f in batch:
+            params.append(sample_id)
+            params.extend(f)
+        dbstore.execute(statement, params, noresult=True)
+
+
+def sync_files(dbstore, sample_id, files, batch_size=INSERT_BATCH_SIZE):
+    """
+    Make the content of the ``file`` table for a sample equal to ``files``.
+    Existing rows are compared by LFN: unchanged rows are kept, modified rows are updated, rows not in ``files`` are
+    deleted and new files are inserted in bulk. The changes are not committed.
+    :param dbstore: a Storm store. Pending changes are flushed first, so that the sample id is known
+    :param sample_id: the id of the sample the files belong to
+    :param files: list of ``(lfn, pfn, event_weight_sum, extras_event_weight_sum, nevents)``
+    :return: a tuple ``(inserted, updated, deleted)`` with the number of affected rows
+    """
+    dbstore.flush()
+
+    existing = {}
+    result = dbstore.execute('SELECT id, %s FROM %s WHERE sample_id = ?' % (', '.join(FILE_COLUMNS), FILE_TABLE), (sample_id,))
+    for row in result:
+        existing[row[1]] = (row[0], tuple(row[1:]))
+
+    to_insert = []
+    to_update = []
+    for f in files:
+        f = tuple(f)
+        if f[0] not in existing:
+            to_insert.append(f)
+            continue
+
+        file_id, content = existing.pop(f[0])
+        if content != f:
+            to_update.append((file_id, f))
+
+    to_delete = [file_id for file_id, _ in existing.values()]
+
+    for i in range(0, len(to_delete), batch_size):
+        batch = to_delete[i:i + batch_size]
+        dbstore.execute('DELETE FROM %s WHERE id IN (%s)' % (FILE_TABLE, ', '.join(['?'] * len(batch))), batch, noresult=True)
+
+    update_statement = 'UPDATE %s SET %s WHERE id = ?' % (FILE_TABLE, ', '.join(['%s = ?' % c for c in FILE_COLUMNS]))
+    for file_id, f in to_update:
+        dbstore.execute(update_statement, list(f) + [file_id], noresult=True)
+
+    insert_files(dbstore, sample_id, to_insert, batch_size)
+
+    return (len(to_insert), len(to_update), len(to_delete))
+
+
+def copy_files(dbstore, source_sample_ids, sample_id):
+    """
+    Replace the files of a sample by copies of the files of other samples, using one ``INSERT ... SELECT`` per source
+    sample. Files are copied in the order of ``source_sample_ids``. The changes are not committed.
+    :param dbstore: a Storm store
+    :param source_sample_ids: the ids of the samples whose files are copied
+    :param sample_id: the id of the sample receiving the files
+    :return: the number of copied files
+    """
+    dbstore.execute('DELETE FROM %s WHERE sample_id = ?' % FILE_TABLE, (sample_id,), noresult=True)
+
+    columns = ', '.join(FILE_COLUMNS)
+    copied = 0
+    for source_sample_id in source_sample_ids:
+        result = dbstore.execute('INSERT INTO %s (sample_id, %s) SELECT ?, %s FROM %s WHERE sample_id = ? ORDER BY id' % (
+            FILE_TABLE, columns, columns, FILE_TABLE), (sample_id, source_sample_id))
+        copied += result.rowcount
+        result.close()
+
+    return copied
+
+
+def sum_samples(dbstore, sample_ids):
+    """
+    Sum the content of several samples, for merging.
+    The event counts are summed by an aggregate query. The floating-point and JSON columns are retrieved by a single
+    query and summed in the order of ``sample_ids``, so that the result does not depend on the order chosen by the
+    database.
+    :return: a dict with the sums of ``nevents_processed``, ``nevents``, ``event_weight_sum``,
+             ``extras_event_weight_sum`` (a dict), the events of the parent datasets (``dataset_nevents``) and the list
+             of the ``processed_lumi`` of the samples, as compact lists, in order
+    """
+    marks = ', '.join(['?'] * len(sample_ids))
+
+    nevents_processed, nevents, dataset_nevents = dbstore.execute(
+            'SELECT SUM(s.nevents_processed), SUM(s.nevents), SUM(d.nevents) FROM sample s '
+            'JOIN dataset d ON d.dataset_id = s.source_dataset_id WHERE s.sample_id IN (%s)' % marks, sample_ids).get_one()
+
+    rows = dict((row[0], row[1:]) for row in dbstore.execute(
+            'SELECT sample_id, event_weight_sum, extras_event_weight_sum, processed_lumi FROM sample '
+            'WHERE sample_id IN (%s)' % marks, sample_ids))
+
+    event_weight_sum = 0
+    extras_event_weight_sum = {}
+    processed_lumi = []
+    for sample_id in sample_ids:
+        sumw, extras_sumw, lumi = rows[sample_id]
+        event_weight_sum += sumw
+        if extras_sumw is not None:
+            extras_sumw = json.loads(extras_sumw)
+            for key in extras_sumw:
+                extras_event_weight_sum[key] = extras_event_weight_sum.get(key, 0) + extras_sumw[key]
+        if lumi is not None:
+            processed_lumi.append(json.loads(lumi))
+
+    return {
+            'nevents_processed': int(nevents_processed),
+            'nevents': int(nevents),
+            'event_weight_sum': event_weight_sum,
+            'extras_event_weight_sum': extras_event_weight_sum,
+            'dataset_nevents': int(dataset_nevents),
+            'processed_lumi': processed_lumi
+            }
+
+
+class SampleLookup(object):
+    """
+    Resolve whole lists of samples or datasets with one ``IN (...)`` query per list, over a single store.
+
+    The number of queries and the time spent in them are recorded, see ``report``.
+    """
+
+    SAMPLE_COLUMNS = ('name', 'sample_id', 'source_dataset_id', 'code_version')
+    DATASET_COLUMNS = ('name', 'dataset_id', 'nevents', 'process')
+
+    # Maximum number of values inside a single ``IN (...)`` clause
+    BATCH_SIZE = 500
+
+    def __init__(self, dbstore):
+        self.dbstore = dbstore
+        self.queries = 0
+        self.query_time = 0.
+
+    def _find(self, table, key, columns, values):
+        """
+        :return: a dict ``value -> list of rows``, each row being a tuple of ``columns``. Values not found in the
+                 database are associated to an empty list
+        """
+        # Byte strings would be bound as blobs, and never match a text column
+        values = list(set([unicode(v) if isinstance(v, str) else v for v in values]))
+        result = dict((value, []) for value in values)
+
+        for i in range(0, len(values), self.BATCH_SIZE):
+            batch = values[i:i + self.BATCH_SIZE]
+            statement = 'SELECT %s, %s FROM %s WHERE %s IN (%s)' % (key, ', '.join(columns), table, key, ', '.join(['?'] * len(batch)))
+            start = time.time()
+            rows = self.dbstore.execute(statement, batch).get_all()
+            self.query_time += time.time() - start
+            self.queries += 1
+
+            for row in rows:
+                result.setdefault(row[0], []).append(tuple(row[1:]))
+
+        return result
+
+    def samples_by_name(self, names, columns=SAMPLE_COLUMNS):
+        return self._find('sample', 'name', columns, names)
+
+    def samples_by_id(self, ids, columns=SAMPLE_COLUMNS):
+        return self._find('sample', 'sample_id', columns, ids)
+
+    def datasets_by_name(self, names, columns=DATASET_COLUMNS):
+        return self._find('dataset', 'name', columns, names)
+
+    def datasets_by_id(self, ids, columns=DATASET_COLUMNS):
+        return self._find('dataset', 'dataset_id', columns, ids)
+
+    def report(self):
+        print("SAMADhi lookups: %d queries in %.3f s" % (self.queries, self.query_time))
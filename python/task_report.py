@@ -0,0 +1,293 @@
+"""
+Throughput report of a crab task, built from the performance data of its jobs.
+
+The data comes from the telemetry sidecars written by ``runFrameworkOnGrid.py`` (see ``job_telemetry``) or, when they
+are not available, from the framework job reports found in the log tarballs retrieved by ``crab getlog``.
+"""
+
+import glob
+import json
+import os
+import re
+import subprocess
+import tarfile
+import xml.etree.ElementTree as ET
+
+from cp3_llbb.GridIn.job_telemetry import TELEMETRY_FILE
+
+REPORT_FILE = 'gridin_report.json'
+
+# Median CPU efficiency of the framework above which a task is CPU-bound, and below which it is I/O-bound
+CPU_BOUND_EFFICIENCY = 0.8
+IO_BOUND_EFFICIENCY = 0.5
+
+# A site is reported as slow if its median throughput is below this fraction of the median of the task
+SLOW_SITE_FRACTION = 0.5
+
+
+def is_sidecar(lfn):
+    """
+    Check if ``lfn`` is a telemetry sidecar. CRAB appends the job number to the name of the output files
+    """
+    prefix, ext = os.path.splitext(TELEMETRY_FILE)
+    return re.match(r'%s(_\d+)?%s\Z' % (re.escape(prefix), re.escape(ext)), os.path.basename(lfn)) is not None
+
+
+def read_file(path):
+    """
+    Return the content of a local file, or of a remote file if ``path`` is an xrootd URL
+    """
+    if path.startswith('root://'):
+        return subprocess.check_output(['xrdcp', '--silent', path, '-'])
+
+    with open(path) as f:
+        return f.read()
+
+
+def load_sidecars(paths, threads=8):
+    """
+    Read the telemetry sidecars ``paths`` concurrently
+    :return: the list of telemetry dicts. Unreadable sidecars are skipped
+    """
+    from multiprocessing.pool import ThreadPool
+
+    def load(path):
+        try:
+            return json.loads(read_file(path))
+        except (IOError, ValueError, subprocess.CalledProcessError) as e:
+            print("Warning: failed to read telemetry sidecar %r: %s" % (path, e))
+            return None
+
+    if len(paths) == 0:
+        return []
+
+    pool = ThreadPool(processes=min(threads, len(paths)))
+    try:
+        telemetry = pool.map(load, paths)
+    finally:
+        pool.close()
+
+    return [t for t in telemetry if t is not None]
+
+
+def telemetry_from_fjr(content, job_number):
+    """
+    Build a minimal telemetry dict from the content of a framework job report
+    :return: the telemetry, or None if the report does not contain timing information
+    """
+    root = ET.fromstring(content)
+
+    metrics = {}
+    for metric in root.iter('Metric'):
+        metrics[metric.get('Name')] = metric.get('Value')
+
+    if 'TotalJobTime' not in metrics:
+        return None
+
+    events = 0
+    files = []
+    for input_file in root.iter('InputFile'):
+        name = input_file.findtext('PFN') or input_file.findtext('LFN') or ''
+        n = int(input_file.findtext('EventsRead') or 0)
+        events += n
+        files.append({'file': name.strip(), 'access': 'xrootd' if name.strip().startswith('root://') else 'local',
+                      'events': n, 'file_size': None})
+
+    wall = float(metrics['TotalJobTime'])
+    cpu = float(metrics['TotalJobCPU']) if 'TotalJobCPU' in metrics else None
+
+    return {
+            'job_number': job_number,
+            'site': None,
+            'status': 'success',
+            'wall': wall,
+            'events': events,
+            'files': files,
+            'phases': [{'name': 'framework', 'wall': wall, 'cpu': cpu}],
+            'bytes_read': {}
+            }
+
+
+def load_log_tarballs(directory):
+    """
+    Extract the performance data of the jobs from the log tarballs of ``directory`` (``cmsRun_<N>.log.tar.gz``)
+    :return: the list of telemetry dicts
+    """
+    telemetry = []
+    for tarball in sorted(glob.glob(os.path.join(directory, 'cmsRun_*.log.tar.gz'))):
+        match = re.search(r'cmsRun_(\d+)\.log\.tar\.gz\Z', tarball)
+        job_number = int(match.group(1))
+        try:
+            with tarfile.open(tarball) as tar:
+                for member in tar.getmembers():
+                    if not os.path.basename(member.name).startswith('FrameworkJobReport'):
+                        continue
+                    t = telemetry_from_fjr(tar.extractfile(member).read(), job_number)
+                    if t is not None:
+                        telemetry.append(t)
+                    break
+        except (IOError, tarfile.TarError, ET.ParseError) as e:
+            print("Warning: failed to read log tarball %r: %s" % (tarball, e))
+
+    return telemetry
+
+
+def percentile(values, p):
+    """
+    Return the ``p``-th percentile of ``values``, using linear interpolation, or None if ``values`` is empty
+    """
+    values = sorted(values)
+    if len(values) == 0:
+        return None
+
+    k = (len(values) - 1) * p / 100.
+    lower = int(k)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (k - lower)
+
+
+def distribution(values):
+    values = [v for v in values if v is not None]
+    return {
+            'count': len(values),
+            'min': min(values) if len(values) > 0 else None,
+            'p50': percentile(values, 50),
+            'p90': percentile(values, 90),
+            'p99': percentile(values, 99),
+            'max': max(values) if len(values) > 0 else None
+            }
+
+
+def job_metrics(telemetry):
+    """
+    Compute the throughput metrics of one job from its telemetry
+    """
+    phases = dict((p['name'], p) for p in telemetry.get('phases', []))
+    framework = phases.get('framework', {})
+
+    wall = telemetry.get('wall')
+    framework_wall = framework.get('wall')
+    framework_cpu = framework.get('cpu')
+    events = telemetry.get('events')
+
+    accesses = set([f['access'] for f in telemetry.get('files', [])])
+    if len(accesses) == 1:
+        access = accesses.pop()
+    else:
+        access = 'mixed' if len(accesses) > 1 else None
+
+    return {
+            'job_number': telemetry.get('job_number'),
+            'site': telemetry.get('site') or 'unknown',
+            'status': telemetry.get('status'),
+            'wall': wall,
+            'framework_wall': framework_wall,
+            'overhead': wall - framework_wall if wall is not None and framework_wall is not None else None,
+            'events': events,
+            'files': len(telemetry.get('files', [])),
+            'events_per_s': float(events) / framework_wall if events and framework_wall else None,
+            'cpu_efficiency': float(framework_cpu) / framework_wall if framework_cpu is not None and framework_wall else None,
+            'bytes_read': telemetry.get('bytes_read', {}).get('root'),
+            'access': access,
+            'staging': telemetry.get('staging', False)
+            }
+
+
+def summarize_group(jobs):
+    return {
+            'jobs': len(jobs),
+            'events_per_s': distribution([j['events_per_s'] for j in jobs]),
+            'wall': distribution([j['wall'] for j in jobs]),
+            'cpu_efficiency': distribution([j['cpu_efficiency'] for j in jobs])
+            }
+
+
+def summarize(telemetry, task=None):
+    """
+    Build the report of a task from the telemetry of its jobs
+    :param task: description of the task (name, configuration file, dataset, splitting, units per job), stored as is
+    :return: a dict, suitable for JSON serialization
+    """
+    jobs = sorted([job_metrics(t) for t in telemetry], key=lambda j: j['job_number'])
+
+    summary = summarize_group(jobs)
+    if task is not None:
+        summary['task'] = task
+    summary['events'] = sum([j['events'] or 0 for j in jobs])
+    summary['failed_jobs'] = len([j for j in jobs if j['status'] != 'success'])
+    summary['overhead'] = distribution([j['overhead'] for j in jobs])
+
+    for key in ('site', 'access'):
+        groups = {}
+        for j in jobs:
+            groups.setdefault(str(j[key]), []).append(j)
+        summary['by_' + key] = dict((name, summarize_group(group)) for name, group in groups.items())
+
+    median_throughput = summary['events_per_s']['p50']
+    summary['slow_sites'] = sorted([site for site, s in summary['by_site'].items()
+                                    if median_throughput and s['events_per_s']['p50'] is not None
+                                    and s['events_per_s']['p50'] < SLOW_SITE_FRACTION * median_throughput])
+
+    efficiency = summary['cpu_efficiency']['p50']
+    if efficiency is None:
+        summary['diagnosis'] = 'unknown'
+    elif efficiency >= CPU_BOUND_EFFICIENCY:
+        summary['diagnosis'] = 'CPU-bound'
+    elif efficiency < IO_BOUND_EFFICIENCY:
+        summary['diagnosis'] = 'I/O-bound'
+    else:
+        summary['diagnosis'] = 'mixed'
+
+    summary['jobs_detail'] = jobs
+
+    return summary
+
+
+def _format(value, fmt):
+    return '-' if value is None else fmt % value
+
+
+def print_report(summary):
+    """
+    Print the report of a task as tables
+    """
+    print("%d jobs (%d failed), %d events processed" % (summary['jobs'], summary['failed_jobs'], summary['events']))
+    print("")
+
+    def print_header(label):
+        print("%-24s %6s %10s %10s %10s %10s %10s" % (label, 'jobs', 'ev/s p50', 'ev/s p90', 'wall p50', 'wall p90', 'wall p99'))
+
+    def print_row(name, group):
+        print("%-24s %6d %10s %10s %10s %10s %10s" % (name, group['jobs'],
+              _format(group['events_per_s']['p50'], '%.1f'), _format(group['events_per_s']['p90'], '%.1f'),
+              _format(group['wall']['p50'], '%.0f'), _format(group['wall']['p90'], '%.0f'),
+              _format(group['wall']['p99'], '%.0f')))
+
+    print_header('')
+    print_row('all', summary)
+
+    print("")
+    print_header('site')
+    for site in sorted(summary['by_site']):
+        print_row(site + (' (slow)' if site in summary['slow_sites'] else ''), summary['by_site'][site])
+
+    print("")
+    print_header('access')
+    for access in sorted(summary['by_access']):
+        print_row(access, summary['by_access'][access])
+
+    print("")
+    print("Median CPU efficiency of the framework: %s" % _format(summary['cpu_efficiency']['p50'], '%.2f'))
+    print("Median overhead outside of the framework: %s s" % _format(summary['overhead']['p50'], '%.0f'))
+    print("Diagnosis: %s" % summary['diagnosis'])
+
+
+def write_report(summary, directory):
+    """
+    Write the report of a task as JSON inside ``directory``
+    :return: the path of the report
+    """
+    filename = os.path.join(directory, REPORT_FILE)
+    with open(filename, 'w') as f:
+        json.dump(summary, f, indent=2, sort_keys=True)
+    return filename
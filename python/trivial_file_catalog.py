@@ -0,0 +1,141 @@
+"""
+In-process LFN to PFN conversion, using the trivial file catalog (``storage.xml``) of the site.
+
+This applies the same rules as CMSSW's ``FileLocator`` (used by ``edmFileUtil -d``), without starting a CMSSW
+executable for each file.
+"""
+
+import os
+import re
+import xml.etree.ElementTree as ET
+
+CATALOG_PREFIX = 'trivialcatalog_file:'
+
+
+class TrivialFileCatalog(object):
+    """
+    The ``lfn-to-pfn`` rules of a ``storage.xml`` file, compiled once
+    """
+
+    def __init__(self, rules):
+        """
+        :param rules: a dict ``protocol -> list of (path_match, result, chain, destination_match)``, the regexps being
+                      compiled. Rules are tried in order
+        """
+        self.rules = rules
+
+    @classmethod
+    def from_file(cls, filename):
+        """
+        Parse a ``storage.xml`` file
+        """
+        rules = {}
+        for rule in ET.parse(filename).getroot().iter('lfn-to-pfn'):
+            protocol = rule.get('protocol')
+            # Regexps must match the whole string, like std::regex_match
+            path_match = re.compile('(?:%s)\\Z' % rule.get('path-match'))
+            destination_match = re.compile('(?:%s)\\Z' % rule.get('destination-match', '.*'))
+            rules.setdefault(protocol, []).append((path_match, rule.get('result'), rule.get('chain'), destination_match))
+
+        return cls(rules)
+
+    def lfn_to_pfn(self, lfn, protocol, destination='any'):
+        """
+        Convert ``lfn`` to a PFN for ``protocol``
+        :return: the PFN, or None if no rule matches
+        """
+        for path_match, result, chain, destination_match in self.rules.get(protocol, []):
+            if not destination_match.match(destination):
+                continue
+
+            name = lfn
+            # If the rule is chained, apply the chained rule first: path-match applies to its result
+            if chain:
+                name = self.lfn_to_pfn(lfn, chain, destination)
+                if name is None:
+                    continue
+
+            match = path_match.match(name)
+            if match is None:
+                continue
+
+            return re.sub(r'\$(\d+)', lambda m: match.group(int(m.group(1))) or '', result)
+
+        return None
+
+
+def get_site_local_config():
+    """
+    Return the path of the ``site-local-config.xml`` of the site, or None if it cannot be found
+    """
+    candidates = []
+    if 'SITECONFIG_PATH' in os.environ:
+        candidates.append(os.path.join(os.environ['SITECONFIG_PATH'], 'JobConfig', 'site-local-config.xml'))
+    if 'CMS_PATH' in os.environ:
+        candidates.append(os.path.join(os.environ['CMS_PATH'], 'SITECONF', 'local', 'JobConfig', 'site-local-config.xml'))
+
+    for candidate in candidates:
+        if os.path.isfile(candidate):
+            return candidate
+
+    return None
+
+
+def get_data_catalogs(site_local_config):
+    """
+    Return the event data catalogs defined in ``site_local_config``, as a list of ``(url, protocol)``
+    """
+    catalogs = []
+    for catalog in ET.parse(site_local_config).getroot().iter('catalog'):
+        url = catalog.get('url')
+        protocol = None
+        if '?' in url:
+            url, query = url.split('?', 1)
+            for item in query.split('&'):
+                if item.startswith('protocol='):
+                    protocol = item[len('protocol='):]
+        catalogs.append((url, protocol))
+
+    return catalogs
+
+
+_site_catalog = None
+
+
+def get_site_catalog():
+    """
+    Load the trivial file catalog of the site. The result is cached: only the first call reads the files.
+    :return: a tuple ``(TrivialFileCatalog, protocol)``, or ``(None, None)`` if the catalog is not usable
+    """
+    global _site_catalog
+    if _site_catalog is not None:
+        return _site_catalog
+
+    _site_catalog = (None, None)
+    site_local_config = get_site_local_config()
+    if site_local_config is None:
+        return _site_catalog
+
+    try:
+        catalogs = get_data_catalogs(site_local_config)
+        # Like CMSSW, only the first catalog is used
+        if len(catalogs) > 0 and catalogs[0][0].startswith(CATALOG_PREFIX) and catalogs[0][1] is not None:
+            url, protocol = catalogs[0]
+            _site_catalog = (TrivialFileCatalog.from_file(url[len(CATALOG_PREFIX):]), protocol)
+    except (IOError, ET.ParseError, re.error) as e:
+        print('Failed to load the trivial file catalog of the site: %s' % e)
+
+    return _site_catalog
+
+
+def lfn_to_pfn(lfn, protocol=None):
+    """
+    Convert ``lfn`` using the trivial file catalog of the site
+    :param protocol: the protocol of the rules to use, by default the one of the site
+    :return: the PFN, or None if the catalog cannot handle it
+    """
+    catalog, site_protocol = get_site_catalog()
+    if catalog is None:
+        return None
+
+    return catalog.lfn_to_pfn(lfn, protocol or site_protocol)
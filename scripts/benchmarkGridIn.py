@@ -0,0 +1,420 @@
+#! /usr/bin/env python
+
+"""
+Benchmarks of the GridIn book-keeping tools, running against local stand-ins (SQLite database, ...)
+"""
+
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from cp3_llbb.GridIn.common import add_samadhi_path
+
+add_samadhi_path()
+
+FILE_TABLE_SCHEMA = ('CREATE TABLE file (id INTEGER PRIMARY KEY AUTOINCREMENT, sample_id INTEGER, lfn VARCHAR(500), '
+                     'pfn VARCHAR(500), event_weight_sum FLOAT, extras_event_weight_sum TEXT, nevents INTEGER)')
+
+def create_sqlite_store(directory, schemas):
+    """
+    Create a Storm store backed by a new SQLite database inside ``directory``
+    """
+    from storm.locals import create_database, Store
+
+    store = Store(create_database('sqlite:' + os.path.join(directory, 'samadhi.sqlite')))
+    for schema in schemas:
+        store.execute(schema, noresult=True)
+    store.commit()
+
+    return store
+
+SAMPLE_TABLE_SCHEMA = ('CREATE TABLE sample (sample_id INTEGER PRIMARY KEY AUTOINCREMENT, name VARCHAR(255), '
+                       'source_dataset_id INTEGER, nevents_processed INTEGER, nevents INTEGER, event_weight_sum FLOAT, '
+                       'extras_event_weight_sum TEXT, processed_lumi TEXT)')
+
+DATASET_TABLE_SCHEMA = 'CREATE TABLE dataset (dataset_id INTEGER PRIMARY KEY AUTOINCREMENT, name VARCHAR(255), nevents INTEGER)'
+
+def generate_file(i, sample_id, version=0):
+    """
+    Generate a fake row for the ``file`` table
+    """
+    lfn = u'/store/user/gridin/Benchmark/sample_%d/0000/output_%d.root' % (sample_id, i + 1)
+    pfn = u'srm://ingrid-se02.cism.ucl.ac.be:8444/srm/managerv2?SFN=/storage/data/cms' + lfn
+    return (lfn, pfn, 1000. + i + version, u'{"scale_up":%d.5}' % (i + version), 500 + i)
+
+def generate_files(n, sample_id, version=0):
+    """
+    Generate ``n`` fake rows for the ``file`` table
+    """
+    return [generate_file(i, sample_id, version) for i in range(n)]
+
+def print_rate(label, n, seconds, unit='rows'):
+    print("%-40s %8d %s in %7.3f s: %10.0f %s/s" % (label, n, unit, seconds, n / seconds if seconds > 0 else float('inf'), unit))
+
+def bench_file_insert(options, directory):
+    """
+    Compare inserting and updating the files of a sample through the ORM (one object per file) and through the bulk
+    path used by ``runPostCrab.py``
+    """
+    from SAMADhi import File
+    from cp3_llbb.GridIn.samadhi_utils import sync_files
+
+    store = create_sqlite_store(directory, [FILE_TABLE_SCHEMA])
+    n = options.files
+
+    # ORM: one File object per row, like ``sample.files.add(f)``
+    files = generate_files(n, 1)
+    start = time.time()
+    for f in files:
+        db_file = File(*f)
+        db_file.sample_id = 1
+        store.add(db_file)
+    store.commit()
+    print_rate('ORM insertion', n, time.time() - start)
+
+    # ORM update: remove every file, then add them again
+    files = generate_files(n, 1, version=1)
+    start = time.time()
+    store.find(File, File.sample_id == 1).remove()
+    for f in files:
+        db_file = File(*f)
+        db_file.sample_id = 1
+        store.add(db_file)
+    store.commit()
+    print_rate('ORM update (delete + insert)', n, time.time() - start)
+
+    # Bulk insertion
+    files = generate_files(n, 2)
+    start = time.time()
+    sync_files(store, 2, files)
+    store.commit()
+    print_rate('Bulk insertion', n, time.time() - start)
+
+    # Bulk update, with a few modified files
+    files = generate_files(n, 2)
+    for i in range(0, n, 100):
+        files[i] = generate_file(i, 2, version=1)
+    start = time.time()
+    inserted, updated, deleted = sync_files(store, 2, files)
+    store.commit()
+    print_rate('Bulk update (%d modified rows)' % updated, n, time.time() - start)
+
+    store.close()
+
+def merge_per_sample(store, sample_ids, merged_id):
+    """
+    Merge like ``mergeDBSamples.py`` used to: separate queries for each sample, and one ``File`` object per copied file
+    """
+    from SAMADhi import File
+
+    nevents_processed = nevents = dataset_nevents = 0
+    event_weight_sum = 0
+    extras_event_weight_sum = {}
+    for sample_id in sample_ids:
+        row = store.execute('SELECT nevents_processed, nevents, event_weight_sum, extras_event_weight_sum, source_dataset_id '
+                            'FROM sample WHERE sample_id = ?', (sample_id,)).get_one()
+        nevents_processed += row[0]
+        nevents += row[1]
+        event_weight_sum += row[2]
+        extra_sumw = json.loads(row[3])
+        for key in extra_sumw:
+            try:
+                extras_event_weight_sum[key] += extra_sumw[key]
+            except KeyError:
+                extras_event_weight_sum[key] = extra_sumw[key]
+        for lfn, pfn, sumw, extras, n in list(store.find(File, File.sample_id == sample_id).order_by(File.id).values(
+                File.lfn, File.pfn, File.event_weight_sum, File.extras_event_weight_sum, File.nevents)):
+            f = File(lfn, pfn, sumw, extras, n)
+            f.sample_id = merged_id
+            store.add(f)
+        dataset_nevents += store.execute('SELECT nevents FROM dataset WHERE dataset_id = ?', (row[4],)).get_one()[0]
+    store.commit()
+
+    return (nevents_processed, nevents, event_weight_sum, extras_event_weight_sum, dataset_nevents)
+
+def bench_merge(options, directory):
+    """
+    Compare merging samples with per-sample queries and per-file objects, and with the set-based statements used by
+    ``mergeDBSamples.py``. Both must give the same result
+    """
+    from cp3_llbb.GridIn.samadhi_utils import insert_files, sum_samples, copy_files
+
+    store = create_sqlite_store(directory, [FILE_TABLE_SCHEMA, SAMPLE_TABLE_SCHEMA, DATASET_TABLE_SCHEMA])
+    n = options.files
+    sample_ids = range(1, options.samples + 1)
+    for sample_id in sample_ids:
+        files = generate_files(n, sample_id)
+        store.execute('INSERT INTO dataset (dataset_id, nevents) VALUES (?, ?)', (sample_id, 1000 * n), noresult=True)
+        store.execute('INSERT INTO sample (sample_id, source_dataset_id, nevents_processed, nevents, event_weight_sum, '
+                      'extras_event_weight_sum) VALUES (?, ?, ?, ?, ?, ?)', (sample_id, sample_id, sum([f[4] for f in files]),
+                      sum([f[4] for f in files]) // 2, sum([f[2] for f in files]) / 3., u'{"scale_up":%d.25}' % sample_id), noresult=True)
+        insert_files(store, sample_id, files)
+    store.commit()
+    legacy_id, merged_id = len(sample_ids) + 1, len(sample_ids) + 2
+
+    start = time.time()
+    legacy = merge_per_sample(store, sample_ids, legacy_id)
+    print_rate('Per-sample merge', n * len(sample_ids), time.time() - start)
+
+    start = time.time()
+    sums = sum_samples(store, sample_ids)
+    copy_files(store, sample_ids, merged_id)
+    store.commit()
+    print_rate('Set-based merge', n * len(sample_ids), time.time() - start)
+
+    merged = (sums['nevents_processed'], sums['nevents'], sums['event_weight_sum'], sums['extras_event_weight_sum'], sums['dataset_nevents'])
+    columns = 'lfn, pfn, event_weight_sum, extras_event_weight_sum, nevents'
+    files = [store.execute('SELECT %s FROM file WHERE sample_id = ? ORDER BY id' % columns, (sample_id,)).get_all()
+             for sample_id in (legacy_id, merged_id)]
+    print("Identical results: %s" % (legacy == merged and files[0] == files[1]))
+
+    store.close()
+
+def generate_processed_lumis(runs, lumis_per_run, jobs, seed=42):
+    """
+    Generate the processed luminosity sections of ``jobs`` jobs, as compact lists: each job processes blocks of
+    consecutive certified luminosity sections, like crab with a lumi-based splitting
+    """
+    import random
+    rng = random.Random(seed)
+
+    # Certified luminosity sections, with a few holes in each run
+    certified = []
+    for run in range(1, runs + 1):
+        lumi = 1
+        while lumi < lumis_per_run:
+            length = rng.randint(20, 300)
+            certified += [(run, l) for l in range(lumi, min(lumi + length, lumis_per_run))]
+            lumi += length + rng.randint(1, 10)
+
+    block = len(certified) // jobs
+    compact_lists = []
+    for job in range(jobs):
+        compact_list = {}
+        for run, lumi in certified[job * block:(job + 1) * block]:
+            # Some luminosity sections are not processed
+            if rng.random() < 0.02:
+                continue
+            intervals = compact_list.setdefault(str(run), [])
+            if len(intervals) > 0 and intervals[-1][1] == lumi - 1:
+                intervals[-1][1] = lumi
+            else:
+                intervals.append([lumi, lumi])
+        compact_lists.append(compact_list)
+
+    return compact_lists
+
+def bench_lumi(options, directory):
+    """
+    Compare merging processed luminosity sections with ``LumiList`` (or, if CMSSW is not available, with Python sets of
+    luminosity sections, like ``LumiList`` does internally) and with ``LumiIntervals``
+    """
+    from cp3_llbb.GridIn.lumi_intervals import LumiIntervals
+
+    jobs = generate_processed_lumis(options.runs, 2000, 200)
+    golden = generate_processed_lumis(options.runs, 2000, 1, seed=1)[0]
+    n = sum([sum([b - a + 1 for a, b in intervals]) for job in jobs for intervals in job.values()])
+    print("%d luminosity sections in %d runs, processed by %d jobs" % (n, options.runs, len(jobs)))
+
+    try:
+        from FWCore.PythonUtilities.LumiList import LumiList
+        label = 'LumiList'
+
+        def reference_union(compact_lists):
+            result = LumiList()
+            for compact_list in compact_lists:
+                result = result | LumiList(compactList=compact_list)
+            return result
+
+        def reference_and(a, b):
+            return a & LumiList(compactList=b)
+
+        def reference_compact(result):
+            return result.getCompactList()
+    except ImportError:
+        label = 'Python sets'
+
+        def expand(compact_list):
+            return set([(int(run), l) for run, intervals in compact_list.items() for a, b in intervals for l in range(a, b + 1)])
+
+        def reference_union(compact_lists):
+            result = set()
+            for compact_list in compact_lists:
+                result = result | expand(compact_list)
+            return result
+
+        def reference_and(a, b):
+            return a & expand(b)
+
+        def reference_compact(result):
+            compact_list = {}
+            for run, lumi in sorted(result):
+                intervals = compact_list.setdefault(str(run), [])
+                if len(intervals) > 0 and intervals[-1][1] == lumi - 1:
+                    intervals[-1][1] = lumi
+                else:
+                    intervals.append([lumi, lumi])
+            return compact_list
+
+    start = time.time()
+    reference = reference_union(jobs)
+    reference_certified = reference_and(reference, golden)
+    reference_result = (reference_compact(reference), reference_compact(reference_certified))
+    print_rate('%s union + intersection' % label, n, time.time() - start, 'lumis')
+
+    start = time.time()
+    merged = LumiIntervals.union_all([LumiIntervals.from_compact_list(job) for job in jobs])
+    certified = merged & LumiIntervals.from_compact_list(golden)
+    result = (merged.to_compact_list(), certified.to_compact_list())
+    print_rate('LumiIntervals union + intersection', n, time.time() - start, 'lumis')
+
+    print("Identical results: %s" % (result == reference_result))
+
+def generate_output_file(path, i, entries):
+    """
+    Generate a small file with the content of a framework output used by the book-keeping
+    """
+    import ROOT
+    from array import array
+
+    f = ROOT.TFile.Open(path, 'recreate')
+    ROOT.TParameter('double')('event_weight_sum', 1000. + i).Write()
+    for j, suffix in enumerate(['scale_up', 'scale_down', 'pdf_up', 'pdf_down']):
+        ROOT.TParameter('double')('event_weight_sum_' + suffix, 1000. + i + j / 4.).Write()
+
+    x = array('f', [0.])
+    tree = ROOT.TTree('t', 't')
+    tree.Branch('x', x, 'x/F')
+    for k in range(entries + i):
+        x[0] = k
+        tree.Fill()
+    tree.Write()
+    f.Close()
+
+READ_SCRIPT = """
+import json, sys
+from cp3_llbb.GridIn.framework_output import get_file_data
+data = [get_file_data(pfn, sys.argv[1]) for pfn in sys.argv[2:]]
+print(json.dumps({'data': data, 'root_loaded': 'ROOT' in sys.modules}))
+"""
+
+def bench_reader(options, directory):
+    """
+    Compare reading the output files with PyROOT and with the lightweight reader, each in a new process to include
+    the start-up time, and check that both give the same results
+    """
+    paths = [os.path.join(directory, 'output_%d.root' % (i + 1)) for i in range(options.output_files)]
+    for i, path in enumerate(paths):
+        generate_output_file(path, i, 1000)
+
+    results = {}
+    for reader in ['root', 'light']:
+        start = time.time()
+        out = subprocess.check_output([sys.executable, '-c', READ_SCRIPT, reader] + paths)
+        print_rate('%s reader' % reader, len(paths), time.time() - start, 'files')
+        results[reader] = json.loads(out)
+
+    print("ROOT loaded by the light reader: %s" % results['light']['root_loaded'])
+    print("Identical results: %s" % (results['root']['data'] == results['light']['data']))
+
+ENTRY_POINTS = ['runOnGrid.py', 'runPostCrab.py', 'checkMyProd.py', 'mergeDBSamples.py']
+
+# Modules slow to import, which the scripts should only import when they need them
+HEAVY_MODULES = ['ROOT', 'SAMADhi', 'storm', 'das_import', 'CRABAPI', 'CRABClient', 'WMCore', 'numpy']
+
+STARTUP_SCRIPT = """
+import json, os, runpy, sys, time
+script = sys.argv[1]
+sys.argv = [script, '--help']
+sys.path.insert(0, os.path.dirname(script))
+start = time.time()
+saved_stdout = sys.stdout
+sys.stdout = open(os.devnull, 'w')
+try:
+    runpy.run_path(script, run_name='__main__')
+except SystemExit:
+    pass
+sys.stdout = saved_stdout
+print(json.dumps({'time': time.time() - start, 'modules': sorted(set(m.split('.')[0] for m in sys.modules if m))}))
+"""
+
+def bench_startup(options, directory):
+    """
+    Measure the start-up time of each script: running it with ``--help`` imports everything imported at the top of the
+    script, then exits. Each script is started ``--repeat`` times in a new interpreter, and the fastest time is kept,
+    both for the script alone and for the whole process. Fails if a script is above ``--startup-target`` seconds.
+    """
+    scripts_dir = os.path.dirname(os.path.abspath(__file__))
+
+    too_slow = []
+    for entry_point in ENTRY_POINTS:
+        script = os.path.join(scripts_dir, entry_point)
+        times = []
+        totals = []
+        for i in range(options.repeat):
+            start = time.time()
+            out = subprocess.check_output([sys.executable, '-c', STARTUP_SCRIPT, script])
+            totals.append(time.time() - start)
+            result = json.loads(out)
+            times.append(result['time'])
+
+        heavy = [m for m in HEAVY_MODULES if m in result['modules']]
+        print("%-20s %7.3f s (process: %7.3f s)  heavy modules: %s" % (entry_point, min(times), min(totals),
+              ', '.join(heavy) if len(heavy) > 0 else 'none'))
+        if min(times) > options.startup_target:
+            too_slow.append(entry_point)
+
+    if len(too_slow) > 0:
+        print("Above the target of %.2f s: %s" % (options.startup_target, ', '.join(too_slow)))
+        sys.exit(1)
+    print("All the scripts start in less than %.2f s" % options.startup_target)
+
+def get_options():
+    """
+    Parse and return the arguments provided by the user.
+    """
+    parser = argparse.ArgumentParser(description='Benchmark the GridIn book-keeping tools against local stand-ins')
+    parser.add_argument('benchmarks', type=str, nargs='+', metavar='BENCHMARK', choices=sorted(BENCHMARKS.keys()),
+                        help='Benchmarks to run, among: %s' % ', '.join(sorted(BENCHMARKS.keys())))
+    parser.add_argument('-n', '--files', type=int, action='store', dest='files', metavar='N', default=5000,
+                        help='Number of files per sample')
+    parser.add_argument('-s', '--samples', type=int, action='store', dest='samples', metavar='N', default=3,
+                        help='Number of samples to merge')
+    parser.add_argument('-r', '--runs', type=int, action='store', dest='runs', metavar='N', default=400,
+                        help='Number of runs of the generated luminosity sections')
+    parser.add_argument('-o', '--output-files', type=int, action='store', dest='output_files', metavar='N', default=200,
+                        help='Number of framework output files to read')
+    parser.add_argument('--repeat', type=int, action='store', dest='repeat', metavar='N', default=5,
+                        help='Number of times each script is started')
+    parser.add_argument('--startup-target', type=float, action='store', dest='startup_target', metavar='SECONDS',
+                        default=0.5, help='Maximal start-up time of each script')
+    options = parser.parse_args()
+    return options
+
+BENCHMARKS = {
+        'file-insert': bench_file_insert,
+        'merge': bench_merge,
+        'lumi': bench_lumi,
+        'reader': bench_reader,
+        'startup': bench_startup,
+        }
+
+def main():
+    options = get_options()
+
+    for name in options.benchmarks:
+        print("##### %s" % name)
+        directory = tempfile.mkdtemp(prefix='gridin_benchmark_')
+        try:
+            BENCHMARKS[name](options, directory)
+        finally:
+            shutil.rmtree(directory)
+        print("")
+
+if __name__ == '__main__':
+    main()
@@ -1,31 +1,125 @@
 #! /usr/bin/env python
 
+from __future__ import division
+
 import os
 import sys
 import glob
 import json
+import time
 import argparse
 
-# import CRAB3 stuff
-from CRABAPI.RawCommand import crabCommand
+from cp3_llbb.GridIn.common import add_samadhi_path, load_file, mark_started, mute_output, wait_with_deadlines
+from cp3_llbb.GridIn.git_version import getGitTagRepoUrl
+from cp3_llbb.GridIn.samadhi_utils import SampleLookup
 
-# import CMSSW stuff
+# The CRAB client, SAMADhi and runPostCrab are only imported when needed
 CMSSW_BASE = os.environ['CMSSW_BASE']
-SCRAM_ARCH = os.environ['SCRAM_ARCH']
-sys.path.append(os.path.join(CMSSW_BASE,'bin', SCRAM_ARCH))
+add_samadhi_path()
 
-# Add default ingrid storm package
-sys.path.append('/nfs/soft/python/python-2.7.5-sl6_amd64_gcc44/lib/python2.7/site-packages/storm-0.20-py2.7-linux-x86_64.egg')
-sys.path.append('/nfs/soft/python/python-2.7.5-sl6_amd64_gcc44/lib/python2.7/site-packages/MySQL_python-1.2.3-py2.7-linux-x86_64.egg')
+# Time, in seconds, before a task is polled again, depending on its last known status: the first value is the
+# interval after a status change, doubled each time the status is found unchanged, up to the second value.
+# None means the status cannot change anymore, unless the task is touched by crab (e.g. crab resubmit)
+POLL_INTERVALS = {
+        'COMPLETED': None,
+        'SUBMITFAILED': None,
+        'KILLED': None,
+        'FAILED': (3600, 24 * 3600),
+        }
+# Tasks in any other status are polled at each execution
+DEFAULT_POLL_INTERVAL = (0, 0)
 
-# import SAMADhi stuff
-from SAMADhi import Dataset, Sample, File, DbStore
-import runPostCrab
+def load_state(filename):
+    """
+    Load the per-task polling state: a dict ``task -> {'status', 'last_polled', 'unchanged'}``
+    """
+    if not os.path.isfile(filename):
+        return {}
+    with open(filename) as f:
+        return json.load(f)
 
-def get_sample(sample):
-    dbstore = DbStore()
-    resultset = dbstore.find(Sample, Sample.name==sample)
-    return list(resultset.values(Sample.sample_id))
+def save_state(filename, state):
+    with open(filename, 'w') as f:
+        json.dump(state, f, sort_keys=True, indent=2)
+
+def needs_polling(taskdir, task_state, now):
+    """
+    Check if the status of a task can have changed since it was last polled
+    :param taskdir: the crab directory of the task
+    :param task_state: the polling state of the task, or None if it was never polled
+    :param now: current time
+    """
+    if task_state is None:
+        return True
+
+    # Any crab command on the task (resubmit, kill, ...) is logged inside the task directory
+    crab_log = os.path.join(taskdir, 'crab.log')
+    if os.path.isfile(crab_log) and os.path.getmtime(crab_log) > task_state['last_polled']:
+        return True
+
+    interval = POLL_INTERVALS.get(task_state['status'], DEFAULT_POLL_INTERVAL)
+    if interval is None:
+        return False
+
+    first, maximum = interval
+    return now - task_state['last_polled'] >= min(first * 2 ** task_state['unchanged'], maximum)
+
+def update_state(state, task, status):
+    """
+    Record that ``task`` was just found in ``status``
+    """
+    previous = state.get(task)
+    unchanged = 0
+    if previous is not None and previous['status'] == status:
+        unchanged = previous['unchanged'] + 1
+    state[task] = {'status': status, 'last_polled': time.time(), 'unchanged': unchanged}
+
+def get_status(taskdir, debug=False, started=None, index=None):
+    """
+    Run ``crab status`` on a task
+    :param debug: if False, the output of crab is hidden
+    :param started: dict where the start of the query ``index`` is recorded, for its timeout
+    :return: a tuple ``(status, error)``. ``status`` is the dict returned by crab, or None if the command failed
+    """
+    from CRABAPI.RawCommand import crabCommand
+
+    mark_started(started, index)
+    try:
+        # Outputs of concurrent crab commands would be mixed, hide them
+        with mute_output(not debug):
+            return (crabCommand('status', dir = taskdir), None)
+    except Exception as e:
+        return (None, str(e))
+
+def get_statuses(taskdirs, processes, timeout, debug=False):
+    """
+    Run ``crab status`` concurrently on several tasks, using a pool of ``processes`` worker processes. The CRAB client
+    is not thread-safe (see ``crab_submission.CrabClient``), but its global state belongs to the process: each worker
+    runs one command at a time.
+    A task not answering ``timeout`` seconds after its query started is reported as failed, without blocking the
+    others: tasks waiting for a free worker do not time out.
+    :return: a list of ``(status, error)`` as returned by ``get_status``, in the same order as ``taskdirs``
+    """
+    from multiprocessing import Manager, Pool
+
+    if len(taskdirs) == 0:
+        return []
+
+    manager = Manager()
+    pool = Pool(processes=min(processes, len(taskdirs)))
+    try:
+        started = manager.dict()
+        async_results = [pool.apply_async(get_status, (taskdir, debug, started, i)) for i, taskdir in enumerate(taskdirs)]
+        results, timed_out = wait_with_deadlines(async_results, started, timeout)
+        for i in timed_out:
+            results[i] = (None, 'no answer after %d seconds' % timeout)
+    finally:
+        # Workers still waiting for crab are killed
+        pool.terminate()
+        pool.join()
+        manager.shutdown()
+
+    return results
 
 def get_options():
     """
@@ -35,17 +129,35 @@ def get_options():
     parser.add_argument('--new', action='store_true', help='Start monitoring a new production', dest='new')
     parser.add_argument('-j', '--json', type=str, action='store', dest='outjson', default='prod_default.json',
                         help='json file storing the status of your on-going production') 
+    parser.add_argument('-t', '--threads', type=int, action='store', dest='threads', metavar='N', default=10,
+                        help='Number of crab status queries running concurrently, each in its own worker process')
+    parser.add_argument('--timeout', type=int, action='store', dest='timeout', metavar='SECONDS', default=300,
+                        help='Time allowed to a single crab status query')
+    parser.add_argument('--debug', action='store_true', help='Show the output of the crab commands', dest='debug')
+    parser.add_argument('--force', action='store_true', dest='force',
+                        help='Query the status of all the tasks, even those whose status is not expected to have changed')
+    parser.add_argument('--watch', action='store_true', dest='watch',
+                        help='Check the tasks continuously, and insert completed tasks in SAMADhi as soon as they are found')
+    parser.add_argument('--min-interval', type=int, action='store', dest='min_interval', metavar='SECONDS', default=300,
+                        help='Time between two checks in watch mode, when all the tasks are running')
+    parser.add_argument('--max-interval', type=int, action='store', dest='max_interval', metavar='SECONDS', default=3600,
+                        help='Time between two checks in watch mode, when no task is running')
     options = parser.parse_args()
     return options
 
-def main():
-    #####
-    # Initialization
-    #####
-    options = get_options()
-    alltasks = [t for t in os.listdir('tasks') if os.path.isdir(os.path.join('tasks', t))]
+def list_tasks():
+    alltasks = sorted([t for t in os.listdir('tasks') if os.path.isdir(os.path.join('tasks', t))])
     assert len(alltasks) > 0, "No task to monitor in the tasks/ directory"
-        
+    return alltasks
+
+def check_tasks(options, outjson, FWHash, AnaRepo, AnaHash, lookup):
+    """
+    Query the status of the tasks, update the production json and print a status summary
+    :param lookup: the ``SampleLookup`` used to find the completed tasks already in SAMADhi
+    :return: a dict ``status -> list of tasks``
+    """
+    alltasks = list_tasks()
+
     tasks = {}
     # CRAB3 status
     tasks['COMPLETED'] = []
@@ -58,32 +170,8 @@ def main():
     tasks['KILLED'] = []
     # GRIDIN status
     tasks['GRIDIN-INDB'] = []
+    tasks['GRIDIN-STATUSFAILED'] = []
     
-    FWHash = ""
-    AnaRepo = ""
-    AnaHash = ""
-
-    #####
-    # Figure out what is the name of the file things should be written into
-    #####
-    outjson = options.outjson
-    if options.new:
-        # NB: assumes all the on-going tasks are for the same analyzer
-        module = runPostCrab.load_file(alltasks[0] + '.py')
-        psetName = module.config.JobType.psetName
-        print "##### Figure out the code(s) version"
-        # first the version of the framework
-        FWHash, FWRepo, FWUrl = runPostCrab.getGitTagRepoUrl( os.path.join(CMSSW_BASE, 'src/cp3_llbb/Framework') )
-        # then the version of the analyzer
-        AnaHash, AnaRepo, AnaUrl = runPostCrab.getGitTagRepoUrl( os.path.dirname( psetName ) )
-        outjson = 'prod_' + FWHash + '_' + AnaRepo + '_' + AnaHash + '.json'
-        print "The output json will be:", outjson
-    else:
-        newestjson = max(glob.iglob('prod_*.json'), key=os.path.getctime)
-        if outjson == 'prod_default.json' and newestjson != 'prod_default.json':
-            outjson = newestjson
-            FWHash, AnaRepo, AnaHash = outjson.strip('prod_').strip('.json').split('_')
-
     #####
     # Read the json if it exists, then check if COMPLETED samples have been entered in SAMADhi since the script was last run
     #####
@@ -92,44 +180,74 @@ def main():
         with open(outjson) as f:
             data = json.load(f)
     
+        candidates = {}
         for t in data[u'COMPLETED']:
             if t in data[u'GRIDIN-INDB']:
                 continue
             s = str(t).strip('crab_') + '_' + FWHash + '_' + AnaRepo + '_' + AnaHash
-            s_id = get_sample(unicode(s))
-            if len(s_id) > 0:
+            candidates[t] = unicode(s)
+
+        samples = lookup.samples_by_name(candidates.values(), columns=('sample_id',))
+        lookup.report()
+        for t in sorted(candidates):
+            if len(samples[candidates[t]]) > 0:
                 data['GRIDIN-INDB'].append(t)
     
     #####
     # Loop over the tasks and perform a crab status
     #####
+    # Tasks whose status is not expected to have changed keep their last known status
+    state_file = os.path.splitext(outjson)[0] + '.state'
+    state = load_state(state_file)
+    now = time.time()
+    to_poll = []
     for task in alltasks:
         if len(data) > 0 and unicode(task) in data[u'GRIDIN-INDB']:
             tasks['GRIDIN-INDB'].append(task)
             continue
-        taskdir = os.path.join('tasks/', task)
+        task_state = state.get(task)
+        if not options.force and not needs_polling(os.path.join('tasks', task), task_state, now):
+            tasks.setdefault(task_state['status'], []).append(task)
+            continue
+        to_poll.append(task)
+
+    statuses = get_statuses([os.path.join('tasks/', task) for task in to_poll], options.threads, options.timeout, options.debug)
+    for task, (status, error) in zip(to_poll, statuses):
         print ""
         print "#####", task, "#####"
-        status = crabCommand('status', dir = taskdir)
+        if status is None:
+            print "Warning: crab status failed:", error
+            tasks['GRIDIN-STATUSFAILED'].append(task)
+            update_state(state, task, 'GRIDIN-STATUSFAILED')
+            continue
     # {'status': 'COMPLETED', 'schedd': 'crab3-3@submit-4.t2.ucsd.edu', 'saveLogs': 'T', 'jobsPerStatus': {'finished': 1}, 'jobs': {'1': {'State': 'finished'}}, 'publication': {'disabled': []}, 'taskWarningMsg': [], 'publicationFailures': {}, 'outdatasets': None, 'statusFailureMsg': '', 'taskFailureMsg': '', 'failedJobdefs': 0, 'ASOURL': 'https://cmsweb.cern.ch/couchdb', 'totalJobdefs': 0, 'jobSetID': '151022_173830:obondu_crab_HWminusJ_HToWW_M125_13TeV_powheg_pythia8_MiniAODv2', 'jobdefErrors': [], 'collector': 'cmssrv221.fnal.gov,vocms099.cern.ch', 'jobList': [['finished', 1]]}
-        tasks[status['status']].append(task)
+        print "Status:", status['status'], status.get('jobsPerStatus', {})
+        tasks.setdefault(status['status'], []).append(task)
+        update_state(state, task, status['status'])
+
+    save_state(state_file, state)
     
     #####
     # Dump the crab status into the output json file
     #####
     with open(outjson, 'w') as f:
-        json.dump(tasks, f)
+        json.dump(tasks, f, sort_keys=True)
     
     #####
     # Print summary
     #####
     print "##### ##### Status summary (" + str(len(alltasks)), " tasks) ##### #####"
-    for key in tasks:
+    if len(alltasks) - len(tasks['GRIDIN-INDB']) > len(to_poll):
+        print "(" + str(len(alltasks) - len(tasks['GRIDIN-INDB']) - len(to_poll)) + " tasks not polled since their status is not expected to have changed, use --force to poll them)"
+    for key in sorted(tasks):
         if len(tasks[key]) == 0:
             continue
         line = key + ": " + str(len(tasks[key]))
         print line
-    
+
+    return tasks
+
+def suggest_actions(tasks):
     #####
     # Suggest some actions depending on the crab status
     #    * COMPLETED -> suggest the runPostCrab.py command
@@ -148,5 +266,107 @@ def main():
     else:
         print "None"
 
+def is_active(status):
+    """
+    Check if tasks in ``status`` are still expected to evolve by themselves
+    """
+    return status not in POLL_INTERVALS and status != 'GRIDIN-INDB'
+
+def watch(options, outjson, FWHash, AnaRepo, AnaHash, lookup):
+    """
+    Check the tasks continuously, and book-keep completed tasks in SAMADhi as soon as they are found.
+    The interval between two checks goes from ``options.min_interval`` when all the tasks are running, up to
+    ``options.max_interval`` when none are. Stops when no task can change anymore.
+    """
+    import runPostCrab
+
+    # Database connection and workers reading the output files, created for the first completed task and shared by
+    # all the following ones
+    shared = None
+    try:
+        bookkeeping_done = set()
+        bookkeeping_failed = set()
+        while True:
+            tasks = check_tasks(options, outjson, FWHash, AnaRepo, AnaHash, lookup)
+
+            # Completed tasks are moved to GRIDIN-INDB during the next check
+            bookkept = 0
+            for task in tasks['COMPLETED']:
+                if task in bookkeeping_done or task in bookkeeping_failed:
+                    continue
+                print ""
+                print "##### ##### Book-keeping of", task, "##### #####"
+                try:
+                    task_options = runPostCrab.get_options([task + '.py'])
+                    if shared is None:
+                        shared = runPostCrab.SharedResources(task_options.processes)
+                    runPostCrab.process_task(task + '.py', task_options, shared)
+                    bookkeeping_done.add(task)
+                    bookkept += 1
+                except Exception as e:
+                    print "Warning: book-keeping failed, the task will not be retried:", e
+                    bookkeeping_failed.add(task)
+
+            print ""
+            if len(bookkeeping_failed) > 0:
+                print "##### Book-keeping failed for (run runPostCrab.py manually):", ' '.join(sorted(bookkeeping_failed))
+
+            ntasks = sum([len(v) for v in tasks.values()])
+            nactive = sum([len(v) for k, v in tasks.items() if is_active(k)])
+            if nactive == 0 and bookkept == 0:
+                print "##### No task can change anymore, stopping"
+                suggest_actions(tasks)
+                return
+
+            interval = options.max_interval - (options.max_interval - options.min_interval) * nactive / max(ntasks, 1)
+            print "##### %d / %d tasks active, next check in %d seconds" % (nactive, ntasks, interval)
+            time.sleep(interval)
+    finally:
+        if shared is not None:
+            shared.close()
+
+def main():
+    options = get_options()
+
+    FWHash = ""
+    AnaRepo = ""
+    AnaHash = ""
+
+    #####
+    # Figure out what is the name of the file things should be written into
+    #####
+    outjson = options.outjson
+    if options.new:
+        # NB: assumes all the on-going tasks are for the same analyzer
+        module = load_file(list_tasks()[0] + '.py')
+        psetName = module.config.JobType.psetName
+        print "##### Figure out the code(s) version"
+        # first the version of the framework
+        FWHash, FWRepo, FWUrl = getGitTagRepoUrl( os.path.join(CMSSW_BASE, 'src/cp3_llbb/Framework') )
+        # then the version of the analyzer
+        AnaHash, AnaRepo, AnaUrl = getGitTagRepoUrl( os.path.dirname( psetName ) )
+        outjson = 'prod_' + FWHash + '_' + AnaRepo + '_' + AnaHash + '.json'
+        print "The output json will be:", outjson
+    else:
+        newestjson = max(glob.iglob('prod_*.json'), key=os.path.getctime)
+        if outjson == 'prod_default.json' and newestjson != 'prod_default.json':
+            outjson = newestjson
+            FWHash, AnaRepo, AnaHash = outjson.strip('prod_').strip('.json').split('_')
+
+    from SAMADhi import DbStore
+
+    # A single connection, kept for all the checks of --watch
+    dbstore = DbStore()
+    try:
+        lookup = SampleLookup(dbstore)
+        if not options.watch:
+            tasks = check_tasks(options, outjson, FWHash, AnaRepo, AnaHash, lookup)
+            suggest_actions(tasks)
+            return
+
+        watch(options, outjson, FWHash, AnaRepo, AnaHash, lookup)
+    finally:
+        dbstore.close()
+
 if __name__ == '__main__':
     main()
@@ -5,25 +5,16 @@ from __future__ import division
 
 import argparse
 import os
-import sys
-import subprocess
 import json
 from pwd import getpwuid
 
-# import SAMADhi stuff
-CMSSW_BASE = os.environ['CMSSW_BASE']
-SCRAM_ARCH = os.environ['SCRAM_ARCH']
-sys.path.append(os.path.join(CMSSW_BASE,'bin', SCRAM_ARCH))
-
-# Add default ingrid storm package
-sys.path.append('/nfs/soft/python/python-2.7.5-sl6_amd64_gcc44/lib/python2.7/site-packages/storm-0.20-py2.7-linux-x86_64.egg')
-sys.path.append('/nfs/soft/python/python-2.7.5-sl6_amd64_gcc44/lib/python2.7/site-packages/MySQL_python-1.2.3-py2.7-linux-x86_64.egg')
+from cp3_llbb.GridIn.common import add_samadhi_path, load_file
+from cp3_llbb.GridIn.samadhi_utils import SampleLookup, sum_samples, copy_files
+from cp3_llbb.GridIn.git_version import getGitTagRepoUrl
 
-from SAMADhi import Dataset, Sample, File, DbStore
-import das_import
-
-# import some lumi utils
-from FWCore.PythonUtilities.LumiList import LumiList
+# SAMADhi and NumPy are only imported when needed
+CMSSW_BASE = os.environ['CMSSW_BASE']
+add_samadhi_path()
 
 def get_options():
     """
@@ -44,71 +35,22 @@ def get_options():
         parser.error('You must have at least 2 samples to merge')
     return options
 
-def load_file(filename):
-    directory, module_name = os.path.split(filename)
-    module_name = os.path.splitext(module_name)[0]
-    path = list(sys.path)
-    sys.path.insert(0, directory)
+def add_merged_sample(dbstore, NAME, type, AnaUrl, FWUrl, samples, comment):
+    # samples is a simple dict containing three keys: 'process', 'dataset_id', 'sample_id'
     try:
-        module = __import__(module_name)
-    finally:
-        sys.path[:] = path # restore
-    return module
-
-def get_dataset(inputDataset = None, inputID = None):
-    dbstore = DbStore()
-    if inputDataset is not None:
-        resultset = dbstore.find(Dataset, Dataset.name == inputDataset)
-    elif inputID is not None:
-        resultset = dbstore.find(Dataset, Dataset.dataset_id == inputID)
-    return list(resultset.values(Dataset.name, Dataset.dataset_id, Dataset.nevents, Dataset.process))
+        add_merged_sample_to_store(dbstore, NAME, type, AnaUrl, FWUrl, samples, comment)
+    except:
+        dbstore.rollback()
+        raise
 
-def get_sample(inputSample = None, inputID = None):
-    dbstore = DbStore()
-    if inputSample is not None:
-        resultset = dbstore.find(Sample, Sample.name == inputSample)
-    elif inputID is not None:
-        resultset = dbstore.find(Sample, Sample.sample_id == inputID)
-    return list(resultset.values(Sample.name, Sample.sample_id, Sample.source_dataset_id, Sample.code_version))
-
-def getGitTagRepoUrl(gitCallPath):
-    # get the stuff needed to write a valid url: name on github, name of repo, for both origin and upstream
-    proc = subprocess.Popen(['git', 'remote', 'show', 'origin'], cwd = gitCallPath, stdout=subprocess.PIPE)
-    remoteOrigin = proc.stdout.read()
-    remoteOrigin = [x.split(':')[-1].split('/') for x in remoteOrigin.split('\n') if 'Fetch URL' in x]
-    remoteOrigin, repoOrigin = remoteOrigin[0]
-    repoOrigin = repoOrigin.strip('.git')
-    proc = subprocess.Popen(['git', 'remote', 'show', 'upstream'], cwd = gitCallPath, stdout=subprocess.PIPE)
-    remoteUpstream = proc.stdout.read()
-    remoteUpstream = [x.split(':')[-1].split('/') for x in remoteUpstream.split('\n') if 'Fetch URL' in x]
-    remoteUpstream, repoUpstream = remoteUpstream[0]
-    repoUpstream = repoUpstream.strip('.git')
-    # get the hash of the commit
-    # Well, note that actually it should be the tag if a tag exist, the hash is the fallback solution
-    proc = subprocess.Popen(['git', 'describe', '--tags', '--always', '--dirty'], cwd = gitCallPath, stdout=subprocess.PIPE)
-    gitHash = proc.stdout.read().strip('\n')
-    if( 'dirty' in gitHash ):
-        raise AssertionError("Aborting: your working tree for repository", repoOrigin, "is dirty, please clean the changes not staged/committed before inserting this in the database") 
-    # get the list of branches in which you can find the hash
-    proc = subprocess.Popen(['git', 'branch', '-r', '--contains', gitHash], cwd = gitCallPath, stdout=subprocess.PIPE)
-    branch = proc.stdout.read()
-    if( 'upstream' in branch ):
-        url = "https://github.com/" + remoteUpstream + "/" + repoUpstream + "/tree/" + gitHash
-        repo = repoUpstream
-    elif( 'origin' in branch ):
-        url = "https://github.com/" + remoteOrigin + "/" + repoOrigin + "/tree/" + gitHash
-        repo = repoOrigin
-    elif( '/' in branch ):
-        url = "https://github.com/" + branch.strip(" ").split("/")[0] + "/" + repoOrigin + "/tree/" + branch.strip(" ").split("/")[1]
-        repo = repoOrigin
-    else:
-        print "PLEASE PUSH YOUR CODE!!! this result CANNOT be reproduced / bookkept outside of your ingrid session, so there is no point into putting it in the database, ABORTING now"
-        raise AssertionError("Code from repository " + repoUpstream + " has not been pushed")
-    return gitHash, repo, url
+def add_merged_sample_to_store(dbstore, NAME, type, AnaUrl, FWUrl, samples, comment):
+    """
+    Create or update the merged sample, everything being done in a single transaction. The sums are computed by the
+    database, and the files are copied with set-based statements
+    """
+    from SAMADhi import Sample
+    from cp3_llbb.GridIn.lumi_intervals import LumiIntervals
 
-def add_merged_sample(NAME, type, AnaUrl, FWUrl, samples, comment):
-    # samples is a simple dict containing three keys: 'process', 'dataset_id', 'sample_id'
-    dbstore = DbStore()
     sample = None
 
     # check that source dataset exist
@@ -124,49 +66,26 @@ def add_merged_sample(NAME, type, AnaUrl, FWUrl, samples, comment):
     else:
         update = True
         sample = checkExisting.one()
-        sample.removeFiles(dbstore)
 
-    # collecting contents
-    sample.nevents_processed = 0
-    sample.nevents = 0
+    # collecting contents, with aggregate queries
+    # Samples should exist, the check has been done before calling this function
+    sample_ids = [s['sample_id'] for s in samples]
+    sums = sum_samples(dbstore, sample_ids)
+
+    sample.source_dataset_id = samples[0]['dataset_id']
+    sample.source_sample_id = samples[0]['sample_id']
+    sample.nevents_processed = sums['nevents_processed']
+    sample.nevents = sums['nevents']
     sample.normalization = 1
-    sample.event_weight_sum = 0
-    extras_event_weight_sum = {}
-    dataset_nevents = 0
-    processed_lumi = LumiList()
-    for i, s in enumerate(samples):
-        if i == 0:
-            sample.source_dataset_id = s['dataset_id']
-            sample.source_sample_id = s['sample_id']
-        results = dbstore.find(Sample, Sample.sample_id == s['sample_id'])
-        # Should exist, the check has been done before calling this function
-        sample.nevents_processed += results[0].nevents_processed
-        sample.nevents += results[0].nevents
-        sample.event_weight_sum += results[0].event_weight_sum
-        extra_sumw = results[0].extras_event_weight_sum
-        if extra_sumw is not None:
-            extra_sumw = json.loads(extra_sumw)
-            for key in extra_sumw:
-                try:
-                    extras_event_weight_sum[key] += extra_sumw[key]
-                except KeyError:
-                    extras_event_weight_sum[key] = extra_sumw[key]
-        tmp_processed_lumi = results[0].processed_lumi
-        if tmp_processed_lumi is not None:
-            tmp_processed_lumi = json.loads( tmp_processed_lumi )
-            processed_lumi = processed_lumi | LumiList(compactList = tmp_processed_lumi)
-        # Get info from file table
-        results = dbstore.find(File, File.sample_id == s['sample_id'])
-        for lfn, pfn, event_weight_sum, file_extras_event_weight_sum, nevents in list(results.values(File.lfn, File.pfn, File.event_weight_sum, File.extras_event_weight_sum, File.nevents)):
-            f = File(lfn, pfn, event_weight_sum, file_extras_event_weight_sum, nevents)
-            sample.files.add(f)
-        # Get info from parent datasets
-        results = dbstore.find(Dataset, Dataset.dataset_id == s['dataset_id'])
-        dataset_nevents +=  results[0].nevents
-    if len(extras_event_weight_sum) > 0:
-        sample.extras_event_weight_sum = unicode(json.dumps(extras_event_weight_sum))
-    if len(processed_lumi.getCompactList()) > 0:
-        sample.processed_lumi = unicode(json.dumps(processed_lumi.getCompactList()))
+    sample.event_weight_sum = sums['event_weight_sum']
+    dataset_nevents = sums['dataset_nevents']
+
+    processed_lumi = LumiIntervals.union_all([LumiIntervals.from_compact_list(l) for l in sums['processed_lumi']])
+
+    if len(sums['extras_event_weight_sum']) > 0:
+        sample.extras_event_weight_sum = unicode(json.dumps(sums['extras_event_weight_sum']))
+    if len(processed_lumi) > 0:
+        sample.processed_lumi = unicode(json.dumps(processed_lumi.to_compact_list()))
     sample.code_version = unicode(AnaUrl + ' ' + FWUrl) #NB: limited to 255 characters, but so far so good
     if sample.nevents_processed != dataset_nevents:
         sample.user_comment = unicode("Sample was not fully processed, only " + str(sample.nevents_processed) + "/" + str(dataset_nevents) + " events were processed. " + comment)
@@ -176,6 +95,14 @@ def add_merged_sample(NAME, type, AnaUrl, FWUrl, samples, comment):
 
     if not update:
         dbstore.add(sample)
+    # Needed to get the id of a new sample
+    dbstore.flush()
+
+    # Copy the files of the merged samples, without loading them
+    copied = copy_files(dbstore, sample_ids, sample.sample_id)
+    print("Files: %d copied" % copied)
+
+    if not update:
         if sample.luminosity is None:
             sample.luminosity = sample.getLuminosity()
 
@@ -192,9 +119,6 @@ def add_merged_sample(NAME, type, AnaUrl, FWUrl, samples, comment):
         dbstore.commit()
         return
 
-    # rollback
-    dbstore.rollback()
-
 def main():
     options = get_options()
 
@@ -207,6 +131,18 @@ def main():
     print "##### Running on several tasks: will (attempt to) merge them in a single sample"
     print("")
 
+    from SAMADhi import DbStore
+
+    # All the samples and datasets are resolved in bulk, and the merged sample is inserted, over a single connection
+    dbstore = DbStore()
+    try:
+        merge(options, dbstore)
+    finally:
+        dbstore.close()
+
+def merge(options, dbstore):
+    lookup = SampleLookup(dbstore)
+
     print "##### Figure out the code(s) version"
     FWHash = ''
     FWRepo = ''
@@ -222,9 +158,10 @@ def main():
         # then the version of the analyzer
         AnaHash, AnaRepo, AnaUrl = getGitTagRepoUrl( os.path.dirname( psetName0 ) )
     elif options.SAMPLE_ID is not None and len(options.SAMPLE_ID) > 1:
-        sample = get_sample(inputID = options.SAMPLE_ID[0])
+        found_samples = lookup.samples_by_id(options.SAMPLE_ID)
+        sample = found_samples[options.SAMPLE_ID[0]]
         if len(sample) == 0:
-            raise AssertionError("Aborting: the sample", NAME, "does not exist in the database, please insert it first") 
+            raise AssertionError("Aborting: the sample", options.SAMPLE_ID[0], "does not exist in the database, please insert it first") 
         sample_name, sample_id, dataset_id, code_version = sample[0]
         AnaUrl, FWUrl = code_version.split()
         FWRepo = FWUrl.split('tree')[0].split('/')[-2]
@@ -241,30 +178,27 @@ def main():
     samples = []
     extensions = []
     if options.CrabConfig is not None and len(options.CrabConfig) > 1:
+        keys = []
         for CrabConfig in options.CrabConfig:
             module = load_file(CrabConfig)
             requestName = module.config.General.requestName
             NAME = requestName + '_' + FWHash + '_' + AnaRepo + '_' + AnaHash
-            sample = get_sample(inputSample = unicode(NAME))
-            if len(sample) == 0:
-                raise AssertionError("Aborting: the sample", NAME, "does not exist in the database, please insert it first") 
-            sample_name, sample_id, dataset_id, code_version = sample[0]
-            dataset = get_dataset(inputID = dataset_id)
-            dataset_name, dataset_id, dataset_nevents, dataset_process = dataset[0]
-            samples.append({'sample_id': sample_id, 'process':dataset_process, 'dataset_id':dataset_id})
-            if 'ext' in sample_name:
-                extensions.append( [x for x in sample_name.split('_') if 'ext' in x][0] )
+            keys.append(unicode(NAME))
+        found_samples = lookup.samples_by_name(keys)
     elif options.SAMPLE_ID is not None and len(options.SAMPLE_ID) > 1:
-        for SAMPLE_ID in options.SAMPLE_ID:
-            sample = get_sample(inputID = SAMPLE_ID)
-            if len(sample) == 0:
-                raise AssertionError("Aborting: the sample", NAME, "does not exist in the database, please insert it first") 
-            sample_name, sample_id, dataset_id, code_version = sample[0]
-            dataset = get_dataset(inputID = dataset_id)
-            dataset_name, dataset_id, dataset_nevents, dataset_process = dataset[0]
-            samples.append({'sample_id': sample_id, 'process':dataset_process, 'dataset_id':dataset_id})
-            if 'ext' in sample_name:
-                extensions.append( [x for x in sample_name.split('_') if 'ext' in x][0] )
+        # Already retrieved when figuring out the code version
+        keys = options.SAMPLE_ID
+    for key in keys:
+        if len(found_samples[key]) == 0:
+            raise AssertionError("Aborting: the sample", key, "does not exist in the database, please insert it first") 
+    found_datasets = lookup.datasets_by_id([found_samples[key][0][2] for key in keys])
+    for key in keys:
+        sample_name, sample_id, dataset_id, code_version = found_samples[key][0]
+        dataset_name, dataset_id, dataset_nevents, dataset_process = found_datasets[dataset_id][0]
+        samples.append({'sample_id': sample_id, 'process':dataset_process, 'dataset_id':dataset_id})
+        if 'ext' in sample_name:
+            extensions.append( [x for x in sample_name.split('_') if 'ext' in x][0] )
+    lookup.report()
             
     if len( set([ x['process'] for x in samples ]) ) != 1:
         print "samples=", samples
@@ -301,7 +235,7 @@ def main():
         else:
             comment += " and %i" % int(s['sample_id'])
     NAME += '_' + FWHash + '_' + AnaRepo + '_' + AnaHash 
-    add_merged_sample(NAME, 'NTUPLES', AnaUrl, FWUrl, samples, comment)
+    add_merged_sample(dbstore, NAME, 'NTUPLES', AnaUrl, FWUrl, samples, comment)
 
    
 if __name__ == '__main__':
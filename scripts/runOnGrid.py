@@ -6,14 +6,12 @@ __author__ = 'sbrochet'
 Launch crab or condor and run the framework on multiple datasets
 """
 
-from CRABAPI.RawCommand import crabCommand
-
-import json
 import copy
 import os
 import argparse
 import sys
-import subprocess
+
+from cp3_llbb.GridIn.common import add_samadhi_path, load_file
 
 def get_options():
     """
@@ -34,30 +32,69 @@ def get_options():
     parser.add_argument('-j', '--cores', type=int, action='store', dest='processes', metavar='N', default='4',
                         help='Number of core to use during the crab tasks creation')
 
+    parser.add_argument('--incremental', action='store_true', dest='incremental',
+                        help='Only create the tasks not already submitted (existing task directory) nor book-kept in SAMADhi with the current framework and analyzer versions')
+
+    parser.add_argument('--submit-threads', type=int, dest='submit_threads', metavar='N', default=4,
+                        help='Number of tasks handled concurrently. Crab commands are run one at a time, but the waits before retries overlap')
+
+    parser.add_argument('--submit-retries', type=int, dest='submit_retries', metavar='N', default=3,
+                        help='Number of additional submission attempts for a task, with exponential backoff')
+
+    parser.add_argument('--submit-interval', type=float, dest='submit_interval', metavar='SECONDS', default=2,
+                        help='Minimal time between two requests to the CRAB server')
+
     parser.add_argument('-l', '--lumi-mask', type=str, required=False, dest='lumi_mask', metavar='URL',
                         help='URL to the luminosity mask to use when running on data')
 
-    parser.add_argument('datasets', type=str, nargs='+', metavar='FILE',
-                        help='JSON files listings datasets to run over.')
+    parser.add_argument('--target-wall-time', type=float, dest='target_wall_time', metavar='HOURS',
+                        help='Choose the number of units per job of each dataset so that jobs last this long, using the reports of previous tasks (see runPostCrab.py --report)')
+
+    parser.add_argument('--plan', action='store_true', dest='plan',
+                        help='Only estimate the number of luminosity sections and of jobs of each data task, and warn about bad splittings')
+
+    parser.add_argument('--lumi-dumps', type=str, dest='lumi_dumps', metavar='DIR', default='lumi_dumps',
+                        help='Directory with the luminosity sections of the datasets, used by --plan. Missing dumps are created with dasgoclient')
+
+    parser.add_argument('--stage', action='store_true', dest='stage',
+                        help='In each job, copy remote input files to local scratch space in the background, while earlier files are processed')
+
+    parser.add_argument('--stage-budget', type=int, dest='stage_budget', metavar='MB',
+                        help='Maximum disk space used by the files staged by each job (default: 10000)')
+
+    parser.add_argument('--redirectors', type=str, dest='redirectors', metavar='URLS',
+                        help='Comma-separated list of xrootd redirectors the jobs choose from for the files not available at their site. \'site\' stands for the xrootd server of the site (default: site, then the global and the regional redirectors)')
+
+    parser.add_argument('--name', type=str, action='append', dest='names', metavar='PATTERN',
+                        help='Only run over the datasets whose name matches this shell-style pattern. Can be repeated')
+
+    parser.add_argument('--era', type=str, action='append', dest='eras', metavar='ERA',
+                        help='Only run over the datasets of this era. Can be repeated')
+
+    parser.add_argument('--tag', type=str, action='append', dest='tags', metavar='TAG',
+                        help='Only run over the datasets with this tag (or defined in a JSON file with this name, without extension). Can be repeated')
+
+    parser.add_argument('--all', action='store_true', dest='all',
+                        help='Select the datasets among the whole Datasets repository, instead of the given files')
+
+    parser.add_argument('datasets', type=str, nargs='*', metavar='FILE',
+                        help='JSON files listings datasets to run over, or directories containing such files.')
 
     options = parser.parse_args()
 
-    if options.datasets is None:
-        parser.error('You must specify a file listings the datasets to run over.')
+    if options.all:
+        if len(options.datasets) > 0:
+            parser.error('--all can not be used with files listing the datasets')
+        options.datasets = [os.path.join(os.environ['CMSSW_BASE'], 'src/cp3_llbb/Datasets')]
+    elif len(options.datasets) == 0:
+        parser.error('You must specify a file listings the datasets to run over, or --all.')
 
     c = options.psetName
     if not os.path.isfile(c):
         # Try to find the psetName file
-        filename = os.path.basename(c)
-        path = os.path.join(os.environ['CMSSW_BASE'], 'src/cp3_llbb')
-        c = None
-        for root, dirs, files in os.walk(path):
-            if filename in files:
-                c = os.path.join(root, filename)
-                break
-
-        if c is None:
-            raise IOError('Configuration file %r not found inside the cp3_llbb package' % filename)
+        from cp3_llbb.GridIn.file_index import FileIndex
+        index = FileIndex(os.path.join(os.environ['CMSSW_BASE'], 'src/cp3_llbb'))
+        c = index.find_one(os.path.basename(c))
 
     options.psetName = c
 
@@ -66,27 +103,114 @@ def get_options():
 options = get_options()
 
 # get the name of the output file
-filename = options.psetName
-directory, module_name = os.path.split(filename)
-module_name = os.path.splitext(module_name)[0]
-path = list(sys.path)
-sys.path.insert(0, directory)
-try:
-  module = __import__(module_name)
-finally:
-  sys.path[:] = path # restore
+module = load_file(options.psetName)
 
 print("")
 
 options.outputFile = module.process.framework.output.value()
 
-datasets = {}
-for dataset_file in options.datasets:
-    with open(dataset_file) as f:
-        datasets.update(json.load(f))
+from cp3_llbb.GridIn.dataset_catalog import DatasetCatalog
 
-from cp3_llbb.GridIn.default_crab_config import create_config
+catalog = DatasetCatalog.load(options.datasets)
+datasets = catalog.select(names=options.names, eras=options.eras, data=options.data, tags=options.tags)
+print('%d / %d datasets selected' % (len(datasets), len(catalog.datasets)))
+print('')
 
+from cp3_llbb.GridIn.default_crab_config import WORK_AREA, create_config, get_splitting
+from cp3_llbb.GridIn.job_telemetry import TELEMETRY_FILE
+
+def get_missing_datasets(datasets):
+    """
+    Remove from ``datasets`` the ones already submitted, ie whose task directory exists, and the ones whose sample is
+    already in SAMADhi for the current versions of the framework and of the analyzer. SAMADhi is queried only once.
+    """
+    from cp3_llbb.GridIn.git_version import getGitTagRepoUrl
+    from cp3_llbb.GridIn.samadhi_utils import SampleLookup, sample_name
+
+    missing = {}
+    for dataset, opt in datasets.items():
+        if os.path.isdir(os.path.join(WORK_AREA, 'crab_' + opt['name'])):
+            print('Skipping %r: task already submitted' % opt['name'])
+        else:
+            missing[dataset] = opt
+
+    try:
+        FWHash, FWRepo, FWUrl = getGitTagRepoUrl(os.path.join(os.environ['CMSSW_BASE'], 'src/cp3_llbb/Framework'))
+        AnaHash, AnaRepo, AnaUrl = getGitTagRepoUrl(os.path.dirname(options.psetName))
+    except AssertionError as e:
+        print('Warning: code versions unknown (%s), SAMADhi is not checked' % (e,))
+        return missing
+
+    names = dict((unicode(sample_name(opt['name'], FWHash, AnaRepo, AnaHash)), dataset) for dataset, opt in missing.items())
+
+    add_samadhi_path()
+    from SAMADhi import DbStore
+
+    dbstore = DbStore()
+    try:
+        lookup = SampleLookup(dbstore)
+        samples = lookup.samples_by_name(names.keys(), ('sample_id',))
+    finally:
+        dbstore.close()
+
+    for name, rows in samples.items():
+        if len(rows) > 0:
+            print('Skipping %r: sample %r already in SAMADhi' % (missing[names[name]]['name'], name))
+            del missing[names[name]]
+
+    return missing
+
+if options.incremental:
+    n_datasets = len(datasets)
+    datasets = get_missing_datasets(datasets)
+    print('%d / %d datasets are missing' % (len(datasets), n_datasets))
+    print('')
+
+sizer = None
+if options.target_wall_time:
+    from cp3_llbb.GridIn.job_sizing import JobSizer
+    sizer = JobSizer.from_work_area(WORK_AREA)
+
+def get_units_per_job(dataset, opt):
+    if sizer is None:
+        return opt['units_per_job']
+
+    units_per_job, justification = sizer.units_per_job(options.psetName, dataset, get_splitting(options.mc),
+            options.target_wall_time * 3600, opt['units_per_job'])
+    print("Units per job for %r: %d (%s)" % (opt['name'], units_per_job, justification))
+    return units_per_job
+
+def get_lumi_mask(opt):
+    if not 'certified_lumi_file' in opt and not options.lumi_mask:
+        raise Exception('You are running on data but no luminosity mask is specified for task %r. Please add the \'--lumi-mask\' argument or use the \'certified_lumi_file\' key inside the JSON file' % (opt['name']))
+
+    return options.lumi_mask if options.lumi_mask else opt['certified_lumi_file']
+
+def plan(datasets):
+    """
+    Estimate the luminosity sections and the jobs of each data task
+    """
+    from cp3_llbb.GridIn.job_planning import load_lumi_json, get_dataset_lumis, plan_dataset, print_plan
+
+    masks = {}
+    plans = []
+    for dataset, opt in sorted(datasets.items(), key=lambda x: x[1]['name']):
+        mask = get_lumi_mask(opt)
+        if mask not in masks:
+            masks[mask] = load_lumi_json(mask)
+        plans.append(plan_dataset(opt['name'], get_dataset_lumis(dataset, options.lumi_dumps), masks[mask],
+                                  opt['run_range'], get_units_per_job(dataset, opt)))
+
+    print("")
+    print_plan(plans)
+
+if options.plan:
+    if options.mc:
+        raise Exception('--plan is only available for data')
+    plan(datasets)
+    sys.exit(0)
+
+# The crab client is only needed from here, to create the tasks
 config = create_config(options.mc)
 
 def submit(dataset, opt):
@@ -94,6 +218,7 @@ def submit(dataset, opt):
 
     c.JobType.psetName = options.psetName
     c.JobType.outputFiles.append(options.outputFile)
+    c.JobType.outputFiles.append(TELEMETRY_FILE)
 
     if hasattr(module.process, 'gridin') and hasattr(module.process.gridin, 'input_files') and len(module.process.gridin.input_files) > 0:
         if not hasattr(c.JobType, 'inputFiles'):
@@ -105,7 +230,7 @@ def submit(dataset, opt):
     c.Data.outputDatasetTag = opt['name']
 
     c.Data.inputDataset = dataset
-    c.Data.unitsPerJob = opt['units_per_job']
+    c.Data.unitsPerJob = get_units_per_job(dataset, opt)
 
     pyCfgParams = []
 
@@ -122,30 +247,49 @@ def submit(dataset, opt):
 
     c.JobType.pyCfgParams = pyCfgParams
 
-    print("Submitting new task %r" % opt['name'])
+    # Options of runFrameworkOnGrid.py: crab only passes key=value arguments to the job script
+    scriptArgs = []
+    if options.stage:
+        scriptArgs += ['stage=1']
+        if options.stage_budget is not None:
+            scriptArgs += ['stage_budget=%d' % options.stage_budget]
+
+    if options.redirectors:
+        scriptArgs += ['redirectors=%s' % options.redirectors]
+
+    if len(scriptArgs) > 0:
+        c.JobType.scriptArgs = list(getattr(c.JobType, 'scriptArgs', [])) + scriptArgs
+
+    print("Creating new task %r" % opt['name'])
     print("\tDataset: %s" % dataset)
 
     if options.data:
         c.Data.runRange = '%d-%d' % (opt['run_range'][0], opt['run_range'][1])
-        if not 'certified_lumi_file' in opt and not options.lumi_mask:
-            raise Exception('You are running on data but no luminosity mask is specified for task %r. Please add the \'--lumi-mask\' argument or use the \'certified_lumi_file\' key inside the JSON file' % (opt['name']))
-
-        c.Data.lumiMask = options.lumi_mask if options.lumi_mask else opt['certified_lumi_file']
+        c.Data.lumiMask = get_lumi_mask(opt)
 
     # Create output file in case something goes wrong with submit
     crab_config_file = 'crab_' + opt['name'] + '.py'
     with open(crab_config_file, 'w') as f:
         f.write(str(c))
 
-    if options.submit:
-        subprocess.call(['crab', 'submit', crab_config_file])
-    else:
-        print('Configuration file saved as %r' % ('crab_' + opt['name'] + '.py'))
+    print('Configuration file saved as %r' % crab_config_file)
+
+    return crab_config_file
 
 def submit_wrapper(args):
-    submit(*args)
+    return submit(*args)
 
 from multiprocessing import Pool
 pool = Pool(processes=options.processes)
-pool.map(submit_wrapper, datasets.items())
+crab_config_files = pool.map(submit_wrapper, datasets.items())
+
+if options.submit:
+    from cp3_llbb.GridIn.crab_submission import load_crab_config, submit_tasks, print_summary
+
+    print("")
+    results = submit_tasks([load_crab_config(f) for f in crab_config_files], threads=options.submit_threads,
+                           retries=options.submit_retries, interval=options.submit_interval)
+    print("")
+    print_summary(results)
+
 
@@ -6,60 +6,156 @@ from __future__ import division
 import argparse
 import os
 import sys
-import subprocess
 import tarfile
 import contextlib
+import threading
 import json
 from pwd import getpwuid
 
-# import SAMADhi stuff
-CMSSW_BASE = os.environ['CMSSW_BASE']
-SCRAM_ARCH = os.environ['SCRAM_ARCH']
-sys.path.append(os.path.join(CMSSW_BASE,'bin', SCRAM_ARCH))
-
-# Add default ingrid storm package
-sys.path.append('/nfs/soft/python/python-2.7.5-sl6_amd64_gcc44/lib/python2.7/site-packages/storm-0.20-py2.7-linux-x86_64.egg')
-sys.path.append('/nfs/soft/python/python-2.7.5-sl6_amd64_gcc44/lib/python2.7/site-packages/MySQL_python-1.2.3-py2.7-linux-x86_64.egg')
-
-from SAMADhi import Dataset, Sample, File, DbStore
-import das_import
+from cp3_llbb.GridIn.common import add_samadhi_path, load_file, mark_started, mute_output, wait_with_deadlines
+from cp3_llbb.GridIn.file_data_cache import FileDataCache
+from cp3_llbb.GridIn.samadhi_utils import sync_files, sample_name
+from cp3_llbb.GridIn.git_version import getGitTagRepoUrl
+from cp3_llbb.GridIn.framework_output import READERS, get_file_data, get_file_stat
 
-# import CRAB3 stuff
-from CRABAPI.RawCommand import crabCommand
+# SAMADhi, das_import, the CRAB client and ROOT are only imported when needed
+CMSSW_BASE = os.environ['CMSSW_BASE']
+add_samadhi_path()
 
-# import a bit of ROOT
-import ROOT
-ROOT.gROOT.Reset()
+def scan_file(pfn, cached_stat=None, reader='root', started=None, index=None):
+    """
+    Read ``pfn`` with ``reader`` unless its size and modification time are equal to ``cached_stat``.
+    Suitable for a worker process: any failure is reported as a missing file
+    :param started: shared dict where the start of the job ``index`` is recorded, for its timeout
+    :return: a tuple ``(stat, data)``, where ``data`` is None if the cached content is still valid, or the
+             output of ``get_file_data`` otherwise
+    """
+    mark_started(started, index)
+    try:
+        stat = get_file_stat(pfn, reader)
+        if cached_stat is not None and stat == cached_stat:
+            return (stat, None)
+        return (stat, get_file_data(pfn, reader))
+    except Exception as e:
+        print("Warning: failed to read %r: %s" % (pfn, e))
+        return (None, (None, None, None))
+
+class WorkerPool(object):
+    """
+    A pool of worker processes shared by several threads. A pool with workers stuck on a file is abandoned: it's
+    terminated once no thread uses it anymore, and a new pool is created for the next users
+    """
 
-def get_file_data(pfn):
+    def __init__(self, processes):
+        from multiprocessing import Pool
+
+        self.processes = processes
+        self._pool = Pool(processes=processes)
+        self._users = {}
+        self._lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def get(self):
+        """
+        Borrow the current pool of worker processes
+        """
+        from multiprocessing import Pool
+
+        with self._lock:
+            if self._pool is None:
+                self._pool = Pool(processes=self.processes)
+            pool = self._pool
+            self._users[pool] = self._users.get(pool, 0) + 1
+        try:
+            yield pool
+        finally:
+            with self._lock:
+                self._users[pool] -= 1
+                abandoned = pool is not self._pool and self._users[pool] == 0
+                if abandoned:
+                    del self._users[pool]
+            if abandoned:
+                pool.terminate()
+                pool.join()
+
+    def recycle(self, pool):
+        """
+        Stop using ``pool``, whose workers are stuck
+        """
+        with self._lock:
+            if pool is self._pool:
+                self._pool = None
+
+    def close(self):
+        """
+        Terminate all the pools, killing the workers stuck on a file
+        """
+        with self._lock:
+            pools = set(self._users)
+            if self._pool is not None:
+                pools.add(self._pool)
+            self._pool = None
+            self._users = {}
+        for pool in pools:
+            pool.terminate()
+            pool.join()
+
+def get_files_data(lfns, storagePrefix, processes=1, timeout=None, cache=None, pool=None, reader='root'):
     """
-    Return the sum of event weights and the entries of the framework output
+    Call ``get_file_data`` on each file of ``lfns``, using a pool of ``processes`` worker processes.
+    ROOT is not thread-friendly, hence processes and not threads.
+    :param lfns: list of files to read
+    :param storagePrefix: prefix added to each LFN to access the file
+    :param processes: number of files read concurrently. With 1 or less, files are read serially in this process
+    :param timeout: time in seconds allowed to each file, from the moment a worker starts reading it, before it's
+                    considered as missing. Only used with a pool
+    :param cache: a ``FileDataCache``. Only files not in the cache, or modified since, are read
+    :param pool: an existing ``WorkerPool`` to use, instead of creating a new one
+    :param reader: how files are read, among ``framework_output.READERS``
+    :return: the list of ``(sumw, extras_sumw, entries)``, in the same order as ``lfns``
     """
-    f = ROOT.TFile.Open(pfn)
-    if not f:
-        return (None, None)
+    cached = cache.get(lfns) if cache is not None else {}
+    jobs = [(storagePrefix + lfn, cached[lfn][0] if lfn in cached else None, reader) for lfn in lfns]
 
-    nominal_sumw = f.Get("event_weight_sum")
-    if nominal_sumw:
-        nominal_sumw = nominal_sumw.GetVal()
+    if pool is None and processes <= 1:
+        scanned = [scan_file(*job) for job in jobs]
     else:
-        nominal_sumw = None
-
-    # Grab extras sum of event weight
-    extras_sumw = {}
-    for key in f.GetListOfKeys():
-        if key.GetName().startswith('event_weight_sum_'):
-            suffix = key.GetName().replace('event_weight_sum_', '')
-            obj = key.ReadObj()
-            if obj:
-                extras_sumw[suffix] = obj.GetVal()
-
-    entries = None
-    tree = f.Get("t")
-    if tree:
-        entries = tree.GetEntriesFast()
-
-    return (nominal_sumw, extras_sumw, entries)
+        from multiprocessing import Manager
+        own_pool = pool is None
+        if own_pool:
+            pool = WorkerPool(processes)
+        # The workers record when they start each file: files waiting in the queue do not time out
+        manager = Manager()
+        try:
+            with pool.get() as workers:
+                started = manager.dict()
+                async_results = [workers.apply_async(scan_file, job + (started, i)) for i, job in enumerate(jobs)]
+                scanned, timed_out = wait_with_deadlines(async_results, started, timeout)
+                for i in sorted(timed_out):
+                    print("Warning: timeout while reading %r" % jobs[i][0])
+                    scanned[i] = (None, (None, None, None))
+                # The workers stuck on a file are killed with their pool
+                if timed_out:
+                    pool.recycle(workers)
+        finally:
+            manager.shutdown()
+            if own_pool:
+                pool.close()
+
+    results = []
+    new_entries = []
+    for lfn, (stat, data) in zip(lfns, scanned):
+        if data is None:
+            data = cached[lfn][1]
+        elif stat is not None and data[0]:
+            new_entries.append((lfn, stat, data))
+        results.append(data)
+
+    if cache is not None:
+        cache.update(new_entries)
+        print("%d / %d files read from the cache" % (len(lfns) - len([x for x in scanned if x[1] is not None]), len(lfns)))
+
+    return results
 
 def sum_dicts(a, b):
     """
@@ -87,70 +183,37 @@ def sum_dicts(a, b):
 
     return r
 
-def get_options():
+def get_options(args=None):
     """
-    Parse and return the arguments provided by the user.
+    Parse and return the arguments provided by the user, or ``args`` if not None.
     """
     parser = argparse.ArgumentParser(description='Gather the information on a processed sample and insert the information in SAMADhi')
-    parser.add_argument('CrabConfig', type=str, metavar='FILE',
-                        help='CRAB3 configuration file (including .py extension).')
+    parser.add_argument('CrabConfig', type=str, metavar='FILE', nargs='+',
+                        help='CRAB3 configuration files (including .py extension). Shell-style wildcards are expanded.')
     parser.add_argument('--debug', action='store_true', help='More verbose output', dest='debug')
-    options = parser.parse_args()
+    parser.add_argument('-j', '--cores', type=int, action='store', dest='processes', metavar='N', default=4,
+                        help='Number of output files read concurrently, by as many worker processes')
+    parser.add_argument('--timeout', type=int, action='store', dest='timeout', metavar='SECONDS', default=600,
+                        help='Time allowed to read a single output file before considering it as missing')
+    parser.add_argument('--reader', type=str, action='store', dest='reader', choices=READERS, default='root',
+                        help='How output files are read: with PyROOT, or with a lightweight reader not loading ROOT, which falls back to PyROOT for the files it cannot read')
+    parser.add_argument('--no-cache', action='store_false', dest='use_cache',
+                        help='Read all the output files again, instead of using the content cached by previous executions')
+    parser.add_argument('-t', '--tasks', type=int, action='store', dest='tasks', metavar='N', default=4,
+                        help='Number of tasks processed concurrently when several configuration files are given')
+    parser.add_argument('--report', action='store_true', dest='report',
+                        help='Instead of inserting the samples in the database, report the throughput of the jobs of each task')
+    options = parser.parse_args(args)
     return options
 
-def load_file(filename):
-    directory, module_name = os.path.split(filename)
-    module_name = os.path.splitext(module_name)[0]
-    path = list(sys.path)
-    sys.path.insert(0, directory)
-    try:
-        module = __import__(module_name)
-    finally:
-        sys.path[:] = path # restore
-    return module
+def get_dataset(dbstore, inputDataset):
+    from SAMADhi import Dataset
 
-def get_dataset(inputDataset):
-    dbstore = DbStore()
     resultset = dbstore.find(Dataset, Dataset.name==inputDataset)
     return list(resultset.values(Dataset.name, Dataset.dataset_id, Dataset.nevents))
 
-def getGitTagRepoUrl(gitCallPath):
-    # get the stuff needed to write a valid url: name on github, name of repo, for both origin and upstream
-    proc = subprocess.Popen(['git', 'remote', 'show', 'origin'], cwd = gitCallPath, stdout=subprocess.PIPE)
-    remoteOrigin = proc.stdout.read()
-    remoteOrigin = [x.split(':')[-1].split('/') for x in remoteOrigin.split('\n') if 'Fetch URL' in x]
-    remoteOrigin, repoOrigin = remoteOrigin[0]
-    repoOrigin = repoOrigin.strip('.git')
-    proc = subprocess.Popen(['git', 'remote', 'show', 'upstream'], cwd = gitCallPath, stdout=subprocess.PIPE)
-    remoteUpstream = proc.stdout.read()
-    remoteUpstream = [x.split(':')[-1].split('/') for x in remoteUpstream.split('\n') if 'Fetch URL' in x]
-    remoteUpstream, repoUpstream = remoteUpstream[0]
-    repoUpstream = repoUpstream.strip('.git')
-    # get the hash of the commit
-    # Well, note that actually it should be the tag if a tag exist, the hash is the fallback solution
-    proc = subprocess.Popen(['git', 'describe', '--tags', '--always', '--dirty'], cwd = gitCallPath, stdout=subprocess.PIPE)
-    gitHash = proc.stdout.read().strip('\n')
-    if( 'dirty' in gitHash ):
-        raise AssertionError("Aborting: your working tree for repository", repoOrigin, "is dirty, please clean the changes not staged/committed before inserting this in the database") 
-    # get the list of branches in which you can find the hash
-    proc = subprocess.Popen(['git', 'branch', '-r', '--contains', gitHash], cwd = gitCallPath, stdout=subprocess.PIPE)
-    branch = proc.stdout.read()
-    if( 'upstream' in branch ):
-        url = "https://github.com/" + remoteUpstream + "/" + repoUpstream + "/tree/" + gitHash
-        repo = repoUpstream
-    elif( 'origin' in branch ):
-        url = "https://github.com/" + remoteOrigin + "/" + repoOrigin + "/tree/" + gitHash
-        repo = repoOrigin
-    elif( '/' in branch ):
-        url = "https://github.com/" + branch.strip(" ").split("/")[0] + "/" + repoOrigin + "/tree/" + branch.strip(" ").split("/")[1]
-        repo = repoOrigin
-    else:
-        print "PLEASE PUSH YOUR CODE!!! this result CANNOT be reproduced / bookkept outside of your ingrid session, so there is no point into putting it in the database, ABORTING now"
-        raise AssertionError("Code from repository " + repoUpstream + " has not been pushed")
-    return gitHash, repo, url
-
-def add_sample(NAME, localpath, type, nevents, nselected, AnaUrl, FWUrl, dataset_id, sumw, extras_sumw, has_job_processed_everything, dataset_nevents, files, processed_lumi=None):
-    dbstore = DbStore()
+def add_sample(dbstore, NAME, localpath, type, nevents, nselected, AnaUrl, FWUrl, dataset_id, sumw, extras_sumw, has_job_processed_everything, dataset_nevents, files, processed_lumi=None):
+    from SAMADhi import Dataset, Sample
 
     sample = None
 
@@ -166,7 +229,6 @@ def add_sample(NAME, localpath, type, nevents, nselected, AnaUrl, FWUrl, dataset
     else:
         update = True
         sample = checkExisting.one()
-        sample.removeFiles(dbstore)
 
     sample.nevents_processed = nevents
     sample.nevents = nselected
@@ -188,11 +250,16 @@ def add_sample(NAME, localpath, type, nevents, nselected, AnaUrl, FWUrl, dataset
     else:
         sample.processed_lumi = None
 
-    for f in files:
-        sample.files.add(f)
-
     if not update:
         dbstore.add(sample)
+    # Needed to get the id of a new sample
+    dbstore.flush()
+
+    # Only new or modified files are written, in bulk
+    inserted, updated, deleted = sync_files(dbstore, sample.sample_id, files)
+    print("Files: %d inserted, %d updated, %d deleted" % (inserted, updated, deleted))
+
+    if not update:
         if sample.luminosity is None:
             sample.luminosity = sample.getLuminosity()
 
@@ -213,17 +280,70 @@ def add_sample(NAME, localpath, type, nevents, nselected, AnaUrl, FWUrl, dataset
     dbstore.rollback()
 
 
-def main():
-    options = get_options()
-
+def get_storage_prefix():
+    """
+    Return the prefix to add to LFNs to access the output files from this machine
+    """
     import platform
     if 'ingrid' in platform.node():
-        storagePrefix = "/storage/data/cms"
+        return "/storage/data/cms"
     else:
-        storagePrefix = "root://cms-xrd-global.cern.ch/"
+        return "root://cms-xrd-global.cern.ch/"
+
+class SharedResources(object):
+    """
+    Resources shared by all the tasks processed during one execution: the database connection, the pool of worker
+    processes reading the output files, and the code versions.
+    The database and the crab client are not thread-safe: use ``db_lock`` and ``crab_lock`` around them.
+    """
+
+    def __init__(self, processes):
+        from SAMADhi import DbStore
+
+        self.dbstore = DbStore()
+        self.db_lock = threading.RLock()
+        self.crab_lock = threading.Lock()
+        # Create the workers before any thread is started. Files are always read by worker processes, even one at a
+        # time: the tasks are processed by threads, and ROOT is not thread-friendly. This also enforces the timeout
+        self.pool = WorkerPool(max(processes, 1))
+        self._versions = {}
+        self._versions_lock = threading.Lock()
+
+    def get_code_version(self, gitCallPath):
+        """
+        Same as ``getGitTagRepoUrl``, called only once per repository
+        """
+        gitCallPath = os.path.realpath(gitCallPath)
+        with self._versions_lock:
+            if gitCallPath not in self._versions:
+                self._versions[gitCallPath] = getGitTagRepoUrl(gitCallPath)
+            return self._versions[gitCallPath]
+
+    def close(self):
+        self.pool.close()
+        self.dbstore.close()
+
+def process_task(CrabConfig, options, shared=None):
+    """
+    Gather the information on a completed crab task and insert the corresponding sample in SAMADhi
+    :param CrabConfig: the crab configuration file of the task
+    :param options: the options of the script, as returned by ``get_options``
+    :param shared: the ``SharedResources`` to use. If None, new ones are created for this task only
+    :return: the name of the sample
+    """
+    if shared is None:
+        shared = SharedResources(options.processes)
+        try:
+            return process_task(CrabConfig, options, shared)
+        finally:
+            shared.close()
+
+    from CRABAPI.RawCommand import crabCommand
+
+    storagePrefix = get_storage_prefix()
 
     print "##### Get information out of the crab config file (work area, dataset, pset)"
-    module = load_file(options.CrabConfig)
+    module = load_file(CrabConfig)
     workArea = module.config.General.workArea
     requestName = module.config.General.requestName
     psetName = module.config.JobType.psetName
@@ -236,16 +356,18 @@ def main():
     # if yes then grab its ID
     # if not then run das_import.py to add it
     # print inputDataset
-    values = get_dataset(inputDataset)
-    # print values
-    if( len(values) == 0 ):
-        tmp_sysargv = sys.argv
-        sys.argv = ["das_import.py", inputDataset]
-        print "calling das_import"
-        das_import.main()
-        print "done"
-        sys.argv = tmp_sysargv
-        values = get_dataset(inputDataset)
+    with shared.db_lock:
+        values = get_dataset(shared.dbstore, inputDataset)
+        # print values
+        if( len(values) == 0 ):
+            tmp_sysargv = sys.argv
+            sys.argv = ["das_import.py", inputDataset]
+            print "calling das_import"
+            import das_import
+            das_import.main()
+            print "done"
+            sys.argv = tmp_sysargv
+            values = get_dataset(shared.dbstore, inputDataset)
     # if there is more than one sample then we're in trouble, crash here
     assert( len(values) == 1 )
     dataset_name, dataset_id, dataset_nevents = values[0]
@@ -254,18 +376,13 @@ def main():
     print("")
     
     print "##### Get info from crab (outputs, report)"
-    # Since the API outputs AND prints the same data, hide whatever is printed on screen
-    saved_stdout, saved_stderr = sys.stdout, sys.stderr
-    if not options.debug:
-        sys.stdout = sys.stderr = open(os.devnull, "w")
     taskdir = os.path.join(workArea, 'crab_' + requestName)
-    # list output
-    output_files = crabCommand('getoutput', '--dump', dir = taskdir )
-    # get crab report
-    report = crabCommand('report', dir = taskdir )
-    # restore print to stdout 
-    if not options.debug:
-        sys.stdout, sys.stderr = saved_stdout, saved_stderr
+    # Since the API outputs AND prints the same data, hide whatever is printed on screen by this thread
+    with shared.crab_lock, mute_output(not options.debug):
+        # list output
+        output_files = crabCommand('getoutput', '--dump', dir = taskdir )
+        # get crab report
+        report = crabCommand('report', dir = taskdir )
 #    print "log_files=", log_files
 #    print "output_files=", output_files
 #    print "report=", report
@@ -276,13 +393,16 @@ def main():
     print "##### Get information from the output files"
     files = []
     for (i, lfn) in enumerate(output_files['lfn']):
+        # Skip the other outputs of the jobs, like the telemetry sidecars
+        if not lfn.endswith('.root'):
+            continue
         pfn = output_files['pfn'][i]
         files.append({'lfn': lfn, 'pfn': pfn})
 
     # DEBUG
     #files.append({'lfn': '/store/user/sbrochet/TTTo2L2Nu_13TeV-powheg/TTTo2L2Nu_13TeV-powheg_MiniAODv2/160210_181039/0000/output_mc_1.root', 'pfn': 'srm://ingrid-se02.cism.ucl.ac.be:8444/srm/managerv2?SFN=/storage/data/cms/store/user/sbrochet/TTTo2L2Nu_13TeV-powheg/TTTo2L2Nu_13TeV-powheg_MiniAODv2/160210_181039/0000/output_mc_1.root'})
 
-    folder = os.path.dirname(output_files['lfn'][0])
+    folder = os.path.dirname(files[0]['lfn'])
     folder = storagePrefix + folder
 
     db_files = []
@@ -290,8 +410,13 @@ def main():
     dataset_extras_sumw = {}
     dataset_nselected = 0
     file_missing = False
-    for f in files:
-        (sumw, extras_sumw, entries) = get_file_data(storagePrefix + f['lfn'])
+    cache = None
+    if options.use_cache:
+        cache = FileDataCache(os.path.join(taskdir, 'gridin_files_cache.sqlite'))
+    files_data = get_files_data([f['lfn'] for f in files], storagePrefix, options.processes, options.timeout, cache, shared.pool, options.reader)
+    if cache is not None:
+        cache.close()
+    for f, (sumw, extras_sumw, entries) in zip(files, files_data):
         if not sumw:
             print("Warning: failed to retrieve sum of event weight for %r" % f['lfn'])
             file_missing = True
@@ -308,7 +433,7 @@ def main():
         # Convert python dict to json
         extras_sumw_json = unicode(json.dumps(extras_sumw, separators=(',', ':')))
 
-        db_files.append(File(unicode(f['lfn']), unicode(f['pfn']), sumw, extras_sumw_json, entries))
+        db_files.append((unicode(f['lfn']), unicode(f['pfn']), sumw, extras_sumw_json, entries))
 
     print "∑w = %.4f" % dataset_sumw
     print "Number of selected events: %d" % dataset_nselected
@@ -334,14 +459,19 @@ def main():
 
     processed_lumi = None
     if is_data:
-        processed_lumi = report['analyzedLumis']
+        from cp3_llbb.GridIn.lumi_intervals import LumiIntervals
+
+        # Sorted, with adjacent intervals merged
+        processed_lumi = LumiIntervals.from_compact_list(report['analyzedLumis'])
+        print "Processed luminosity sections: %d in %d runs" % (len(processed_lumi), len(processed_lumi.runs()))
+        processed_lumi = processed_lumi.to_compact_list()
 
     print "##### Figure out the code(s) version"
     # first the version of the framework
-    FWHash, FWRepo, FWUrl = getGitTagRepoUrl( os.path.join(CMSSW_BASE, 'src/cp3_llbb/Framework') )
+    FWHash, FWRepo, FWUrl = shared.get_code_version( os.path.join(CMSSW_BASE, 'src/cp3_llbb/Framework') )
     print "FWUrl=", FWUrl
     # then the version of the analyzer
-    AnaHash, AnaRepo, AnaUrl = getGitTagRepoUrl( os.path.dirname( psetName ) )
+    AnaHash, AnaRepo, AnaUrl = shared.get_code_version( os.path.dirname( psetName ) )
     print "AnaUrl=", AnaUrl
 
     print("")
@@ -361,8 +491,132 @@ def main():
     # AnaHash, AnaRepo, AnaUrl
     # dataset_nselected
     # localpath
-    NAME = requestName + '_' + FWHash + '_' + AnaRepo + '_' + AnaHash
-    add_sample(NAME, folder, "NTUPLES", report['eventsRead'], dataset_nselected, AnaUrl, FWUrl, dataset_id, dataset_sumw, dataset_extras_sumw, has_job_processed_everything, dataset_nevents, db_files, processed_lumi)
+    NAME = sample_name(requestName, FWHash, AnaRepo, AnaHash)
+    with shared.db_lock:
+        try:
+            add_sample(shared.dbstore, NAME, folder, "NTUPLES", report['eventsRead'], dataset_nselected, AnaUrl, FWUrl, dataset_id, dataset_sumw, dataset_extras_sumw, has_job_processed_everything, dataset_nevents, db_files, processed_lumi)
+        except:
+            # Leave the shared connection usable by the other tasks
+            shared.dbstore.rollback()
+            raise
+
+    return NAME
+
+def report_task(CrabConfig, options):
+    """
+    Report the throughput of the jobs of a crab task, from the telemetry sidecars transferred with the outputs, or
+    from the job reports inside the log tarballs of the task (retrieved with ``crab getlog``)
+    :param CrabConfig: the crab configuration file of the task
+    :param options: the options of the script, as returned by ``get_options``
+    :return: the report, as returned by ``task_report.summarize``
+    """
+    from CRABAPI.RawCommand import crabCommand
+    from cp3_llbb.GridIn import task_report
+
+    module = load_file(CrabConfig)
+    taskdir = os.path.join(module.config.General.workArea, 'crab_' + module.config.General.requestName)
+
+    print "##### Get the performance data of the jobs of", taskdir
+    # Since the API outputs AND prints the same data, hide whatever is printed on screen
+    with mute_output(not options.debug):
+        output_files = crabCommand('getoutput', '--dump', dir = taskdir )
+
+    storagePrefix = get_storage_prefix()
+    sidecars = [storagePrefix + lfn for lfn in output_files['lfn'] if task_report.is_sidecar(lfn)]
+    telemetry = task_report.load_sidecars(sidecars, options.processes)
+    print "%d telemetry sidecars read" % len(telemetry)
+
+    if len(telemetry) == 0:
+        results = os.path.join(taskdir, 'results')
+        telemetry = task_report.load_log_tarballs(results)
+        print "%d job reports read from the log tarballs in %s" % (len(telemetry), results)
+
+    if len(telemetry) == 0:
+        raise IOError("No performance data found for task %r. Use 'crab getlog' to retrieve the log tarballs" % taskdir)
+
+    print("")
+
+    # Used to size the jobs of future tasks, see ``job_sizing``
+    from cp3_llbb.GridIn.job_sizing import describe_pset
+    task = {
+            'name': module.config.General.requestName,
+            'dataset': module.config.Data.inputDataset,
+            'splitting': module.config.Data.splitting,
+            'units_per_job': module.config.Data.unitsPerJob
+            }
+    task.update(describe_pset(module.config.JobType.psetName))
+    summary = task_report.summarize(telemetry, task)
+    task_report.print_report(summary)
+    print("")
+    print "Report written to", task_report.write_report(summary, taskdir)
+
+    return summary
+
+def process_tasks(CrabConfigs, options):
+    """
+    Process several crab tasks concurrently, sharing the database connection, the ROOT workers and the code versions
+    :return: a list of ``(CrabConfig, sample name, error)``, where either the sample name or the error is None
+    """
+    from multiprocessing.pool import ThreadPool
+    import traceback
+
+    shared = SharedResources(options.processes)
+
+    def run(CrabConfig):
+        try:
+            return (CrabConfig, process_task(CrabConfig, options, shared), None)
+        except Exception as e:
+            traceback.print_exc()
+            return (CrabConfig, None, '%s: %s' % (type(e).__name__, e))
+
+    try:
+        pool = ThreadPool(processes=options.tasks)
+        results = pool.map(run, CrabConfigs)
+        pool.close()
+        pool.join()
+    finally:
+        shared.close()
+
+    return results
+
+def main():
+    options = get_options()
+
+    import glob
+    CrabConfigs = []
+    for pattern in options.CrabConfig:
+        matches = sorted(glob.glob(pattern)) if glob.has_magic(pattern) else [pattern]
+        CrabConfigs += [m for m in matches if m not in CrabConfigs]
+
+    if options.report:
+        failed = False
+        for CrabConfig in CrabConfigs:
+            try:
+                report_task(CrabConfig, options)
+            except Exception as e:
+                print "FAILED ", CrabConfig, "->", '%s: %s' % (type(e).__name__, e)
+                failed = True
+            print("")
+        if failed:
+            sys.exit(1)
+        return
+
+    if len(CrabConfigs) == 1:
+        process_task(CrabConfigs[0], options)
+        return
+
+    results = process_tasks(CrabConfigs, options)
+
+    print("")
+    print "##### ##### Summary (" + str(len(results)), "tasks) ##### #####"
+    for CrabConfig, NAME, error in results:
+        if error is None:
+            print "OK     ", CrabConfig, "->", NAME
+        else:
+            print "FAILED ", CrabConfig, "->", error
+
+    if any([error is not None for _, _, error in results]):
+        sys.exit(1)
 
 if __name__ == '__main__':
     main() 
@@ -0,0 +1,120 @@
+"""
+Tests of the helpers shared by the scripts
+"""
+
+import sys
+import threading
+import time
+import unittest
+from multiprocessing.pool import ThreadPool
+from StringIO import StringIO
+
+from cp3_llbb.GridIn.common import mark_started, mute_output, script_args_to_options, wait_with_deadlines
+
+
+def sleeper(duration, started, index):
+    """
+    A job lasting ``duration`` seconds, or until the event ``duration`` is set
+    """
+    mark_started(started, index)
+    if isinstance(duration, threading._Event):
+        duration.wait(10)
+    else:
+        time.sleep(duration)
+    return index
+
+
+class TestWaitWithDeadlines(unittest.TestCase):
+
+    def run_jobs(self, function, args, threads, timeout):
+        pool = ThreadPool(threads)
+        try:
+            started = {}
+            async_results = [pool.apply_async(function, arg + (started, i)) for i, arg in enumerate(args)]
+            return wait_with_deadlines(async_results, started, timeout, poll_interval=0.05)
+        finally:
+            pool.terminate()
+
+    def test_all_done(self):
+        results, timed_out = self.run_jobs(sleeper, [(0.01,)] * 5, 2, 1)
+        self.assertEqual(results, range(5))
+        self.assertEqual(timed_out, {})
+
+    def test_queued_jobs_do_not_time_out(self):
+        # Run one at a time, each job takes most of the timeout: the last one finishes long after the first deadline
+        results, timed_out = self.run_jobs(sleeper, [(0.2,)] * 4, 1, 0.6)
+        self.assertEqual(results, range(4))
+        self.assertEqual(timed_out, {})
+
+    def test_stuck_job(self):
+        event = threading.Event()
+        try:
+            results, timed_out = self.run_jobs(sleeper, [(0.01,), (event,), (0.01,), (0.01,)], 2, 0.2)
+        finally:
+            event.set()
+
+        self.assertEqual(results, [0, None, 2, 3])
+        self.assertEqual(timed_out.keys(), [1])
+
+    def test_no_timeout(self):
+        results, timed_out = self.run_jobs(sleeper, [(0.1,)] * 2, 1, None)
+        self.assertEqual(results, [0, 1])
+        self.assertEqual(timed_out, {})
+
+
+class TestScriptArgs(unittest.TestCase):
+
+    def test_conversion(self):
+        argv = ['3', 'configFile=analysis.py', 'stage=1', 'stage_budget=500']
+        self.assertEqual(script_args_to_options(argv, ['stage'], ['stage_budget']),
+                         ['3', 'configFile=analysis.py', '--stage', '--stage-budget', '500'])
+
+    def test_disabled_flag(self):
+        self.assertEqual(script_args_to_options(['3', 'stage=0', 'configFile=a.py'], ['stage'], []),
+                         ['3', 'configFile=a.py'])
+
+
+class TestMuteOutput(unittest.TestCase):
+
+    def setUp(self):
+        self.saved = sys.stdout, sys.stderr
+        sys.stdout, sys.stderr = StringIO(), StringIO()
+        self.out, self.err = sys.stdout, sys.stderr
+
+    def tearDown(self):
+        sys.stdout, sys.stderr = self.saved
+
+    def test_current_thread(self):
+        with mute_output():
+            print "hidden"
+            sys.stderr.write("hidden\n")
+        print "shown"
+        self.assertEqual(self.out.getvalue(), "shown\n")
+        self.assertEqual(self.err.getvalue(), "")
+
+    def test_disabled(self):
+        with mute_output(False):
+            print "shown"
+        self.assertEqual(self.out.getvalue(), "shown\n")
+
+    def test_other_threads(self):
+        muted = threading.Event()
+        printed = threading.Event()
+
+        def other():
+            muted.wait(10)
+            print "shown"
+            printed.set()
+
+        thread = threading.Thread(target=other)
+        thread.start()
+        with mute_output():
+            muted.set()
+            printed.wait(10)
+            print "hidden"
+        thread.join()
+        self.assertEqual(self.out.getvalue(), "shown\n")
+
+
+if __name__ == '__main__':
+    unittest.main()
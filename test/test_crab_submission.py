@@ -0,0 +1,179 @@
+"""
+Tests of the submission of crab tasks, with a stub of ``crabCommand``
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import unittest
+from StringIO import StringIO
+
+from cp3_llbb.GridIn import crab_submission
+from cp3_llbb.GridIn.crab_submission import SUBMITTED, FAILED, SKIPPED, UNKNOWN
+
+
+class Section(object):
+    pass
+
+
+def make_config(work_area, name):
+    config = Section()
+    config.General = Section()
+    config.General.workArea = work_area
+    config.General.requestName = name
+    return config
+
+
+class StubCrab(object):
+    """
+    Stand-in for ``crabCommand``. ``failures`` gives, for each task, the number of submissions failing before one
+    succeeds. Like crab, a submission creates the task directory, and the request cache once the server has the task.
+    With ``accepted`` the server has the task even though the submission raised, and with ``status_errors`` crab
+    status fails for the task
+    """
+
+    def __init__(self, failures=None, accepted=(), status_errors=()):
+        self.failures = dict(failures or {})
+        self.accepted = set(accepted)
+        self.status_errors = set(status_errors)
+        self.calls = []
+        self.running = 0
+        self.max_running = 0
+        self.lock = threading.Lock()
+
+    def __call__(self, command, config=None, dir=None):
+        with self.lock:
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+        try:
+            if command == 'status':
+                self.calls.append(('status', os.path.basename(dir)))
+                name = os.path.basename(dir)[len('crab_'):]
+                if name in self.status_errors:
+                    raise Exception('Server timeout')
+                return {'status': 'SUBMITTED'}
+
+            name = config.General.requestName
+            self.calls.append(('submit', name))
+            taskdir = crab_submission.task_directory(config)
+            os.makedirs(taskdir)
+            failed = self.failures.get(name, 0) > 0
+            if not failed or name in self.accepted:
+                open(os.path.join(taskdir, crab_submission.REQUEST_CACHE), 'w').close()
+            if failed:
+                self.failures[name] -= 1
+                raise Exception('Server error')
+            return {'uniquerequestname': 'id_' + name}
+        finally:
+            with self.lock:
+                self.running -= 1
+
+
+class FakeTime(object):
+    """
+    Replace ``time`` inside ``crab_submission``, recording the sleeps instead of waiting
+    """
+
+    def __init__(self):
+        self.now = 0.
+        self.sleeps = []
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+class TestSubmission(unittest.TestCase):
+    def setUp(self):
+        self.work_area = tempfile.mkdtemp()
+        self.time = FakeTime()
+        self.saved_time = crab_submission.time
+        crab_submission.time = self.time
+
+    def tearDown(self):
+        crab_submission.time = self.saved_time
+        shutil.rmtree(self.work_area)
+
+    def submit(self, names, crab, **kwargs):
+        configs = [make_config(self.work_area, name) for name in names]
+        kwargs.setdefault('interval', 0)
+        return crab_submission.submit_tasks(configs, crab_command=crab, **kwargs)
+
+    def test_success(self):
+        crab = StubCrab()
+        results = self.submit(['A', 'B', 'C'], crab, threads=3)
+        self.assertEqual(results, [(name, SUBMITTED, 1, 'id_' + name) for name in ['A', 'B', 'C']])
+        self.assertEqual(crab.max_running, 1)
+
+    def test_retries_with_backoff(self):
+        crab = StubCrab(failures={'A': 2})
+        results = self.submit(['A'], crab, retries=3, backoff=10)
+        self.assertEqual(results, [('A', SUBMITTED, 3, 'id_A')])
+        self.assertEqual(self.time.sleeps, [10, 20])
+        # No request recorded by crab: the server surely does not have the task, it is submitted again
+        self.assertEqual(crab.calls, [('submit', 'A')] * 3)
+
+    def test_too_many_failures(self):
+        crab = StubCrab(failures={'A': 5})
+        results = self.submit(['A'], crab, retries=2, backoff=1)
+        self.assertEqual(results, [('A', FAILED, 3, 'Exception: Server error')])
+        self.assertEqual(self.time.sleeps, [1, 2])
+        self.assertFalse(os.path.exists(os.path.join(self.work_area, 'crab_A')))
+
+    def test_accepted_despite_error(self):
+        crab = StubCrab(failures={'A': 1}, accepted=['A'])
+        results = self.submit(['A'], crab, retries=3)
+        self.assertEqual(results[0][:3], ('A', SUBMITTED, 1))
+        self.assertEqual([c for c in crab.calls if c[0] == 'submit'], [('submit', 'A')])
+        self.assertTrue(os.path.exists(os.path.join(self.work_area, 'crab_A')))
+
+    def test_status_failure(self):
+        # The server may have the task: it is neither submitted again nor removed
+        crab = StubCrab(failures={'A': 1}, accepted=['A'], status_errors=['A'])
+        results = self.submit(['A'], crab, retries=3)
+        self.assertEqual(results[0][:3], ('A', UNKNOWN, 1))
+        self.assertIn('Server timeout', results[0][3])
+        self.assertEqual(crab.calls, [('submit', 'A'), ('status', 'crab_A')])
+        self.assertEqual(self.time.sleeps, [])
+        self.assertTrue(os.path.exists(os.path.join(self.work_area, 'crab_A')))
+
+    def test_skip_existing(self):
+        os.makedirs(os.path.join(self.work_area, 'crab_A'))
+        crab = StubCrab()
+        results = self.submit(['A', 'B'], crab)
+        self.assertEqual([r[:3] for r in results], [('A', SKIPPED, 0), ('B', SUBMITTED, 1)])
+        self.assertEqual(crab.calls, [('submit', 'B')])
+
+    def test_rate_limiting(self):
+        crab = StubCrab()
+        self.submit(['A', 'B', 'C'], crab, threads=1, interval=5)
+        self.assertEqual(self.time.sleeps, [5, 5])
+
+
+class TestSummary(unittest.TestCase):
+    def test_table(self):
+        results = [('TT', SUBMITTED, 1, 'id_TT'), ('DY_long_name', FAILED, 4, 'Exception: Server error'),
+                   ('WW', SKIPPED, 0, 'task directory tasks/crab_WW already exists')]
+        saved_stdout = sys.stdout
+        sys.stdout = StringIO()
+        try:
+            crab_submission.print_summary(results)
+            output = sys.stdout.getvalue()
+        finally:
+            sys.stdout = saved_stdout
+
+        lines = output.splitlines()
+        self.assertEqual(lines[0].split(), ['Task', 'Status', 'Attempts', 'Details'])
+        self.assertEqual(lines[1].split(), ['TT', 'submitted', '1', 'id_TT'])
+        self.assertEqual(lines[2].split()[:3], ['DY_long_name', 'failed', '4'])
+        self.assertEqual(lines[3].split()[:3], ['WW', 'skipped', '0'])
+        self.assertEqual(lines[-1], '1 submitted, 1 failed, 1 skipped')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,117 @@
+"""
+Tests of the catalogue of datasets, and of the handling of invalid descriptions
+"""
+
+import json
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+from StringIO import StringIO
+
+from cp3_llbb.GridIn.dataset_catalog import DatasetCatalog
+
+TT = {
+        '/TT/RunIISpring15DR74-v1/MINIAODSIM': {'name': 'TT', 'units_per_job': 10, 'era': '25ns'},
+        }
+DY = {
+        '/DYJetsToLL/RunIISpring15DR74-v1/MINIAODSIM': {'name': 'DY', 'units_per_job': 5, 'era': '25ns',
+                                                        'tags': ['dy']},
+        }
+DATA = {
+        '/DoubleMuon/Run2015D-v1/MINIAOD': {'name': 'DoubleMuon', 'units_per_job': 20, 'era': '25ns',
+                                            'run_range': [1, 10]},
+        }
+# Invalid units_per_job
+INVALID_WJETS = {
+        '/WJets/RunIISpring15DR74-v1/MINIAODSIM': {'name': 'WJets', 'units_per_job': 0, 'era': '50ns'},
+        }
+
+
+class TestInvalidDescriptions(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.cache = tempfile.mkdtemp()
+        self.write('mc_TT.json', TT)
+        self.write('mc_DY.json', DY)
+        self.write('data.json', DATA)
+        self.stdout = sys.stdout
+        sys.stdout = StringIO()
+
+    def tearDown(self):
+        sys.stdout = self.stdout
+        shutil.rmtree(self.directory)
+        shutil.rmtree(self.cache)
+
+    def write(self, filename, content):
+        with open(os.path.join(self.directory, filename), 'w') as f:
+            f.write(content if isinstance(content, str) else json.dumps(content))
+
+    def load(self, paths=None):
+        return DatasetCatalog.load(paths or [self.directory], self.cache)
+
+    def test_valid(self):
+        catalog = self.load()
+        self.assertEqual(sorted([opt['name'] for opt in catalog.select().values()]), ['DY', 'DoubleMuon', 'TT'])
+        self.assertEqual(catalog.select(data=False, tags=['dy']).keys(), DY.keys())
+        self.assertEqual(sys.stdout.getvalue(), '')
+
+    def test_invalid_dataset_not_selected(self):
+        self.write('mc_WJets.json', INVALID_WJETS)
+        catalog = self.load()
+        self.assertEqual(catalog.select(names=['TT']).keys(), TT.keys())
+        self.assertEqual(len(catalog.select(eras=['25ns'], data=False)), 2)
+        self.assertEqual(len(catalog.select(data=True)), 1)
+        self.assertIn('Warning', sys.stdout.getvalue())
+        self.assertIn('units_per_job', sys.stdout.getvalue())
+
+    def test_invalid_dataset_selected(self):
+        self.write('mc_WJets.json', INVALID_WJETS)
+        catalog = self.load()
+        self.assertRaises(ValueError, catalog.select)
+        self.assertRaises(ValueError, catalog.select, names=['W*'])
+        self.assertRaises(ValueError, catalog.select, data=False)
+        self.assertRaises(ValueError, catalog.select, tags=['mc_WJets'])
+
+    def test_invalid_json(self):
+        self.write('broken.json', '{"/A/B/MINIAODSIM": {')
+        catalog = self.load()
+        self.assertEqual(catalog.select(names=['DY']).keys(), DY.keys())
+        self.assertEqual(len(catalog.select(tags=['dy'])), 1)
+        self.assertIn('broken.json: invalid JSON', sys.stdout.getvalue())
+        self.assertRaises(ValueError, catalog.select)
+        self.assertRaises(ValueError, catalog.select, tags=['broken'])
+
+    def test_duplicate_name(self):
+        self.write('mc_TT2.json', {'/TT/Other-v1/MINIAODSIM': {'name': 'TT', 'units_per_job': 1, 'era': '25ns'}})
+        catalog = self.load()
+        self.assertEqual(catalog.select(names=['DY']).keys(), DY.keys())
+        self.assertRaises(ValueError, catalog.select, names=['T*'])
+
+    def test_explicit_file(self):
+        self.write('mc_WJets.json', INVALID_WJETS)
+        catalog = self.load([os.path.join(self.directory, 'mc_WJets.json'), os.path.join(self.directory,
+                             'mc_TT.json')])
+        self.assertRaises(ValueError, catalog.select, names=['TT'])
+
+    def test_explicit_file_type(self):
+        # The type of the datasets of a file given explicitly is the choice of the user
+        user = {'/TT/user-private-v1/USER': {'name': 'TT_private', 'units_per_job': 1, 'era': '25ns',
+                                             'run_range': [1, 2]}}
+        self.write('private.json', user)
+        catalog = self.load([os.path.join(self.directory, 'private.json'), os.path.join(self.directory, 'mc_TT.json')])
+        self.assertEqual(sorted(catalog.select(data=False)), sorted(user.keys() + TT.keys()))
+        self.assertEqual(sorted(self.load().select(data=False)), sorted(DY.keys() + TT.keys()))
+
+    def test_cached_index(self):
+        self.write('mc_WJets.json', INVALID_WJETS)
+        self.load()
+        catalog = self.load()
+        self.assertEqual(catalog.select(names=['TT']).keys(), TT.keys())
+        self.assertRaises(ValueError, catalog.select, names=['WJets'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,182 @@
+"""
+Tests of the local cache of the content of the framework output files, and of its use by ``runPostCrab.py``, with
+stubs of the readers
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+from StringIO import StringIO
+
+from cp3_llbb.GridIn.common import load_file
+from cp3_llbb.GridIn.file_data_cache import FileDataCache
+
+SCRIPTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'scripts')
+PREFIX = 'root://ingrid-se02.cism.ucl.ac.be/'
+
+
+def lfn(i):
+    return '/store/user/gridin/TT/0000/output_%d.root' % i
+
+
+class TestFileDataCache(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'files.sqlite')
+        self.cache = FileDataCache(self.path)
+
+    def tearDown(self):
+        self.cache.close()
+        shutil.rmtree(self.directory)
+
+    def test_get_update(self):
+        self.assertEqual(self.cache.get([lfn(1)]), {})
+        self.cache.update([(lfn(1), (100, 10), (1000.5, {'scale_up': 1.5}, 500)),
+                           (lfn(2), (200, 20), (2000.5, {}, 600))])
+        self.assertEqual(self.cache.get([lfn(1), lfn(3)]), {lfn(1): ((100, 10), (1000.5, {'scale_up': 1.5}, 500))})
+
+        # Replaced
+        self.cache.update([(lfn(1), (101, 11), (1001.5, {}, 501))])
+        self.assertEqual(self.cache.get([lfn(1)]), {lfn(1): ((101, 11), (1001.5, {}, 501))})
+
+    def test_persistent(self):
+        self.cache.update([(lfn(1), (100, 10), (1000.5, {}, 500))])
+        self.cache.close()
+        self.cache = FileDataCache(self.path)
+        self.assertEqual(self.cache.get([lfn(1)]), {lfn(1): ((100, 10), (1000.5, {}, 500))})
+
+    def test_many(self):
+        # More LFNs than the maximum number of parameters of a sqlite query
+        self.cache.update([(lfn(i), (i, i), (float(i), {}, i)) for i in range(1, 1201)])
+        cached = self.cache.get([lfn(i) for i in range(1, 1301)])
+        self.assertEqual(len(cached), 1200)
+        self.assertEqual(cached[lfn(1200)], ((1200, 1200), (1200., {}, 1200)))
+
+
+class TestGetFilesData(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        if 'CMSSW_BASE' not in os.environ:
+            raise unittest.SkipTest('CMSSW is not available')
+        cls.runPostCrab = load_file(os.path.join(SCRIPTS_DIR, 'runPostCrab.py'))
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.cache = FileDataCache(os.path.join(self.directory, 'files.sqlite'))
+
+        # Stand-ins of the readers: ``stats`` and ``contents`` are keyed by PFN, and the files read are recorded
+        self.stats = {}
+        self.contents = {}
+        self.read = []
+        self.saved_readers = (self.runPostCrab.get_file_stat, self.runPostCrab.get_file_data)
+        def get_file_stat(pfn, reader):
+            return self.stats.get(pfn)
+        def get_file_data(pfn, reader):
+            self.read.append(pfn[len(PREFIX):])
+            return self.contents.get(pfn, (None, None, None))
+        self.runPostCrab.get_file_stat = get_file_stat
+        self.runPostCrab.get_file_data = get_file_data
+
+        self.stdout = sys.stdout
+        sys.stdout = StringIO()
+
+    def tearDown(self):
+        sys.stdout = self.stdout
+        self.runPostCrab.get_file_stat, self.runPostCrab.get_file_data = self.saved_readers
+        self.cache.close()
+        shutil.rmtree(self.directory)
+
+    def add_file(self, i, stat, data):
+        self.stats[PREFIX + lfn(i)] = stat
+        self.contents[PREFIX + lfn(i)] = data
+
+    def files_data(self, lfns):
+        del self.read[:]
+        sys.stdout = StringIO()
+        return self.runPostCrab.get_files_data(lfns, PREFIX, cache=self.cache)
+
+    def test_cache_hit(self):
+        self.add_file(1, (100, 10), (1000.5, {'scale_up': 1.5}, 500))
+        self.add_file(2, (200, 20), (2000.5, {}, 600))
+        lfns = [lfn(1), lfn(2)]
+        expected = [(1000.5, {'scale_up': 1.5}, 500), (2000.5, {}, 600)]
+
+        self.assertEqual(self.files_data(lfns), expected)
+        self.assertEqual(self.read, lfns)
+        self.assertIn('0 / 2 files read from the cache', sys.stdout.getvalue())
+
+        self.assertEqual(self.files_data(lfns), expected)
+        self.assertEqual(self.read, [])
+        self.assertIn('2 / 2 files read from the cache', sys.stdout.getvalue())
+
+    def test_no_cache(self):
+        self.add_file(1, (100, 10), (1000.5, {}, 500))
+        del self.read[:]
+        for _ in range(2):
+            self.assertEqual(self.runPostCrab.get_files_data([lfn(1)], PREFIX), [(1000.5, {}, 500)])
+        self.assertEqual(self.read, [lfn(1)] * 2)
+
+    def test_modified(self):
+        self.add_file(1, (100, 10), (1000.5, {}, 500))
+        self.add_file(2, (200, 20), (2000.5, {}, 600))
+        self.files_data([lfn(1), lfn(2)])
+
+        # Rewritten in place with the same size, or with a new size and the same time: read again
+        self.add_file(1, (100, 11), (1001.5, {}, 501))
+        self.add_file(2, (201, 20), (2001.5, {}, 601))
+        self.assertEqual(self.files_data([lfn(1), lfn(2)]), [(1001.5, {}, 501), (2001.5, {}, 601)])
+        self.assertEqual(self.read, [lfn(1), lfn(2)])
+        self.assertEqual(self.cache.get([lfn(1)]), {lfn(1): ((100, 11), (1001.5, {}, 501))})
+
+        self.assertEqual(self.files_data([lfn(1), lfn(2)]), [(1001.5, {}, 501), (2001.5, {}, 601)])
+        self.assertEqual(self.read, [])
+
+    def test_new_file(self):
+        self.add_file(1, (100, 10), (1000.5, {}, 500))
+        self.files_data([lfn(1)])
+        self.add_file(2, (200, 20), (2000.5, {}, 600))
+        self.assertEqual(self.files_data([lfn(1), lfn(2)]), [(1000.5, {}, 500), (2000.5, {}, 600)])
+        self.assertEqual(self.read, [lfn(2)])
+
+    def test_missing_file(self):
+        self.add_file(1, (100, 10), (1000.5, {}, 500))
+        self.files_data([lfn(1)])
+
+        # Gone since: the cached content is not used
+        del self.stats[PREFIX + lfn(1)]
+        del self.contents[PREFIX + lfn(1)]
+        self.assertEqual(self.files_data([lfn(1)]), [(None, None, None)])
+        self.assertEqual(self.read, [lfn(1)])
+
+    def test_not_cached(self):
+        # Failures, files without a sum of weights and files without a known size are never cached
+        self.add_file(1, (100, 10), (None, None, None))
+        self.add_file(2, (200, 20), (0., {}, 0))
+        self.add_file(3, None, (3000.5, {}, 700))
+        lfns = [lfn(1), lfn(2), lfn(3)]
+        self.assertEqual(self.files_data(lfns), [(None, None, None), (0., {}, 0), (3000.5, {}, 700)])
+        self.assertEqual(self.cache.get(lfns), {})
+
+        self.files_data(lfns)
+        self.assertEqual(self.read, lfns)
+
+    def test_reader_failure(self):
+        self.add_file(1, (100, 10), (1000.5, {}, 500))
+        self.add_file(2, (200, 20), (2000.5, {}, 600))
+        def failing_stat(pfn, reader):
+            if pfn.endswith('output_2.root'):
+                raise IOError('Connection refused')
+            return self.stats.get(pfn)
+        self.runPostCrab.get_file_stat = failing_stat
+
+        self.assertEqual(self.files_data([lfn(1), lfn(2)]), [(1000.5, {}, 500), (None, None, None)])
+        self.assertIn('failed to read', sys.stdout.getvalue())
+        self.assertEqual(self.cache.get([lfn(1), lfn(2)]).keys(), [lfn(1)])
+
+
+if __name__ == '__main__':
+    unittest.main()
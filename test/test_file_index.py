@@ -0,0 +1,72 @@
+"""
+Tests of the index of the file names of a source tree
+"""
+
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from cp3_llbb.GridIn.file_index import FileIndex
+
+
+class TestFileIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.cache = tempfile.mkdtemp()
+        for path in ['Framework/test/config.py', 'Analysis/python/analyzer.py', 'Analysis/.git/config.py']:
+            self.touch(path)
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+        shutil.rmtree(self.cache)
+
+    def touch(self, path):
+        path = os.path.join(self.root, path)
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        open(path, 'w').close()
+
+    def index(self):
+        return FileIndex(self.root, self.cache)
+
+    def test_find_one(self):
+        self.assertEqual(self.index().find_one('config.py'), os.path.join(self.root, 'Framework/test/config.py'))
+        self.assertRaises(IOError, self.index().find_one, 'missing.py')
+
+    def test_ambiguous(self):
+        self.touch('Analysis/test/config.py')
+        self.assertRaises(IOError, self.index().find_one, 'config.py')
+
+    def test_symlink_cycle(self):
+        os.symlink(self.root, os.path.join(self.root, 'Framework/test/loop'))
+        self.assertEqual(self.index().find_one('analyzer.py'), os.path.join(self.root, 'Analysis/python/analyzer.py'))
+
+    def test_symlinked_directory(self):
+        # The files of a linked directory are not found twice
+        os.symlink(os.path.join(self.root, 'Framework'), os.path.join(self.root, 'Analysis/Framework'))
+        self.assertEqual(self.index().find_one('config.py'), os.path.join(self.root, 'Framework/test/config.py'))
+
+    def test_refresh(self):
+        index = self.index()
+        index.refresh()
+        self.assertEqual(index.listed, 5)
+
+        index = self.index()
+        index.refresh()
+        self.assertEqual(index.listed, 0)
+
+        # Make sure the modification time changes
+        time.sleep(0.01)
+        self.touch('Analysis/python/other.py')
+        os.utime(os.path.join(self.root, 'Analysis/python'), (time.time() + 10, time.time() + 10))
+        index = self.index()
+        index.refresh()
+        self.assertEqual(index.listed, 1)
+        self.assertEqual(index.find('other.py'), [os.path.join(self.root, 'Analysis/python/other.py')])
+
+
+if __name__ == '__main__':
+    unittest.main()
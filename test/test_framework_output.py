@@ -0,0 +1,138 @@
+"""
+Tests of the readers of the framework output files: the light reader must give the same results as PyROOT
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from cp3_llbb.GridIn import framework_output, root_file
+from cp3_llbb.GridIn.common import split_url
+
+# Compression settings of the generated files: algorithm * 100 + level
+COMPRESSIONS = {
+        'uncompressed': 0,
+        'zlib': 101,
+        'lzma': 207,
+        'lz4': 404,
+        }
+
+
+def generate_output_file(path, compression, entries, title='t', cycles=1):
+    """
+    Generate a file with the content of a framework output used by the book-keeping, with all the types of
+    ``TParameter`` the light reader knows
+    """
+    import ROOT
+    from array import array
+
+    f = ROOT.TFile.Open(path, 'recreate', '', compression)
+    for cycle in range(cycles):
+        ROOT.TParameter('double')('event_weight_sum', 1000.5 + cycle).Write()
+    for j, suffix in enumerate(['scale_up', 'scale_down', 'pdf_up', 'pdf_down']):
+        ROOT.TParameter('double')('event_weight_sum_' + suffix, 1000. + j / 4.).Write()
+    ROOT.TParameter('float')('event_weight_sum_float', 12.25).Write()
+    ROOT.TParameter('int')('event_weight_sum_int', -42).Write()
+    ROOT.TParameter('Long64_t')('event_weight_sum_long', 2 ** 40).Write()
+    ROOT.TParameter('double')('other_parameter', 3.).Write()
+
+    x = array('f', [0.])
+    tree = ROOT.TTree('t', title)
+    tree.Branch('x', x, 'x/F')
+    for k in range(entries):
+        x[0] = k
+        tree.Fill()
+    tree.Write()
+    f.Close()
+
+
+class TestReaders(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        try:
+            import ROOT
+        except ImportError:
+            raise unittest.SkipTest('PyROOT is not available')
+        ROOT.gROOT.SetBatch(True)
+
+        cls.directory = tempfile.mkdtemp()
+        cls.files = {}
+        for name, compression in COMPRESSIONS.items():
+            cls.files[name] = os.path.join(cls.directory, name + '.root')
+            generate_output_file(cls.files[name], compression, 5000)
+        cls.files['long_title'] = os.path.join(cls.directory, 'long_title.root')
+        generate_output_file(cls.files['long_title'], 101, 10, title='Framework tree ' * 200)
+        cls.files['cycles'] = os.path.join(cls.directory, 'cycles.root')
+        generate_output_file(cls.files['cycles'], 101, 10, cycles=3)
+        cls.files['empty'] = os.path.join(cls.directory, 'empty.root')
+        ROOT.TFile.Open(cls.files['empty'], 'recreate').Close()
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.directory)
+
+    def assertSameData(self, name):
+        path = self.files[name]
+        expected = framework_output.get_file_data_root(path)
+        self.assertEqual(framework_output.get_file_data(path, 'light'), expected)
+        return expected
+
+    def test_compressions(self):
+        for name in COMPRESSIONS:
+            sumw, extras_sumw, entries = self.assertSameData(name)
+            self.assertEqual(sumw, 1000.5)
+            self.assertEqual(entries, 5000)
+            self.assertEqual(sorted(extras_sumw), ['float', 'int', 'long', 'pdf_down', 'pdf_up', 'scale_down',
+                                                   'scale_up'])
+
+    def test_without_fallback(self):
+        # Only the Python standard library is needed for these files: ROOT must not be used
+        for name in ['uncompressed', 'zlib', 'long_title', 'cycles']:
+            path = self.files[name]
+            self.assertEqual(framework_output.get_file_data_light(path), framework_output.get_file_data_root(path))
+
+    def test_long_title(self):
+        self.assertEqual(self.assertSameData('long_title')[2], 10)
+
+    def test_highest_cycle(self):
+        self.assertEqual(self.assertSameData('cycles')[0], 1002.5)
+
+    def test_missing_objects(self):
+        self.assertEqual(self.assertSameData('empty'), (None, {}, None))
+
+    def test_stat(self):
+        for path in self.files.values():
+            self.assertEqual(root_file.stat(path), framework_output.get_file_stat_root(path))
+
+
+class TestLightReader(unittest.TestCase):
+    """
+    Tests not needing ROOT
+    """
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_not_a_root_file(self):
+        path = os.path.join(self.directory, 'text.root')
+        with open(path, 'w') as f:
+            f.write('not a ROOT file\n' * 10)
+        self.assertEqual(framework_output.get_file_data_light(path), (None, None, None))
+
+    def test_missing_file(self):
+        path = os.path.join(self.directory, 'missing.root')
+        self.assertEqual(framework_output.get_file_data_light(path), (None, None, None))
+        self.assertEqual(root_file.stat(path), None)
+
+    def test_split_url(self):
+        self.assertEqual(split_url('root://eoscms.cern.ch//store/file.root'), ('root://eoscms.cern.ch', '/store/file.root'))
+        self.assertRaises(ValueError, split_url, '/store/file.root')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,137 @@
+"""
+Tests of the version of the code, and of the invalidation of its cache, on temporary git repositories
+"""
+
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+from StringIO import StringIO
+
+from cp3_llbb.GridIn import git_version
+
+
+class TestGitVersion(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.cache = os.path.join(self.directory, 'cache')
+        self.repo = os.path.join(self.directory, 'Analysis')
+        os.makedirs(self.repo)
+        self.git('init', '-q')
+        self.git('remote', 'add', 'origin', 'git@github.com:someone/Analysis.git')
+        self.git('remote', 'add', 'upstream', 'git@github.com:cp3-llbb/Analysis.git')
+        self.commit('analysis.py')
+        self.git('update-ref', 'refs/remotes/upstream/master', 'HEAD')
+
+        # Count the git commands
+        self.commands = []
+        self.saved_git = git_version._git
+        def counting_git(path, *args):
+            self.commands.append(args[0])
+            return self.saved_git(path, *args)
+        git_version._git = counting_git
+        git_version._memory_cache.clear()
+
+        self.stdout = sys.stdout
+        sys.stdout = StringIO()
+
+    def tearDown(self):
+        sys.stdout = self.stdout
+        git_version._git = self.saved_git
+        git_version._memory_cache.clear()
+        shutil.rmtree(self.directory)
+
+    def git(self, *args):
+        return subprocess.check_output(['git', '-c', 'user.name=GridIn', '-c', 'user.email=gridin@example.org'] +
+                                       list(args), cwd=self.repo)
+
+    def commit(self, filename):
+        with open(os.path.join(self.repo, filename), 'a') as f:
+            f.write('x = 1\n')
+        self.git('add', filename)
+        self.git('commit', '-q', '-m', filename)
+
+    def head(self):
+        return self.git('rev-parse', '--short', 'HEAD').strip()
+
+    def version(self):
+        del self.commands[:]
+        return git_version.getGitTagRepoUrl(self.repo, self.cache)
+
+    def described(self):
+        """
+        Check if the last call described HEAD, instead of using the cache
+        """
+        return 'describe' in self.commands
+
+    def test_version(self):
+        gitHash, repo, url = self.version()
+        self.assertEqual(gitHash, self.head())
+        self.assertEqual(repo, 'Analysis')
+        self.assertEqual(url, 'https://github.com/cp3-llbb/Analysis/tree/' + gitHash)
+        self.assertTrue(self.described())
+
+    def test_cached(self):
+        first = self.version()
+        self.assertEqual(self.version(), first)
+        self.assertFalse(self.described())
+        # Only the state of the working tree is checked
+        self.assertEqual(self.commands, ['status'])
+
+        # Cached on disk, outside of the repository
+        git_version._memory_cache.clear()
+        self.assertEqual(self.version(), first)
+        self.assertFalse(self.described())
+        self.assertTrue(os.path.isfile(os.path.join(self.cache, git_version.CACHE_FILE)))
+        self.assertEqual(self.git('status', '--porcelain', '--ignored'), '')
+
+    def test_dirty(self):
+        self.version()
+        with open(os.path.join(self.repo, 'analysis.py'), 'a') as f:
+            f.write('y = 2\n')
+        self.assertRaises(AssertionError, self.version)
+
+        # Untracked files do not matter
+        self.git('checkout', '-q', 'analysis.py')
+        open(os.path.join(self.repo, 'notes.txt'), 'w').close()
+        self.version()
+
+    def test_new_commit(self):
+        self.version()
+        self.commit('other.py')
+        self.git('update-ref', 'refs/remotes/upstream/master', 'HEAD')
+        self.assertEqual(self.version()[0], self.head())
+        self.assertTrue(self.described())
+
+    def test_not_pushed(self):
+        self.version()
+        self.commit('other.py')
+        self.assertRaises(AssertionError, self.version)
+
+    def test_remote_ref(self):
+        self.commit('other.py')
+        self.assertRaises(AssertionError, self.version)
+        # Pushed in the meantime
+        self.git('update-ref', 'refs/remotes/origin/master', 'HEAD')
+        self.assertEqual(self.version()[2], 'https://github.com/someone/Analysis/tree/' + self.head())
+        self.assertTrue(self.described())
+
+    def test_tag(self):
+        self.version()
+        self.git('tag', 'v1.0')
+        self.assertEqual(self.version()[0], 'v1.0')
+        self.assertTrue(self.described())
+
+    def test_config(self):
+        self.version()
+        # Same size
+        self.git('remote', 'set-url', 'upstream', 'git@github.com:cp3-llbc/Analysis.git')
+        self.assertEqual(self.version()[2], 'https://github.com/cp3-llbc/Analysis/tree/' + self.head())
+        self.assertTrue(self.described())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,64 @@
+"""
+Tests of the list of input files given to the framework when staging: a file is only replaced by its staged copy if
+the copy is complete when the framework asks for it
+"""
+
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from multiprocessing import Array
+
+from cp3_llbb.GridIn.input_stager import StagedFiles
+
+FILES = ['root://eoscms.cern.ch//store/a.root', 'root://eoscms.cern.ch//store/b.root',
+         'root://eoscms.cern.ch//store/c.root']
+
+
+class TestStagedFiles(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.local_paths = dict((i, os.path.join(self.directory, '%d.root' % i)) for i in [1, 2])
+        self.requested = Array('b', len(FILES), lock=False)
+        self.files = StagedFiles(FILES, self.local_paths, self.requested)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def stage(self, index):
+        open(self.local_paths[index], 'w').close()
+
+    def test_lazy_reader(self):
+        # Like a framework opening each file only when it needs it: the files staged meanwhile are read locally
+        start = time.time()
+        self.assertEqual(self.files[0], FILES[0])
+        self.assertEqual(list(self.requested), [0, 0, 0])
+        self.stage(1)
+        time.sleep(0.05)
+        self.assertEqual(self.files[1], 'file:' + self.local_paths[1])
+        self.assertEqual(self.files[2], FILES[2])
+        self.stage(2)
+
+        self.assertEqual(list(self.requested), [0, 1, 1])
+        self.assertEqual(self.files.staged_copies(), {1: 'file:' + self.local_paths[1]})
+        delays = self.files.request_delays(start)
+        self.assertTrue(delays[1] - delays[0] >= 0.05)
+
+    def test_eager_reader(self):
+        # Like a framework copying its input list at start-up: nothing is staged in time, every file is streamed
+        start = time.time()
+        self.assertEqual(list(self.files), FILES)
+        self.assertEqual(list(self.requested), [0, 1, 1])
+        self.assertEqual(self.files.staged_copies(), {})
+        delays = self.files.request_delays(start)
+        self.assertTrue(max(delays) - min(delays) < 0.05)
+
+    def test_never_asked(self):
+        self.assertEqual(self.files[-1], FILES[2])
+        self.assertEqual(self.files.request_delays(time.time())[:2], [None, None])
+
+
+if __name__ == '__main__':
+    unittest.main()
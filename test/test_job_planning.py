@@ -0,0 +1,156 @@
+"""
+Tests of the planning of data tasks: warnings about bad splittings, and caches of the luminosity sections
+"""
+
+import json
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+from StringIO import StringIO
+
+from cp3_llbb.GridIn import job_planning
+from cp3_llbb.GridIn.job_planning import get_dataset_lumis, load_lumi_json, plan_dataset, print_plan
+from cp3_llbb.GridIn.lumi_intervals import LumiIntervals
+
+DATASET = '/DoubleMuon/Run2015D-v1/MINIAOD'
+
+
+def lumis(compact_list):
+    return LumiIntervals.from_compact_list(compact_list)
+
+
+class TestPlanDataset(unittest.TestCase):
+
+    def setUp(self):
+        self.dataset = lumis({'1': [[1, 100]], '2': [[1, 100]], '3': [[1, 100]]})
+
+    def test_good_splitting(self):
+        plan = plan_dataset('DoubleMuon', self.dataset, lumis({'2': [[1, 50]], '3': [[1, 50]]}), [2, 3], 20)
+        self.assertEqual((plan['dataset_lumis'], plan['in_range_lumis'], plan['lumis'], plan['jobs']), (300, 200, 100, 5))
+        self.assertEqual(plan['warnings'], [])
+
+    def test_too_many_jobs(self):
+        dataset = lumis({'1': [[1, 60000]]})
+        plan = plan_dataset('DoubleMuon', dataset, dataset, [1, 1], 5)
+        self.assertEqual(plan['jobs'], 12000)
+        self.assertEqual(plan['warnings'], ['12000 jobs, above the crab limit of %d: increase units_per_job to at least 6'
+                                            % job_planning.MAX_JOBS])
+
+    def test_tiny_jobs(self):
+        plan = plan_dataset('DoubleMuon', self.dataset, self.dataset, [1, 3], job_planning.MIN_UNITS_PER_JOB - 1)
+        self.assertEqual(plan['warnings'], ['only %d luminosity sections per job' % (job_planning.MIN_UNITS_PER_JOB - 1)])
+
+    def test_single_job(self):
+        plan = plan_dataset('DoubleMuon', self.dataset, self.dataset, [1, 3], 1000)
+        self.assertEqual(plan['jobs'], 1)
+        self.assertEqual(plan['warnings'], ['a single job processes everything'])
+
+    def test_run_range_outside(self):
+        plan = plan_dataset('DoubleMuon', self.dataset, self.dataset, [10, 20], 20)
+        self.assertEqual((plan['lumis'], plan['jobs']), (0, 0))
+        self.assertEqual(plan['warnings'], ['the run range 10-20 does not overlap with the runs of the dataset',
+                                            '300 certified luminosity sections of the dataset are outside of the run range'])
+
+    def test_nothing_certified(self):
+        plan = plan_dataset('DoubleMuon', self.dataset, lumis({'5': [[1, 10]]}), [1, 3], 20)
+        self.assertEqual(plan['warnings'], ['no certified luminosity section inside the run range'])
+
+    def test_certified_outside(self):
+        plan = plan_dataset('DoubleMuon', self.dataset, lumis({'1': [[1, 10]], '3': [[1, 40]]}), [2, 3], 20)
+        self.assertEqual(plan['jobs'], 2)
+        self.assertEqual(plan['warnings'], ['10 certified luminosity sections of the dataset are outside of the run range'])
+
+    def test_unknown_dataset(self):
+        plan = plan_dataset('DoubleMuon', None, self.dataset, [1, 3], 20)
+        self.assertEqual(plan['jobs'], None)
+        self.assertEqual(plan['warnings'], ['luminosity sections of the dataset unknown'])
+
+    def test_print_plan(self):
+        plans = [plan_dataset('DoubleMuon', self.dataset, self.dataset, [1, 3], 20),
+                 plan_dataset('DoubleEG', None, self.dataset, [1, 3], 20)]
+        saved_stdout = sys.stdout
+        sys.stdout = StringIO()
+        try:
+            print_plan(plans)
+            output = sys.stdout.getvalue()
+        finally:
+            sys.stdout = saved_stdout
+
+        lines = output.splitlines()
+        self.assertEqual(lines[1].split(), ['DoubleMuon', '300', '300', '300', '20', '15'])
+        self.assertEqual(lines[2].split(), ['DoubleEG', '-', '-', '-', '20', '-'])
+        self.assertIn('15 jobs in total', output)
+        self.assertEqual(lines[-1], 'Warning: DoubleEG: luminosity sections of the dataset unknown')
+
+
+class TestLumiCaches(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.cache = os.path.join(self.directory, 'cache')
+        self.dumps = os.path.join(self.directory, 'dumps')
+        self.bin = os.path.join(self.directory, 'bin')
+        os.makedirs(self.bin)
+        self.path = os.environ['PATH']
+        os.environ['PATH'] = self.bin + os.pathsep + self.path
+        self.stdout = sys.stdout
+        sys.stdout = StringIO()
+
+    def tearDown(self):
+        sys.stdout = self.stdout
+        os.environ['PATH'] = self.path
+        shutil.rmtree(self.directory)
+
+    def write_json(self, filename, content):
+        path = os.path.join(self.directory, filename)
+        with open(path, 'w') as f:
+            json.dump(content, f)
+        return path
+
+    def fake_dasgoclient(self, output):
+        path = os.path.join(self.bin, 'dasgoclient')
+        with open(path, 'w') as f:
+            f.write('#! /bin/sh\ncat <<EOF\n%sEOF\n' % output)
+        os.chmod(path, 0755)
+
+    def test_local_json(self):
+        path = self.write_json('certified.json', {'1': [[1, 5]]})
+        self.assertEqual(load_lumi_json(path, self.cache).to_compact_list(), {'1': [[1, 5]]})
+        # Local files are always read again, and never cached
+        self.write_json('certified.json', {'1': [[1, 2]]})
+        self.assertEqual(load_lumi_json(path, self.cache).to_compact_list(), {'1': [[1, 2]]})
+        self.assertFalse(os.path.exists(self.cache))
+
+    def test_downloaded_json(self):
+        url = 'file://' + self.write_json('certified.json', {'1': [[1, 5]]})
+        self.assertEqual(load_lumi_json(url, self.cache).to_compact_list(), {'1': [[1, 5]]})
+        self.assertEqual(len(os.listdir(self.cache)), 1)
+
+        # Downloaded only once
+        os.remove(url[len('file://'):])
+        self.assertEqual(load_lumi_json(url, self.cache).to_compact_list(), {'1': [[1, 5]]})
+
+        other = 'file://' + self.write_json('other.json', {'2': [[1, 1]]})
+        self.assertEqual(load_lumi_json(other, self.cache).to_compact_list(), {'2': [[1, 1]]})
+        self.assertEqual(len(os.listdir(self.cache)), 2)
+
+    def test_dataset_dump(self):
+        self.fake_dasgoclient('1 [1,2,3,5]\n2 [7]\n\n')
+        self.assertEqual(get_dataset_lumis(DATASET, self.dumps).to_compact_list(), {'1': [[1, 3], [5, 5]], '2': [[7, 7]]})
+        self.assertTrue(os.path.isfile(job_planning.dump_filename(self.dumps, DATASET)))
+
+        # The dump is used from now on
+        os.remove(os.path.join(self.bin, 'dasgoclient'))
+        self.assertEqual(len(get_dataset_lumis(DATASET, self.dumps)), 5)
+
+    def test_das_failure(self):
+        os.environ['PATH'] = self.bin
+        self.assertIsNone(get_dataset_lumis(DATASET, self.dumps))
+        self.assertIn('DAS query failed', sys.stdout.getvalue())
+        self.assertFalse(os.path.exists(self.dumps))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,102 @@
+"""
+Tests of the choice of the number of units per job from the reports of previous tasks
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from cp3_llbb.GridIn.job_sizing import JobSizer, describe_pset
+
+DATASET = '/TT/RunIISpring15DR74-v1/MINIAODSIM'
+
+
+def make_report(name, pset, dataset=DATASET, splitting='FileBased', units_per_job=10, jobs=()):
+    """
+    A task report, with ``jobs`` a list of ``(events, files, events/s, overhead)``
+    """
+    task = {'name': name, 'dataset': dataset, 'splitting': splitting, 'units_per_job': units_per_job}
+    task.update(describe_pset(pset))
+    return {'task': task, 'jobs_detail': [{'events': e, 'files': f, 'events_per_s': r, 'overhead': o}
+                                          for e, f, r, o in jobs]}
+
+
+class TestJobSizer(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.pset = self.write('Analysis/test/analysis.py', 'process = 1\n')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write(self, path, content):
+        path = os.path.join(self.directory, path)
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path, 'w') as f:
+            f.write(content)
+        return path
+
+    def test_units_per_job(self):
+        # Median of 100 events/s, 60 s overhead, 1000 events per file: (3660 - 60) * 100 / 1000 = 360 files
+        sizer = JobSizer([make_report('TT', self.pset, jobs=[(5000, 5, 100., 60.), (2000, 2, 90., 50.),
+                                                             (3000, 3, 110., 70.)])])
+        units, justification = sizer.units_per_job(self.pset, DATASET, 'FileBased', 3660, 10)
+        self.assertEqual(units, 360)
+        self.assertIn('100.0 events/s', justification)
+        self.assertIn('task TT', justification)
+
+    def test_lumi_based(self):
+        # 20 luminosity sections per job: 200 events per luminosity section
+        sizer = JobSizer([make_report('Data', self.pset, splitting='LumiBased', units_per_job=20,
+                                      jobs=[(4000, 3, 50., 0.)])])
+        self.assertEqual(sizer.units_per_job(self.pset, DATASET, 'LumiBased', 3600, 10)[0], 900)
+
+    def test_at_least_one_unit(self):
+        sizer = JobSizer([make_report('TT', self.pset, jobs=[(1000, 1, 1., 600.)])])
+        self.assertEqual(sizer.units_per_job(self.pset, DATASET, 'FileBased', 300, 10)[0], 1)
+
+    def test_other_dataset(self):
+        # No task on the dataset: median of the events per unit of all the tasks with the same splitting
+        reports = [make_report('A', self.pset, dataset='/A/B/MINIAODSIM', jobs=[(1000, 1, 100., 0.)]),
+                   make_report('B', self.pset, dataset='/B/B/MINIAODSIM', jobs=[(3000, 1, 100., 0.)]),
+                   make_report('C', self.pset, dataset='/C/B/MINIAODSIM', splitting='LumiBased', jobs=[(10, 1, 100., 0.)])]
+        units, justification = JobSizer(reports).units_per_job(self.pset, DATASET, 'FileBased', 2000, 10)
+        self.assertEqual(units, 100)
+        self.assertIn('median of 2 FileBased tasks', justification)
+
+    def test_no_history(self):
+        self.assertEqual(JobSizer([]).units_per_job(self.pset, DATASET, 'FileBased', 3600, 7)[0], 7)
+
+    def test_same_name_other_analyzer(self):
+        # Another analyzer's configuration file with the same name is not the same configuration
+        other = self.write('Other/test/analysis.py', 'process = 2\n')
+        sizer = JobSizer([make_report('TT', other, jobs=[(1000, 1, 100., 0.)])])
+        self.assertIsNone(sizer.throughput(self.pset))
+        self.assertEqual(sizer.units_per_job(self.pset, DATASET, 'FileBased', 3600, 7)[0], 7)
+
+    def test_modified_configuration(self):
+        sizer = JobSizer([make_report('TT', self.pset, jobs=[(1000, 1, 100., 0.)])])
+        self.write('Analysis/test/analysis.py', 'process = 3\n')
+        self.assertIsNone(sizer.throughput(self.pset))
+
+    def test_moved_configuration(self):
+        # Same content: the throughput still applies
+        sizer = JobSizer([make_report('TT', self.pset, jobs=[(1000, 1, 100., 0.)])])
+        moved = self.write('Moved/analysis.py', 'process = 1\n')
+        self.assertEqual(sizer.throughput(moved)[0], 100.)
+
+    def test_path_without_hash(self):
+        report = make_report('TT', self.pset, jobs=[(1000, 1, 100., 0.)])
+        report['task']['pset_hash'] = None
+        self.assertEqual(JobSizer([report]).throughput(self.pset)[0], 100.)
+
+        # Old reports only hold the name of the file
+        report['task']['pset'] = 'analysis.py'
+        self.assertIsNone(JobSizer([report]).throughput(self.pset))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,65 @@
+"""
+Tests of the telemetry sidecar of the grid jobs: it must always be written, even when measurements fail
+"""
+
+import json
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+from StringIO import StringIO
+
+from cp3_llbb.GridIn.job_telemetry import TELEMETRY_VERSION, JobTelemetry
+
+
+class TestJobTelemetry(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.sidecar = os.path.join(self.directory, 'telemetry.json')
+        self.stdout = sys.stdout
+        sys.stdout = StringIO()
+
+    def tearDown(self):
+        sys.stdout = self.stdout
+        shutil.rmtree(self.directory)
+
+    def read(self):
+        with open(self.sidecar) as f:
+            return json.load(f)
+
+    def test_file_sizes(self):
+        local = os.path.join(self.directory, 'input.root')
+        with open(local, 'w') as f:
+            f.write('x' * 100)
+
+        telemetry = JobTelemetry(1)
+        # Not a valid xrootd URL: its size is unknown, but the telemetry is still collected
+        telemetry.set_files(['file:' + local, 'root://host/store/a.root', local + '.missing'],
+                            ['input', 'redirector', 'input'])
+        with telemetry.phase('framework'):
+            pass
+        telemetry.finalize('success', os.path.join(self.directory, 'missing.xml'))
+        telemetry.write(self.sidecar)
+
+        data = self.read()
+        self.assertEqual(data['version'], TELEMETRY_VERSION)
+        self.assertEqual(data['status'], 'success')
+        self.assertEqual([f['file_size'] for f in data['files']], [100, None, None])
+        self.assertEqual([p['name'] for p in data['phases']], ['framework'])
+
+    def test_unserializable(self):
+        telemetry = JobTelemetry(7)
+        telemetry.data['status'] = 'failed'
+        telemetry.data['broken'] = object()
+        telemetry.write(self.sidecar)
+
+        data = self.read()
+        self.assertEqual(data['job_number'], 7)
+        self.assertEqual(data['status'], 'failed')
+        self.assertIn('error', data)
+
+
+if __name__ == '__main__':
+    unittest.main()
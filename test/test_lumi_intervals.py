@@ -0,0 +1,166 @@
+"""
+Tests of the sets of luminosity sections, against the results of ``LumiList``, the CMSSW class they replace. When
+CMSSW is not available, the reference is a plain Python set of ``(run, lumi)``, which is what ``LumiList`` computes
+"""
+
+import random
+import unittest
+
+import numpy as np
+
+from cp3_llbb.GridIn.lumi_intervals import LumiIntervals, _normalize
+
+
+def expand(compact_list):
+    """
+    The set of ``(run, lumi)`` of a compact list
+    """
+    return set((int(run), lumi) for run, ranges in compact_list.items() for first, last in ranges
+               for lumi in range(first, last + 1))
+
+
+def compact(lumis):
+    """
+    The compact list of a set of ``(run, lumi)``, like ``LumiList.getCompactList``: runs as strings, with sorted and
+    merged ranges
+    """
+    compact_list = {}
+    for run, lumi in sorted(lumis):
+        ranges = compact_list.setdefault(str(run), [])
+        if len(ranges) > 0 and ranges[-1][1] == lumi - 1:
+            ranges[-1][1] = lumi
+        else:
+            ranges.append([lumi, lumi])
+    return compact_list
+
+
+def random_compact_list(rng, runs=4, ranges=6, max_lumi=40):
+    """
+    A compact list with unsorted, overlapping, adjacent and single luminosity section ranges
+    """
+    compact_list = {}
+    for run in rng.sample(range(1, 10), runs):
+        compact_list[str(run)] = []
+        for _ in range(rng.randint(0, ranges)):
+            first = rng.randint(1, max_lumi)
+            compact_list[str(run)].append([first, first + rng.choice([0, 0, 1, 3, 10])])
+    return compact_list
+
+
+class TestNormalize(unittest.TestCase):
+
+    def normalize(self, intervals):
+        starts, ends = _normalize(np.array([i[0] for i in intervals], dtype=np.int64),
+                                  np.array([i[1] for i in intervals], dtype=np.int64))
+        return zip(starts.tolist(), ends.tolist())
+
+    def test_empty(self):
+        self.assertEqual(self.normalize([]), [])
+
+    def test_adjacent(self):
+        self.assertEqual(self.normalize([(5, 7), (1, 4)]), [(1, 7)])
+
+    def test_overlapping(self):
+        self.assertEqual(self.normalize([(1, 5), (3, 8), (2, 3)]), [(1, 8)])
+
+    def test_contained(self):
+        # The end of a long interval must not be lost when a shorter one comes after it
+        self.assertEqual(self.normalize([(1, 10), (2, 3), (5, 6), (12, 12)]), [(1, 10), (12, 12)])
+
+    def test_single(self):
+        self.assertEqual(self.normalize([(4, 4), (6, 6), (5, 5), (9, 9)]), [(4, 6), (9, 9)])
+
+
+class TestLumiIntervals(unittest.TestCase):
+
+    def test_empty(self):
+        empty = LumiIntervals()
+        self.assertEqual(len(empty), 0)
+        self.assertEqual(empty.to_compact_list(), {})
+        self.assertEqual(LumiIntervals.from_compact_list({}), empty)
+        self.assertEqual(LumiIntervals.from_compact_list({'1': []}), empty)
+        self.assertEqual(LumiIntervals.union_all([]), empty)
+        some = LumiIntervals.from_compact_list({'1': [[1, 3]]})
+        self.assertEqual(some | empty, some)
+        self.assertEqual(some & empty, empty)
+        self.assertEqual(some - empty, some)
+        self.assertEqual(empty - some, empty)
+
+    def test_several_runs(self):
+        lumis = LumiIntervals.from_compact_list({'2': [[5, 5], [1, 3], [4, 4]], '1': [[7, 9], [8, 12]], '10': [[1, 1]]})
+        self.assertEqual(lumis.to_compact_list(), {'1': [[7, 12]], '2': [[1, 5]], '10': [[1, 1]]})
+        self.assertEqual(lumis.runs(), [1, 2, 10])
+        self.assertEqual(len(lumis), 12)
+        self.assertTrue((2, 5) in lumis)
+        self.assertFalse((2, 6) in lumis)
+        self.assertFalse((3, 1) in lumis)
+
+    def test_runs_not_merged(self):
+        # The last luminosity section of a run and the first of the next one are not adjacent
+        lumis = LumiIntervals.from_compact_list({'1': [[1, 5]], '2': [[1, 5]]})
+        self.assertEqual(lumis.to_compact_list(), {'1': [[1, 5]], '2': [[1, 5]]})
+
+    def test_round_trip(self):
+        rng = random.Random(1)
+        for _ in range(50):
+            compact_list = random_compact_list(rng)
+            lumis = LumiIntervals.from_compact_list(compact_list)
+            self.assertEqual(lumis.to_compact_list(), compact(expand(compact_list)))
+            self.assertEqual(LumiIntervals.from_compact_list(lumis.to_compact_list()), lumis)
+
+    def test_union_all(self):
+        rng = random.Random(2)
+        for _ in range(20):
+            compact_lists = [random_compact_list(rng) for _ in range(rng.randint(1, 5))]
+            expected = set()
+            for compact_list in compact_lists:
+                expected |= expand(compact_list)
+            union = LumiIntervals.union_all([LumiIntervals.from_compact_list(c) for c in compact_lists])
+            self.assertEqual(union.to_compact_list(), compact(expected))
+            self.assertEqual(len(union), len(expected))
+
+    def test_operators(self):
+        rng = random.Random(3)
+        for _ in range(50):
+            a, b = random_compact_list(rng), random_compact_list(rng)
+            lumis_a, lumis_b = LumiIntervals.from_compact_list(a), LumiIntervals.from_compact_list(b)
+            self.assertEqual((lumis_a | lumis_b).to_compact_list(), compact(expand(a) | expand(b)))
+            self.assertEqual((lumis_a & lumis_b).to_compact_list(), compact(expand(a) & expand(b)))
+            self.assertEqual((lumis_a - lumis_b).to_compact_list(), compact(expand(a) - expand(b)))
+
+    def test_run_range(self):
+        lumis = LumiIntervals.from_compact_list({'1': [[1, 5]], '2': [[3, 4]], '3': [[1, 1]], '4': [[2, 9]]})
+        self.assertEqual((lumis & LumiIntervals.run_range(2, 3)).to_compact_list(), {'2': [[3, 4]], '3': [[1, 1]]})
+        self.assertEqual((lumis - LumiIntervals.run_range(2, 3)).to_compact_list(), {'1': [[1, 5]], '4': [[2, 9]]})
+        self.assertEqual(len(lumis & LumiIntervals.run_range(5, 8)), 0)
+        self.assertTrue((3, 2 ** 20) in LumiIntervals.run_range(2, 3))
+        self.assertFalse((4, 1) in LumiIntervals.run_range(2, 3))
+
+
+class TestAgainstLumiList(unittest.TestCase):
+    """
+    Same results as the CMSSW class, when it is available
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        try:
+            from FWCore.PythonUtilities.LumiList import LumiList
+        except ImportError:
+            raise unittest.SkipTest('LumiList is not available')
+        cls.LumiList = LumiList
+
+    def test_operators(self):
+        rng = random.Random(4)
+        for _ in range(20):
+            a, b = random_compact_list(rng), random_compact_list(rng)
+            lumis_a, lumis_b = LumiIntervals.from_compact_list(a), LumiIntervals.from_compact_list(b)
+            list_a, list_b = self.LumiList(compactList=a), self.LumiList(compactList=b)
+            self.assertEqual(lumis_a.to_compact_list(), list_a.getCompactList())
+            self.assertEqual((lumis_a | lumis_b).to_compact_list(), (list_a | list_b).getCompactList())
+            self.assertEqual((lumis_a & lumis_b).to_compact_list(), (list_a & list_b).getCompactList())
+            self.assertEqual((lumis_a - lumis_b).to_compact_list(), (list_a - list_b).getCompactList())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,169 @@
+"""
+Tests of the bulk lookups of SAMADhi samples and datasets, on an in-memory SQLite database, and of the bulk updates of
+the files of the samples, on the SQLite database of ``benchmarkGridIn.py``
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from cp3_llbb.GridIn.common import load_file
+from cp3_llbb.GridIn.samadhi_utils import SampleLookup, copy_files, sum_samples, sync_files
+
+SCRIPTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'scripts')
+
+
+class TestSampleLookup(unittest.TestCase):
+
+    def setUp(self):
+        try:
+            from storm.locals import Store, create_database
+        except ImportError:
+            raise unittest.SkipTest('Storm is not available')
+
+        self.store = Store(create_database('sqlite:'))
+        self.store.execute('CREATE TABLE sample (sample_id INTEGER PRIMARY KEY, name TEXT, source_dataset_id INTEGER, '
+                           'code_version TEXT)')
+        self.store.execute('CREATE TABLE dataset (dataset_id INTEGER PRIMARY KEY, name TEXT, nevents INTEGER, '
+                           'process TEXT)')
+        for i, name in enumerate([u'TT_v1', u'TT_v2', u'DY_v1']):
+            self.store.execute('INSERT INTO sample VALUES (?, ?, ?, ?)', (i + 1, name, 10 + i, u'v1'))
+        self.store.execute('INSERT INTO dataset VALUES (?, ?, ?, ?)', (10, u'/TT/A/MINIAODSIM', 1000, u'TT'))
+        self.lookup = SampleLookup(self.store)
+
+    def tearDown(self):
+        self.store.close()
+
+    def test_samples_by_name(self):
+        samples = self.lookup.samples_by_name([u'TT_v1', u'DY_v1', u'missing'], ('sample_id',))
+        self.assertEqual(samples, {u'TT_v1': [(1,)], u'DY_v1': [(3,)], u'missing': []})
+        self.assertEqual(self.lookup.queries, 1)
+
+    def test_byte_strings(self):
+        # Names from the command line or built from str must match too
+        samples = self.lookup.samples_by_name(['TT_v2', 'missing'], ('sample_id',))
+        self.assertEqual(samples['TT_v2'], [(2,)])
+        self.assertEqual(samples['missing'], [])
+        self.assertEqual(self.lookup.datasets_by_name(['/TT/A/MINIAODSIM'], ('dataset_id',))['/TT/A/MINIAODSIM'],
+                         [(10,)])
+
+    def test_batches(self):
+        self.lookup.BATCH_SIZE = 2
+        samples = self.lookup.samples_by_id([1, 2, 3, 4], ('name',))
+        self.assertEqual(samples, {1: [(u'TT_v1',)], 2: [(u'TT_v2',)], 3: [(u'DY_v1',)], 4: []})
+        self.assertEqual(self.lookup.queries, 2)
+
+
+class BenchmarkStoreTestCase(unittest.TestCase):
+    """
+    Tests on the SQLite database with the SAMADhi tables built by ``benchmarkGridIn.py``
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        if 'CMSSW_BASE' not in os.environ:
+            raise unittest.SkipTest('CMSSW is not available')
+        try:
+            import storm
+        except ImportError:
+            raise unittest.SkipTest('Storm is not available')
+        cls.benchmark = load_file(os.path.join(SCRIPTS_DIR, 'benchmarkGridIn.py'))
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.store = self.benchmark.create_sqlite_store(self.directory, [self.benchmark.FILE_TABLE_SCHEMA,
+                self.benchmark.SAMPLE_TABLE_SCHEMA, self.benchmark.DATASET_TABLE_SCHEMA])
+
+    def tearDown(self):
+        self.store.close()
+        shutil.rmtree(self.directory)
+
+    def files(self, sample_id):
+        return self.store.execute('SELECT lfn, pfn, event_weight_sum, extras_event_weight_sum, nevents FROM file '
+                                  'WHERE sample_id = ? ORDER BY id', (sample_id,)).get_all()
+
+    def file_ids(self, sample_id):
+        return dict(self.store.execute('SELECT lfn, id FROM file WHERE sample_id = ?', (sample_id,)))
+
+
+class TestSyncFiles(BenchmarkStoreTestCase):
+
+    def test_insert(self):
+        files = self.benchmark.generate_files(5, 1)
+        self.assertEqual(sync_files(self.store, 1, files, batch_size=2), (5, 0, 0))
+        self.assertEqual(self.files(1), files)
+        self.assertEqual(self.files(2), [])
+
+    def test_unchanged(self):
+        files = self.benchmark.generate_files(5, 1)
+        sync_files(self.store, 1, files)
+        ids = self.file_ids(1)
+        self.assertEqual(sync_files(self.store, 1, files), (0, 0, 0))
+        self.assertEqual(self.file_ids(1), ids)
+
+    def test_diff(self):
+        sync_files(self.store, 1, self.benchmark.generate_files(6, 1))
+        ids = self.file_ids(1)
+
+        # Files 1 and 2 unchanged, files 3 and 4 modified, files 5 and 6 gone, files 7 and 8 new
+        files = self.benchmark.generate_files(8, 1)
+        files[2:4] = self.benchmark.generate_files(4, 1, version=1)[2:4]
+        del files[4:6]
+        self.assertEqual(sync_files(self.store, 1, files, batch_size=1), (2, 2, 2))
+        self.assertEqual(sorted(self.files(1)), sorted(files))
+
+        # Existing rows are kept, and only new files get new rows
+        new_ids = self.file_ids(1)
+        for lfn in [f[0] for f in files[:4]]:
+            self.assertEqual(new_ids[lfn], ids[lfn])
+        self.assertEqual(len(set(new_ids.values()) - set(ids.values())), 2)
+
+    def test_other_samples(self):
+        # Same LFNs in another sample: untouched
+        sync_files(self.store, 2, self.benchmark.generate_files(3, 1))
+        sync_files(self.store, 1, self.benchmark.generate_files(3, 1))
+        self.assertEqual(sync_files(self.store, 1, []), (0, 0, 3))
+        self.assertEqual(self.files(1), [])
+        self.assertEqual(self.files(2), self.benchmark.generate_files(3, 1))
+
+
+class TestMergeSamples(BenchmarkStoreTestCase):
+
+    def add_sample(self, sample_id, files, extras, lumi=None):
+        self.store.execute('INSERT INTO dataset (dataset_id, nevents) VALUES (?, ?)', (10 + sample_id, 1000 * sample_id))
+        self.store.execute('INSERT INTO sample (sample_id, source_dataset_id, nevents_processed, nevents, '
+                           'event_weight_sum, extras_event_weight_sum, processed_lumi) VALUES (?, ?, ?, ?, ?, ?, ?)',
+                           (sample_id, 10 + sample_id, 100 * sample_id, 50 * sample_id, 0.1 * sample_id, extras, lumi))
+        sync_files(self.store, sample_id, files)
+
+    def test_copy_files(self):
+        self.add_sample(1, self.benchmark.generate_files(3, 1), None)
+        self.add_sample(2, self.benchmark.generate_files(2, 2), None)
+        # Previous content of the merged sample
+        sync_files(self.store, 3, self.benchmark.generate_files(4, 3))
+
+        self.assertEqual(copy_files(self.store, [2, 1], 3), 5)
+        self.assertEqual(self.files(3), self.benchmark.generate_files(2, 2) + self.benchmark.generate_files(3, 1))
+        # Sources untouched
+        self.assertEqual(self.files(1), self.benchmark.generate_files(3, 1))
+
+    def test_sum_samples(self):
+        self.add_sample(1, [], u'{"scale_up": 1.5, "scale_down": 0.5}', u'{"1": [[1, 10]]}')
+        self.add_sample(2, [], u'{"scale_up": 2.5}')
+        self.add_sample(3, [], None, u'{"2": [[1, 5]]}')
+
+        sums = sum_samples(self.store, [1, 2, 3])
+        self.assertEqual(sums['nevents_processed'], 600)
+        self.assertEqual(sums['nevents'], 300)
+        self.assertEqual(sums['dataset_nevents'], 6000)
+        self.assertEqual(sums['event_weight_sum'], 0.1 + 0.2 + 0.1 * 3)
+        self.assertEqual(sums['extras_event_weight_sum'], {'scale_up': 4., 'scale_down': 0.5})
+        self.assertEqual(sums['processed_lumi'], [{'1': [[1, 10]]}, {'2': [[1, 5]]}])
+
+        # In the order of the samples
+        self.assertEqual(sum_samples(self.store, [3, 1])['processed_lumi'], [{'2': [[1, 5]]}, {'1': [[1, 10]]}])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,116 @@
+"""
+Tests of the LFN to PFN conversion with the trivial file catalog, against sample ``storage.xml`` files
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from cp3_llbb.GridIn import trivial_file_catalog
+from cp3_llbb.GridIn.trivial_file_catalog import TrivialFileCatalog
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'storage')
+
+
+def load_catalog(name):
+    return TrivialFileCatalog.from_file(os.path.join(DATA_DIR, name))
+
+
+class TestDirectRules(unittest.TestCase):
+    def setUp(self):
+        self.catalog = load_catalog('direct.xml')
+
+    def test_direct(self):
+        self.assertEqual(self.catalog.lfn_to_pfn('/store/data/x.root', 'direct'), '/storage/data/cms/store/data/x.root')
+
+    def test_leading_slashes(self):
+        self.assertEqual(self.catalog.lfn_to_pfn('//store/data/x.root', 'direct'), '/storage/data/cms/store/data/x.root')
+
+    def test_rules_tried_in_order(self):
+        self.assertEqual(self.catalog.lfn_to_pfn('/store/user/a/x.root', 'xrootd'),
+                         'root://ingrid-se03.cism.ucl.ac.be//store/user/a/x.root')
+        self.assertEqual(self.catalog.lfn_to_pfn('/store/mc/x.root', 'xrootd'), 'root://cms-xrd-global.cern.ch//store/mc/x.root')
+
+    def test_no_match(self):
+        self.assertIsNone(self.catalog.lfn_to_pfn('/other/x.root', 'direct'))
+
+    def test_unknown_protocol(self):
+        self.assertIsNone(self.catalog.lfn_to_pfn('/store/data/x.root', 'srmv2'))
+
+
+class TestChainedRules(unittest.TestCase):
+    def setUp(self):
+        self.catalog = load_catalog('chained.xml')
+
+    def test_path_match_applies_to_chained_result(self):
+        self.assertEqual(self.catalog.lfn_to_pfn('/store/data/x.root', 'srmv2'),
+                         'srm://srm.example.org:8443/srm/managerv2?SFN=/pnfs/example.org/data/cms/store/data/x.root')
+
+    def test_double_chain(self):
+        self.assertEqual(self.catalog.lfn_to_pfn('/store/data/x.root', 'dcap'),
+                         'dcap://dcap.example.org/pnfs/example.org/data/cms/store/data/x.root')
+
+    def test_next_rule_after_mismatch(self):
+        # The first xrootd rule does not match the result of its chain: the second one is used
+        self.assertEqual(self.catalog.lfn_to_pfn('/store/data/x.root', 'xrootd'),
+                         'root://xrootd.example.org//data/cms/store/data/x.root')
+
+    def test_chain_without_match(self):
+        self.assertIsNone(self.catalog.lfn_to_pfn('/other/x.root', 'srmv2'))
+
+
+class TestDestinationMatch(unittest.TestCase):
+    def setUp(self):
+        self.catalog = load_catalog('destination.xml')
+
+    def test_matching_destination(self):
+        self.assertEqual(self.catalog.lfn_to_pfn('/store/data/x.root', 'srmv2', 'T2_BE_UCL'),
+                         'srm://ingrid-se02.cism.ucl.ac.be:8444/srm/managerv2?SFN=/storage/data/cms/store/data/x.root')
+
+    def test_other_destination(self):
+        self.assertEqual(self.catalog.lfn_to_pfn('/store/data/x.root', 'srmv2', 'T2_XX_Other'),
+                         'srm://srm.example.org:8443/srm/managerv2?SFN=/store/data/x.root')
+
+    def test_default_destination(self):
+        self.assertEqual(self.catalog.lfn_to_pfn('/store/data/x.root', 'srmv2'),
+                         'srm://srm.example.org:8443/srm/managerv2?SFN=/store/data/x.root')
+
+
+class TestSiteCatalog(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        os.makedirs(os.path.join(self.directory, 'JobConfig'))
+        with open(os.path.join(self.directory, 'JobConfig', 'site-local-config.xml'), 'w') as f:
+            f.write('<site-local-config><site name="T2_BE_UCL"><event-data>'
+                    '<catalog url="trivialcatalog_file:%s?protocol=direct"/>'
+                    '</event-data></site></site-local-config>' % os.path.join(DATA_DIR, 'direct.xml'))
+
+        self.environ = dict(os.environ)
+        os.environ['SITECONFIG_PATH'] = self.directory
+        trivial_file_catalog._site_catalog = None
+
+    def tearDown(self):
+        os.environ.clear()
+        os.environ.update(self.environ)
+        trivial_file_catalog._site_catalog = None
+        shutil.rmtree(self.directory)
+
+    def test_site_catalog(self):
+        catalog, protocol = trivial_file_catalog.get_site_catalog()
+        self.assertEqual(protocol, 'direct')
+        self.assertEqual(trivial_file_catalog.lfn_to_pfn('/store/data/x.root'), '/storage/data/cms/store/data/x.root')
+
+    def test_other_protocol(self):
+        self.assertEqual(trivial_file_catalog.lfn_to_pfn('/store/user/a/x.root', 'xrootd'),
+                         'root://ingrid-se03.cism.ucl.ac.be//store/user/a/x.root')
+
+    def test_no_site_config(self):
+        os.environ['SITECONFIG_PATH'] = os.path.join(self.directory, 'missing')
+        os.environ.pop('CMS_PATH', None)
+        self.assertEqual(trivial_file_catalog.get_site_catalog(), (None, None))
+        self.assertIsNone(trivial_file_catalog.lfn_to_pfn('/store/data/x.root'))
+
+
+if __name__ == '__main__':
+    unittest.main()